@@ -0,0 +1,89 @@
+"""Outils communs aux benchmarks de l'Éditeur de Paquets WPKG"""
+
+import importlib.util
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+EDITOR_PATH = ROOT / "wpkg-edit-1.2.py"
+
+# wpkg_core.py, importé par l'éditeur, est à la racine du dépôt
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+def load_editor():
+    """Importe le script de l'éditeur (son nom de fichier n'est pas un nom de module valide)"""
+    if "wpkg_edit" in sys.modules:
+        return sys.modules["wpkg_edit"]
+    spec = importlib.util.spec_from_file_location("wpkg_edit", EDITOR_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["wpkg_edit"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_core():
+    """Importe le cœur sans interface graphique (modèle, analyse, écriture, contrôles)"""
+    import wpkg_core
+    return wpkg_core
+
+
+def make_package(index):
+    """Génère un paquet WPKG synthétique d'une vingtaine de lignes"""
+    return f'''<!--
+Paquet de test numéro {index}
+-->
+
+<package id = "application-{index}"
+   name     = "Application {index}"
+   revision = "1.0.{index}"
+   date     = "01/01/2025"
+   reboot   = "false"
+   category = "Applications"
+   priority = "20" >
+
+  <variable name="APPNAME" value="Application {index}" />
+  <variable name="APPVERS" value="1.0.{index}" />
+
+  <check type="file" condition="versionequalto" path="%SYSTEMDRIVE%\\Logiciels\\App{index}\\App.exe" value="1.0.{index}" />
+
+  <install cmd='7z.bat "%SYSTEMDRIVE%\\Logiciels\\App{index}" "%SOFTWARE%\\App\\App-{index}.7z"' timeout="600" />
+  <install cmd='"%SOFTWARE%\\App\\install-app.bat" "%APPNAME%" "%APPVERS%"' timeout="60" ><exit code="any" /></install>
+
+  <upgrade include="install" />
+
+  <remove cmd='"%ComSpec%" /C rmdir /S /Q "%SYSTEMDRIVE%\\Logiciels\\App{index}"' timeout="60" ><exit code="any" /></remove>
+</package>
+'''
+
+
+def make_packages_xml(line_count):
+    """Génère un fichier packages.xml d'au moins `line_count` lignes"""
+    parts = ['<?xml version="1.0" encoding="iso-8859-1"?>\n\n<packages>\n\n']
+    lines = 4
+    index = 0
+    while lines < line_count:
+        package = make_package(index)
+        parts.append(package)
+        lines += package.count("\n")
+        index += 1
+    parts.append("\n</packages>\n")
+    return "".join(parts)
+
+
+def measure(func, *args, repeat=20):
+    """Exécute `func` plusieurs fois et retourne les durées en millisecondes"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples):
+    """Affiche la médiane et le maximum d'une série de mesures"""
+    print(f"{label:<45} médiane {statistics.median(samples):9.3f} ms   max {max(samples):9.3f} ms")
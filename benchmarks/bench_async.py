@@ -0,0 +1,50 @@
+"""Réactivité de la boucle Tk pendant la coloration d'un gros document
+
+Colle un document de 100k lignes puis mesure, pendant que la tokenisation
+tourne sur le thread de travail, l'intervalle maximal entre deux tours de
+boucle Tk (temps pendant lequel une frappe attendrait). Nécessite un affichage.
+
+    python benchmarks/bench_async.py
+"""
+
+import time
+import tkinter as tk
+
+from _common import load_editor, make_packages_xml, report
+
+SIZE = 100_000
+
+
+def main():
+    editor = load_editor()
+    root = tk.Tk()
+    root.withdraw()
+    widget = editor.XmlTextWithLineNumbers(root)
+    content = make_packages_xml(SIZE)
+    
+    for label, threshold in (("synchrone", float("inf")), ("thread de travail", editor.ASYNC_HIGHLIGHT_THRESHOLD)):
+        widget.async_threshold = threshold
+        widget.delete("1.0", "end")
+        
+        start = time.perf_counter()
+        widget.insert("end", content)
+        widget.highlight_syntax()
+        blocked = (time.perf_counter() - start) * 1000
+        
+        gaps = []
+        last = time.perf_counter()
+        while widget._pending_jobs or widget._applying is not None:
+            root.update()
+            now = time.perf_counter()
+            gaps.append((now - last) * 1000)
+            last = now
+        
+        report(f"{label} - collage + highlight_syntax", [blocked])
+        if gaps:
+            report(f"{label} - intervalle entre tours de boucle", gaps)
+    
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
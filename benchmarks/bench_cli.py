@@ -0,0 +1,73 @@
+"""Mode ligne de commande : première exécution contre réexécution servie par le cache
+
+Génère 2 000 fichiers de paquets (un paquet chacun) dans un dossier temporaire, puis mesure
+run_cli pour validate et lint :
+- première exécution (lecture, analyse et contrôles de tous les fichiers, pool de processus) ;
+- réexécution sans modification (date et taille inchangées : aucun fichier relu) ;
+- réexécution après avoir touché 20 fichiers (relus, même empreinte : résultat repris) ;
+- réexécution après modification de 20 fichiers.
+
+Vérifie (assert) que les fichiers seulement touchés sont servis par le cache.
+
+    python benchmarks/bench_cli.py
+"""
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+
+from _common import load_editor, make_package
+
+FILE_COUNT = 2_000
+TOUCHED = 20
+
+
+def run(editor, *argv):
+    out = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(out):
+        code = editor.run_cli(list(argv))
+    elapsed = (time.perf_counter() - start) * 1000
+    summary = json.loads(out.getvalue().splitlines()[-1])["summary"]
+    return code, elapsed, summary
+
+
+def main():
+    editor = load_editor()
+
+    with tempfile.TemporaryDirectory() as folder:
+        packages = os.path.join(folder, "packages")
+        os.makedirs(packages)
+        for index in range(FILE_COUNT):
+            with open(os.path.join(packages, f"paquet-{index}.xml"), "w", encoding="iso-8859-1") as file:
+                file.write('<?xml version="1.0" encoding="iso-8859-1"?>\n\n<packages>\n\n'
+                           + make_package(index) + "\n</packages>\n")
+        cache = os.path.join(folder, "cache.json")
+        print(f"{FILE_COUNT} fichiers, {os.cpu_count()} processeur(s)")
+
+        for command in ("validate", "lint"):
+            print(f"--- {command}")
+            for label in ("première exécution", "réexécution sans modification"):
+                code, elapsed, summary = run(editor, command, packages, "--cache", cache)
+                print(f"{label:<45} {elapsed:9.1f} ms   {summary.get('cached', 0)} en cache, code {code}")
+
+            for index in range(TOUCHED):
+                os.utime(os.path.join(packages, f"paquet-{index}.xml"))
+            code, elapsed, summary = run(editor, command, packages, "--cache", cache)
+            print(f"{f'après avoir touché {TOUCHED} fichiers':<45} {elapsed:9.1f} ms   "
+                  f"{summary.get('cached', 0)} en cache, code {code}")
+            assert summary.get("cached") == FILE_COUNT
+
+            for index in range(TOUCHED):
+                with open(os.path.join(packages, f"paquet-{index}.xml"), "a", encoding="iso-8859-1") as file:
+                    file.write("\n")
+            code, elapsed, summary = run(editor, command, packages, "--cache", cache)
+            print(f"{f'après modification de {TOUCHED} fichiers':<45} {elapsed:9.1f} ms   "
+                  f"{summary.get('cached', 0)} en cache, code {code}")
+
+
+if __name__ == "__main__":
+    main()
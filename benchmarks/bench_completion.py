@@ -0,0 +1,46 @@
+"""Complétion : recherche par préfixe dans un CompletionTrie de 100k valeurs distinctes
+
+Mesure la construction du trie puis la recherche pour des préfixes courts (nombreux
+candidats) et longs, comparée au filtrage linéaire par startswith de l'ancienne complétion.
+
+    python benchmarks/bench_completion.py
+"""
+
+import random
+
+from _common import load_editor, measure, report
+
+VALUE_COUNT = 100_000
+PREFIXES = ("", "%", "%SOFTWARE%\\", "%SOFTWARE%\\apps\\abc", "msiexec /i cab")
+ROOTS = ("%PROGRAMFILES%\\", "%SOFTWARE%\\apps\\", "C:\\Windows\\", "msiexec /i ")
+
+
+def make_counts():
+    rng = random.Random(1)
+    counts = {}
+    for index in range(VALUE_COUNT):
+        name = "".join(rng.choice("abcdefghij") for _ in range(6))
+        counts[f"{rng.choice(ROOTS)}{name}\\setup-{index}.exe"] = rng.randint(1, 50)
+    return counts
+
+
+def linear_complete(counts, prefix):
+    matches = [value for value in counts if value.startswith(prefix)]
+    return sorted(matches, key=lambda value: (-counts[value], value))[:15]
+
+
+def main():
+    editor = load_editor()
+    counts = make_counts()
+
+    report(f"construction ({VALUE_COUNT} valeurs)", measure(editor.CompletionTrie, counts, repeat=3))
+    trie = editor.CompletionTrie(counts)
+
+    for prefix in PREFIXES:
+        assert trie.complete(prefix) == linear_complete(counts, prefix)
+        report(f"trie {prefix!r}", measure(trie.complete, prefix, repeat=1000))
+        report(f"linéaire {prefix!r}", measure(linear_complete, counts, prefix, repeat=3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Indicateur de modification : coût d'une vérification contre réécriture par la sauvegarde automatique
+
+Jusqu'ici tout fichier ouvert était considéré comme modifié : la sauvegarde automatique le
+réécrivait à chaque intervalle. Pour des packages.xml synthétiques de 10 000 et 100 000
+lignes, mesure :
+- la réécriture évitée (write_package_file : encodage, fichier temporaire, fsync, renommage) ;
+- la vérification de is_modified (comparaison des textes) quand la longueur du texte a changé
+  (cas de la saisie), qui s'arrête immédiatement ;
+- la même à longueur égale, qui compare les textes jusqu'à la première différence, ou en
+  entier s'ils sont identiques ; blake2b, utilisé pour les empreintes de fichiers, est donné
+  pour comparaison.
+
+    python benchmarks/bench_dirty.py
+"""
+
+import os
+import tempfile
+
+from _common import load_editor, make_packages_xml, measure, report
+
+SIZES = (10_000, 100_000)
+
+
+def main():
+    editor = load_editor()
+
+    with tempfile.TemporaryDirectory() as folder:
+        for size in SIZES:
+            content = make_packages_xml(size)
+            typed = content.replace("Application 7", "Application 77", 1)
+            replaced = content[:-20] + content[-20:].replace("packages", "packageS")
+            identical = content[:1] + content[1:]
+            print(f"--- {size} lignes ({len(content) / 1e6:.1f} Mo)")
+
+            path = os.path.join(folder, f"packages-{size}.xml")
+            report("réécriture par la sauvegarde automatique",
+                   measure(editor.write_package_file, path, content, repeat=5))
+            report("longueur modifiée", measure(lambda: typed != content, repeat=100))
+            report("même longueur : différence en fin de texte", measure(lambda: replaced != content, repeat=20))
+            report("même longueur : texte identique", measure(lambda: identical != content, repeat=20))
+            report("même longueur : blake2b (pour comparaison)",
+                   measure(lambda: editor.content_digest(replaced.encode("utf-8")), repeat=20))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Chargement des fichiers Latin-1 : texte décodé puis relu en UTF-8 contre octets bruts
+
+Génère des packages.xml déclarés et écrits en iso-8859-1 (noms accentués), de 10k et
+100k lignes, vérifie le chargement et l'enregistrement, puis mesure :
+- l'ancienne analyse d'un texte décodé (parse_wpkg : ré-encodage UTF-8 avant lxml) ;
+- parse_wpkg_bytes, où lxml décode lui-même selon la déclaration XML ;
+- read_package_document, qui fournit en plus le texte affiché dans la vue XML.
+
+Vérifications (assert) : ouverture en UTF-8 impossible comme avant, noms accentués
+intacts dans le modèle, réenregistrement identique à l'octet près, fichier déclaré
+iso-8859-1 mais écrit en UTF-8 (anciens enregistrements) reconnu et corrigé.
+
+    python benchmarks/bench_encoding.py
+"""
+
+import os
+
+from _common import load_core, make_packages_xml, measure, report
+
+SIZES = (10_000, 100_000)
+
+
+def latin1_document(line_count):
+    return make_packages_xml(line_count).replace('name     = "Application', 'name     = "Éditeur d\'été')
+
+
+def check_round_trip(core):
+    content = latin1_document(200)
+    data = content.replace("\n", os.linesep).encode("iso-8859-1")
+
+    try:
+        data.decode("utf-8")
+    except UnicodeDecodeError:
+        pass
+    else:
+        raise AssertionError("le fichier Latin-1 ne devrait pas être de l'UTF-8 valide")
+
+    text, encoding, result = core.read_package_document(data)
+    assert encoding == "iso8859-1" and text == content
+    assert result.packages[0].name == "Éditeur d'été 0"
+    assert result.comments[0].text == "Paquet de test numéro 0"
+    assert core.encode_package(text) == data
+
+    # Caractère absent de Latin-1 : écrit en référence de caractère
+    assert core.encode_package(text.replace("été 0", "€ 0", 1)).count(b"&#8364;") == 1
+
+    # Fichier enregistré en UTF-8 par l'ancienne version malgré sa déclaration
+    legacy = content.encode("utf-8")
+    text, encoding, result = core.read_package_document(legacy)
+    assert encoding == "utf-8" and result.packages[0].name == "Éditeur d'été 0"
+    assert core.encode_package(text) == data
+    print("vérifications Latin-1 : ok")
+
+
+def main():
+    core = load_core()
+    check_round_trip(core)
+
+    for size in SIZES:
+        data = latin1_document(size).encode("iso-8859-1")
+        print(f"--- {size} lignes ({len(data) / 1e6:.1f} Mo)")
+        report("décodage + parse_wpkg (texte)",
+               measure(lambda: core.parse_wpkg(data.decode("iso-8859-1")), repeat=5))
+        report("parse_wpkg_bytes (octets)", measure(core.parse_wpkg_bytes, data, repeat=5))
+        report("read_package_document", measure(core.read_package_document, data, repeat=5))
+
+
+if __name__ == "__main__":
+    main()
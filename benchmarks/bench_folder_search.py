@@ -0,0 +1,80 @@
+"""Recherche dans un dossier de paquets : lecture séquentielle contre pool de processus
+
+Génère 500 paquets synthétiques dans un dossier temporaire puis mesure :
+- une recherche séquentielle (open().read() + re.finditer) ;
+- la recherche par search_files (mmap, lots de FOLDER_SEARCH_BATCH fichiers) dans un
+  ProcessPoolExecutor, comme le dialogue ;
+- une seconde recherche servie par FolderSearchCache (fichiers inchangés) ;
+- la même après avoir touché 50 fichiers (empreinte recalculée, aucune nouvelle analyse).
+
+    python benchmarks/bench_folder_search.py
+"""
+
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from _common import load_editor, make_package
+
+FILE_COUNT = 500
+TOUCHED = 50
+
+
+def sequential_search(paths, source, flags):
+    pattern = re.compile(source, flags)
+    results = []
+    for path in paths:
+        with open(path, encoding="utf-8") as file:
+            content = file.read()
+        results.append((path, [match.start() for match in pattern.finditer(content)]))
+    return results
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<45} {(time.perf_counter() - start) * 1000:9.1f} ms")
+    return result
+
+
+def main():
+    editor = load_editor()
+    source, flags = editor.search_pattern("APPVERS", case_sensitive=True)
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = []
+        for index in range(FILE_COUNT):
+            path = os.path.join(folder, f"application-{index}.xml")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write("\n".join(make_package(index * 10 + offset) for offset in range(10)))
+            paths.append(path)
+
+        timed("séquentiel", sequential_search, paths, source, flags)
+
+        with ProcessPoolExecutor() as pool:
+            # Démarrage des processus hors mesure
+            list(pool.map(abs, range(os.cpu_count() or 1)))
+            batch = editor.FOLDER_SEARCH_BATCH
+            batches = [paths[i:i + batch] for i in range(0, len(paths), batch)]
+            results = timed("pool de processus + mmap", lambda: [
+                result
+                for results in pool.map(editor.search_files, batches, [source] * len(batches), [flags] * len(batches))
+                for result in results
+            ])
+
+        cache = editor.FolderSearchCache()
+        for path, digest, hits in results:
+            cache.store(path, digest, (source, flags), hits)
+        timed("seconde recherche (cache)", lambda: [cache.lookup(path, os.stat(path), (source, flags)) for path in paths])
+
+        for path in paths[:TOUCHED]:
+            os.utime(path)
+        hits = timed(f"après avoir touché {TOUCHED} fichiers (cache)",
+                     lambda: [cache.lookup(path, os.stat(path), (source, flags)) for path in paths])
+        assert all(hit is not None for hit in hits)
+
+
+if __name__ == "__main__":
+    main()
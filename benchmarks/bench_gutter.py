@@ -0,0 +1,52 @@
+"""Coût de redessin de la gouttière des numéros de ligne pendant un défilement rapide
+
+Fait défiler un document de 50k lignes ligne par ligne puis par sauts, et
+affiche le nombre de redessins (au plus un par image) et leur durée, relevés
+dans XmlTextWithLineNumbers.gutter_stats. Nécessite un affichage.
+
+    python benchmarks/bench_gutter.py
+"""
+
+import time
+import tkinter as tk
+
+from _common import load_editor, make_packages_xml
+
+SIZE = 50_000
+STEPS = 500
+
+
+def main():
+    editor = load_editor()
+    root = tk.Tk()
+    root.geometry("1000x800")
+    widget = editor.XmlTextWithLineNumbers(root)
+    widget.pack(fill=tk.BOTH, expand=True)
+    widget.insert("end", make_packages_xml(SIZE))
+    widget.highlight_syntax()
+    root.update()
+    
+    for label, scroll in (
+        ("défilement ligne à ligne", lambda: widget.text.yview_scroll(1, "units")),
+        ("défilement par pages", lambda: widget.text.yview_scroll(1, "pages")),
+    ):
+        widget.text.yview_moveto(0)
+        root.update()
+        widget.gutter_stats.update(redraws=0, total_ms=0.0, max_ms=0.0)
+        
+        start = time.perf_counter()
+        for _ in range(STEPS):
+            scroll()
+            root.update()
+        elapsed = (time.perf_counter() - start) * 1000
+        
+        stats = widget.gutter_stats
+        average = stats["total_ms"] / max(1, stats["redraws"])
+        print(f"{label:<26} {STEPS} pas en {elapsed:8.1f} ms, {stats['redraws']} redessins, "
+              f"moyenne {average:.3f} ms, max {stats['max_ms']:.3f} ms")
+    
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Latence de coloration par frappe selon la taille du document
+
+Compare la recoloration complète (ancien comportement de on_key_release)
+avec la recoloration incrémentale des lignes modifiées. Nécessite un affichage.
+
+    python benchmarks/bench_highlight.py
+"""
+
+import tkinter as tk
+
+from _common import load_editor, make_packages_xml, measure, report
+
+SIZES = (1_000, 10_000, 50_000)
+
+
+def main():
+    editor = load_editor()
+    root = tk.Tk()
+    root.withdraw()
+    widget = editor.XmlTextWithLineNumbers(root)
+    # Mesurer le coût réel de la coloration, sans la déléguer au thread de travail
+    widget.async_threshold = float("inf")
+    
+    for size in SIZES:
+        widget.delete("1.0", "end")
+        widget.insert("end", make_packages_xml(size))
+        widget.highlight_syntax()
+        middle = f"{size // 2}.10"
+        
+        def keystroke_incremental():
+            widget.insert(middle, "x")
+            widget.highlight_dirty()
+        
+        def keystroke_full():
+            widget.insert(middle, "x")
+            widget.highlight_syntax()
+        
+        report(f"{size:>6} lignes - incrémental", measure(keystroke_incremental, repeat=50))
+        report(f"{size:>6} lignes - complet", measure(keystroke_full, repeat=3))
+    
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
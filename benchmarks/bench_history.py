@@ -0,0 +1,103 @@
+"""Historique d'annulation : états complets contre opérations réversibles
+
+Sur un packages.xml synthétique de 100 000 lignes, simule 50 modifications du nom d'un
+paquet (un attribut réécrit dans le texte) et mesure la mémoire de l'historique :
+- ancien add_to_history : copie (asdict) du paquet affiché et copie de tout le texte XML par état ;
+- EditHistory : FieldSet + TextSplice par action.
+Mesure aussi le coût d'une annulation sur le modèle et le texte de référence (la vue Tk
+n'est pas mesurée : elle ne reçoit que le remplacement de l'attribut).
+
+    python benchmarks/bench_history.py
+"""
+
+import copy
+import gc
+import tracemalloc
+
+from _common import load_editor, make_packages_xml, measure, report
+
+LINE_COUNT = 100_000
+EDIT_COUNT = 50
+
+
+def edits(editor, content):
+    """Textes et paquets successifs : le nom du paquet du milieu change à chaque action"""
+    result = editor.parse_wpkg(content)
+    packages = result.packages
+    index = len(packages) // 2
+    current = packages[index].name
+    for step in range(EDIT_COUNT):
+        new_name = f"Application renommée {step}"
+        content = content.replace(f'name     = "{current}"', f'name     = "{new_name}"', 1)
+        old = copy.deepcopy(packages[index])
+        packages[index].name = current = new_name
+        yield index, old, packages[index], content
+
+
+def snapshot_history(editor, content):
+    history = []
+    for index, old, package, text in edits(editor, content):
+        history.append({
+            "package": {name: copy.deepcopy(getattr(package, name)) for name in package.__slots__},
+            "package_index": index,
+            # get(1.0, END) rendait une nouvelle chaîne à chaque état
+            "xml": (text + "\n")[:-1] + "\n",
+        })
+    return history
+
+
+def operation_history(editor, content):
+    history = editor.EditHistory(EDIT_COUNT)
+    baseline = content
+    for index, old, package, text in edits(editor, content):
+        operations = editor.package_operations(index, old, package)
+        splice = editor.text_splice(baseline, text)
+        baseline = splice.apply_text(baseline, undo=False)
+        history.record(operations + [splice])
+    return history
+
+
+def retained(func, *args):
+    gc.collect()
+    tracemalloc.start()
+    result = func(*args)
+    gc.collect()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, current / 1e6
+
+
+def main():
+    editor = load_editor()
+    content = make_packages_xml(LINE_COUNT)
+    print(f"{LINE_COUNT} lignes ({len(content) / 1e6:.1f} Mo), {EDIT_COUNT} actions")
+
+    # Mémoire de référence : analyse et textes intermédiaires, communs aux deux méthodes
+    _, baseline = retained(lambda: list(edits(editor, content))[-1][0])
+    _, snapshots = retained(snapshot_history, editor, content)
+    history, operations = retained(operation_history, editor, content)
+    print(f"{'états complets':<45} {max(snapshots - baseline, 0):9.1f} Mo")
+    print(f"{'opérations réversibles':<45} {max(operations - baseline, 0):9.3f} Mo")
+
+    packages = editor.parse_wpkg(content).packages
+    text = content
+
+    def undo_redo():
+        nonlocal text
+        operations = history.undo()
+        for operation in reversed(operations):
+            if isinstance(operation, editor.TextSplice):
+                text = operation.apply_text(text, undo=True)
+            else:
+                operation.apply(packages, None, undo=True)
+        for operation in history.redo():
+            if isinstance(operation, editor.TextSplice):
+                text = operation.apply_text(text, undo=False)
+            else:
+                operation.apply(packages, None, undo=False)
+
+    report("annuler + refaire (hors vue Tk)", measure(undo_redo, repeat=50))
+
+
+if __name__ == "__main__":
+    main()
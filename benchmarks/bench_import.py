@@ -0,0 +1,70 @@
+"""Temps d'import : cœur sans interface graphique (wpkg_core) contre éditeur complet
+
+Mesure, dans des interpréteurs neufs (le cache des modules ne sert pas d'une mesure à
+l'autre), la durée de l'import de wpkg_core et celle du chargement de l'éditeur complet,
+chronométrées dans l'interpréteur lui-même : son démarrage n'est pas compté.
+
+Vérifie (assert) qu'importer wpkg_core ne charge aucun module lourd (tkinter, lxml, pygments,
+asyncio, pool de processus...) et que la plus courte de ses mesures reste sous
+IMPORT_BUDGET_MS : code de retour non nul sinon, pour servir de garde-fou. L'essentiel de ce
+temps va au module re (bibliothèque standard) ; dataclasses, typing, json et argparse ne sont
+pas chargés par wpkg_core (modèle en classes à __slots__, imports différés dans run_cli).
+
+    python benchmarks/bench_import.py
+"""
+
+import statistics
+import subprocess
+import sys
+
+from _common import EDITOR_PATH, ROOT
+
+REPEAT = 15
+IMPORT_BUDGET_MS = 15
+
+# Modules que le cœur ne doit pas charger à l'import
+HEAVY_MODULES = ("tkinter", "lxml", "pygments", "asyncio", "concurrent.futures", "difflib",
+                 "tempfile", "xml.etree.ElementTree", "pickle", "hashlib",
+                 "dataclasses", "typing", "json", "argparse")
+
+CORE = "import wpkg_core"
+EDITOR = ("import importlib.util\n"
+          f"spec = importlib.util.spec_from_file_location('wpkg_edit', {str(EDITOR_PATH)!r})\n"
+          "spec.loader.exec_module(importlib.util.module_from_spec(spec))")
+
+
+def timed(code):
+    """Durées (ms) de `code`, chacune chronométrée dans un interpréteur neuf"""
+    script = f"import time\nstart = time.perf_counter()\n{code}\nprint((time.perf_counter() - start) * 1000)"
+    return [float(subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True,
+                                 capture_output=True, text=True).stdout)
+            for _ in range(REPEAT)]
+
+
+def loaded_heavy_modules():
+    # Un nom de module par ligne : json, contrôlé ici, ne doit pas être importé par la mesure
+    code = "import sys, wpkg_core\nprint('\\n'.join(sys.modules))"
+    modules = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True,
+                             capture_output=True, text=True).stdout.split()
+    return [name for name in HEAVY_MODULES if name in modules]
+
+
+def main():
+    heavy = loaded_heavy_modules()
+    assert not heavy, f"modules chargés par wpkg_core : {', '.join(heavy)}"
+    print("aucun module lourd chargé par wpkg_core : ok")
+
+    core = timed(CORE)
+    editor = timed(EDITOR)
+    for label, samples in (("import wpkg_core", core), ("chargement de l'éditeur complet", editor)):
+        print(f"{label:<45} min {min(samples):9.1f} ms   médiane {statistics.median(samples):9.1f} ms")
+
+    if min(core) > IMPORT_BUDGET_MS:
+        print(f"import wpkg_core au-delà du budget de {IMPORT_BUDGET_MS} ms")
+        return 1
+    print(f"budget de {IMPORT_BUDGET_MS} ms respecté")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""Coût du marquage : index « 1.0 + N chars » contre table des débuts de ligne
+
+Pour des paquets synthétiques de 1k, 10k et 100k lignes, compare :
+- l'ancienne méthode (un tag_add par segment, index relatif au début du texte) ;
+- la nouvelle (index « ligne.colonne » via LineIndex, un tag_add groupé par tag).
+La conversion seule est mesurée sans affichage ; le marquage Tk en nécessite un.
+
+    python benchmarks/bench_indices.py
+"""
+
+import time
+import tkinter as tk
+
+from _common import load_editor, make_packages_xml, report
+
+SIZES = (1_000, 10_000, 100_000)
+
+
+def legacy_tagging(text, spans):
+    for tag, start, end in spans:
+        text.tag_add(tag, f"1.0 + {start} chars", f"1.0 + {end} chars")
+
+
+def bulk_tagging(text, ranges):
+    for tag, indices in ranges.items():
+        if indices:
+            text.tag_add(tag, *indices)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    editor = load_editor()
+    
+    try:
+        root = tk.Tk()
+        root.withdraw()
+        text = tk.Text(root)
+    except tk.TclError:
+        root = text = None
+        print("Pas d'affichage : seule la conversion des index est mesurée")
+    
+    for size in SIZES:
+        content = make_packages_xml(size)
+        
+        elapsed, spans = timed(editor.tokenize_xml, content)
+        report(f"{size:>7} lignes - tokenisation (décalages)", [elapsed])
+        elapsed, ranges = timed(editor.tokenize_xml_ranges, content)
+        report(f"{size:>7} lignes - tokenisation + LineIndex", [elapsed])
+        
+        if text is None:
+            continue
+        
+        text.delete("1.0", "end")
+        text.insert("1.0", content)
+        elapsed, _ = timed(legacy_tagging, text, spans)
+        report(f"{size:>7} lignes - marquage « 1.0 + N chars »", [elapsed])
+        
+        for tag in editor.HIGHLIGHT_TAGS:
+            text.tag_remove(tag, "1.0", "end")
+        elapsed, _ = timed(bulk_tagging, text, ranges)
+        report(f"{size:>7} lignes - marquage groupé ligne.colonne", [elapsed])
+    
+    if root is not None:
+        root.destroy()
+
+
+if __name__ == "__main__":
+    main()
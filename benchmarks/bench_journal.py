@@ -0,0 +1,104 @@
+"""Journal de récupération : coût d'une écriture pour la saisie, puis récupération
+
+Sur un packages.xml synthétique de 10 000 lignes enregistré dans un dossier temporaire,
+simule 300 entrées d'historique (une modification de nom de paquet chacune) et mesure :
+- une écriture synchrone (ajout + fsync) dans le thread de l'interface, à chaque entrée ;
+- EditJournal.append, seul coût supporté par l'interface (écriture et fsync par lots dans
+  le thread du journal), et le temps pour que tout soit sur disque ;
+- la récupération au démarrage (recover_journal : relecture du fichier, vérification de
+  l'empreinte, rejeu des remplacements).
+
+Vérifie (assert) que le texte récupéré est identique au texte édité, y compris quand la
+dernière ligne du journal est tronquée par un arrêt pendant l'écriture, et que le journal
+d'une instance ouverte (verrouillé) n'est ni partagé ni pris pour celui d'une session
+interrompue.
+
+    python benchmarks/bench_journal.py
+"""
+
+import json
+import os
+import tempfile
+import time
+
+from _common import load_core, load_editor, make_packages_xml, measure, report
+
+LINE_COUNT = 10_000
+EDIT_COUNT = 300
+
+
+def edits(editor, content):
+    """Remplacements successifs du texte : le nom d'un paquet change à chaque entrée"""
+    for step in range(EDIT_COUNT):
+        old = f'name     = "Application {step}"'
+        new = content.replace(old, f'name     = "Application renommée {step}"', 1)
+        yield editor.text_splice(content, new)
+        content = new
+
+
+def synchronous_journal(path, splices):
+    with open(path, 'ab') as file:
+        for splice in splices:
+            file.write(json.dumps([splice.offset, len(splice.removed), splice.inserted]).encode() + b"\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+
+def main():
+    editor = load_editor()
+    content = make_packages_xml(LINE_COUNT)
+    data = load_core().encode_package(content)
+    splices = list(edits(editor, content))
+    expected = content
+    for splice in splices:
+        expected = splice.apply_text(expected, undo=False)
+    print(f"{LINE_COUNT} lignes ({len(data) / 1e6:.1f} Mo), {EDIT_COUNT} entrées d'historique")
+
+    with tempfile.TemporaryDirectory() as folder:
+        file_path = os.path.join(folder, "packages.xml")
+        with open(file_path, 'wb') as file:
+            file.write(data)
+
+        samples = measure(synchronous_journal, os.path.join(folder, "sync.journal"), splices, repeat=3)
+        report("écriture + fsync à chaque entrée", [sample / EDIT_COUNT for sample in samples])
+
+        journal = editor.EditJournal(os.path.join(folder, "journal"))
+        journal.start(content, file_path, editor.content_digest(data))
+        journal_path = os.path.join(journal.folder, editor.journal_name(file_path, journal.owner))
+
+        # Seconde instance sur le même fichier : son propre journal, les deux restent verrouillés
+        other = editor.EditJournal(journal.folder)
+        other.start(content, file_path, editor.content_digest(data))
+        other_path = os.path.join(other.folder, editor.journal_name(file_path, other.owner))
+        while not (os.path.exists(journal_path) and os.path.exists(other_path)):
+            time.sleep(0.01)
+        assert other_path != journal_path
+        assert editor.pending_journals(journal.folder) == []  # sessions encore ouvertes
+        other.discard()
+        other.close()
+        assert not os.path.exists(other_path)
+
+        start = time.perf_counter()
+        append_samples = []
+        for splice in splices:
+            append_samples.append(measure(journal.append, splice.offset, len(splice.removed),
+                                          splice.inserted, repeat=1)[0])
+        journal.close()
+        print(f"{'tout le journal sur disque':<45} {(time.perf_counter() - start) * 1000:9.1f} ms")
+        report("EditJournal.append (thread de l'interface)", append_samples)
+        assert journal.error is None and other.error is None
+
+        # Fermé sans abandon (comme après un arrêt brutal) : journal à récupérer
+        assert editor.pending_journals(journal.folder) == [journal_path]
+        report("recover_journal", measure(editor.recover_journal, journal_path, repeat=5))
+        assert editor.recover_journal(journal_path) == (file_path, expected)
+
+        # Arrêt pendant l'écriture de la dernière ligne : les entrées précédentes sont rejouées
+        with open(journal_path, 'ab') as file:
+            file.write(b'[12, 3, "inachev')
+        assert editor.recover_journal(journal_path) == (file_path, expected)
+        print("vérifications de récupération : ok")
+
+
+if __name__ == "__main__":
+    main()
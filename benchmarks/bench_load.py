@@ -0,0 +1,50 @@
+"""Ouverture d'un fichier : analyses successives contre analyse unique parse_wpkg
+
+Pour des packages.xml synthétiques, compare le travail d'analyse fait à l'ouverture :
+- avant : regex de déclaration, regex des commentaires, ET.fromstring, analyse lxml de
+  verify_xml, puis deux tokenisations pour la coloration (chargement et vérification) ;
+- après : parse_wpkg (modèle, commentaires, lignes, erreurs) et une tokenisation.
+La coloration Tk elle-même n'est pas mesurée.
+
+    python benchmarks/bench_load.py
+"""
+
+import re
+import xml.etree.ElementTree as ET
+
+from lxml import etree
+
+from _common import load_editor, make_packages_xml, measure, report
+
+SIZES = (10_000, 100_000)
+
+
+def legacy_load(editor, content):
+    re.match(r'<\?xml[^>]*\?>', content)
+    [comment.strip() for comment in re.findall(r'<!--(.*?)-->', content, re.DOTALL)]
+    root = ET.fromstring(content)
+    packages = [editor.package_from_element(element) for element in root.iter("package")]
+    body = content[content.index("?>") + 2:]
+    etree.fromstring(body.encode("utf-8"))
+    editor.tokenize_xml(content)
+    editor.tokenize_xml(content)
+    return packages
+
+
+def unified_load(editor, content):
+    result = editor.parse_wpkg(content)
+    editor.tokenize_xml(content)
+    return result.packages
+
+
+def main():
+    editor = load_editor()
+    for size in SIZES:
+        content = make_packages_xml(size)
+        assert len(legacy_load(editor, content)) == len(unified_load(editor, content))
+        report(f"{size} lignes, analyses successives", measure(legacy_load, editor, content, repeat=5))
+        report(f"{size} lignes, parse_wpkg", measure(unified_load, editor, content, repeat=5))
+
+
+if __name__ == "__main__":
+    main()
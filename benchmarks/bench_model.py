@@ -0,0 +1,105 @@
+"""Mémoire du modèle pour un dépôt de 10 000 paquets : dataclasses simples contre modèle compact
+
+Analyse un packages.xml synthétique de 10 000 paquets puis mesure avec tracemalloc la
+mémoire retenue par les paquets :
+- modèle actuel (__slots__, valeurs répétées partagées par sys.intern) ;
+- ancien modèle reconstruit à l'identique (dataclasses avec __dict__, une chaîne par valeur).
+
+    python benchmarks/bench_model.py
+"""
+
+import gc
+import sys
+import tracemalloc
+from dataclasses import dataclass, field, fields
+from typing import List
+
+from _common import load_editor, make_packages_xml
+
+PACKAGE_COUNT = 10_000
+
+
+@dataclass
+class Variable:
+    name: str
+    value: str
+    architecture: str = ""
+
+@dataclass
+class Check:
+    type: str
+    condition: str
+    path: str
+    value: str = ""
+    architecture: str = ""
+
+@dataclass
+class Command:
+    cmd: str = ""
+    include: str = ""
+    timeout: str = ""
+    exit_code: str = ""
+
+@dataclass
+class Package:
+    id: str = ""
+    name: str = ""
+    revision: str = ""
+    date: str = ""
+    reboot: str = "false"
+    category: str = ""
+    priority: str = ""
+    variables: List[Variable] = field(default_factory=list)
+    checks: List[Check] = field(default_factory=list)
+    installs: List[Command] = field(default_factory=list)
+    upgrades: List[Command] = field(default_factory=list)
+    removes: List[Command] = field(default_factory=list)
+
+
+def fresh(value):
+    # Une nouvelle chaîne par valeur, comme celles que renvoyait lxml sans partage
+    return value.encode("utf-8").decode("utf-8")
+
+
+def legacy_item(cls, item):
+    return cls(**{f.name: fresh(getattr(item, f.name)) for f in fields(cls)})
+
+
+def legacy_package(package):
+    legacy = Package(**{key: fresh(getattr(package, key)) for key in ("id", "name", "revision", "date",
+                                                                       "reboot", "category", "priority")})
+    legacy.variables = [legacy_item(Variable, item) for item in package.variables]
+    legacy.checks = [legacy_item(Check, item) for item in package.checks]
+    legacy.installs = [legacy_item(Command, item) for item in package.installs]
+    legacy.upgrades = [legacy_item(Command, item) for item in package.upgrades]
+    legacy.removes = [legacy_item(Command, item) for item in package.removes]
+    return legacy
+
+
+def retained(func, *args):
+    """Mémoire (Mo) encore allouée par `func` une fois son résultat construit"""
+    gc.collect()
+    tracemalloc.start()
+    result = func(*args)
+    gc.collect()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, current / 1e6
+
+
+def main():
+    editor = load_editor()
+    content = make_packages_xml(PACKAGE_COUNT * 25)
+
+    packages, compact = retained(lambda: editor.parse_wpkg(content).packages[:PACKAGE_COUNT])
+    _, legacy = retained(lambda: [legacy_package(package) for package in packages])
+
+    print(f"{len(packages)} paquets")
+    print(f"{'dataclasses avec __dict__':<45} {legacy:9.1f} Mo")
+    print(f"{'__slots__ + chaînes partagées':<45} {compact:9.1f} Mo")
+    print(f"{'une instance de Command':<45} {sys.getsizeof(Command()) + sys.getsizeof(Command().__dict__):6d} o "
+          f"(dont __dict__) contre {sys.getsizeof(editor.Command())} o")
+
+
+if __name__ == "__main__":
+    main()
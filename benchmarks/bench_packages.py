@@ -0,0 +1,67 @@
+"""Chargement d'un packages.xml de 5 000 paquets : iterparse en flux contre arbre complet
+
+Écrit un fichier synthétique de 5 000 paquets puis, chaque méthode dans un processus séparé,
+mesure la durée et l'augmentation de la mémoire de pointe (ru_maxrss, Linux/macOS) :
+- iter_packages (lxml.etree.iterparse, éléments libérés au fur et à mesure) ;
+- ET.parse de tout le fichier puis conversion de chaque <package>.
+
+    python benchmarks/bench_packages.py
+"""
+
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+from _common import load_core, make_package
+
+PACKAGE_COUNT = 5_000
+
+
+def write_packages(path):
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("<packages>\n")
+        for index in range(PACKAGE_COUNT):
+            file.write(make_package(index))
+        file.write("</packages>\n")
+
+
+def streamed(core, path):
+    return list(core.iter_packages(path))
+
+
+def full_tree(core, path):
+    root = ET.parse(path).getroot()
+    return [core.package_from_element(element) for element in root.iter("package")]
+
+
+def run(method, path, results):
+    core = load_core()
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    packages = method(core, path)
+    elapsed = (time.perf_counter() - start) * 1000
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    results.put((len(packages), elapsed, peak))
+
+
+def main():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "packages.xml")
+        write_packages(path)
+        print(f"{PACKAGE_COUNT} paquets, {os.path.getsize(path) / 1e6:.1f} Mo")
+
+        results = multiprocessing.Queue()
+        for label, method in (("iter_packages (flux)", streamed), ("ET.parse (arbre complet)", full_tree)):
+            process = multiprocessing.Process(target=run, args=(method, path, results))
+            process.start()
+            count, elapsed, peak = results.get()
+            process.join()
+            # ru_maxrss est en Ko sous Linux
+            print(f"{label:<30} {count} paquets  {elapsed:9.1f} ms   pointe +{peak / 1024:6.1f} Mo")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Réouverture d'un fichier : lecture et analyse complètes contre cache d'analyse
+
+Pour des packages.xml synthétiques de 1 000 et 10 000 lignes, mesure :
+- l'ancienne ouverture (lecture, parse_wpkg, tokenisation complète pour la coloration) ;
+- une réouverture servie par ParseCache en mémoire (fichier inchangé : ni lecture ni analyse,
+  seulement la copie du modèle) ;
+- une réouverture après redémarrage, servie par le cache sur disque (lecture et empreinte,
+  sans analyse ni tokenisation).
+
+    python benchmarks/bench_parse_cache.py
+"""
+
+import os
+import tempfile
+
+from _common import load_editor, make_packages_xml, measure, report
+
+SIZES = (1_000, 10_000)
+
+
+def full_open(editor, path):
+    with open(path, encoding="utf-8") as file:
+        content = file.read()
+    return editor.parse_wpkg(content), editor.tokenize_xml_ranges(content)
+
+
+def cached_open(cache, path):
+    document = cache.load(path)
+    return document.parse_result(), document.spans
+
+
+def main():
+    editor = load_editor()
+
+    with tempfile.TemporaryDirectory() as folder:
+        cache_folder = os.path.join(folder, "cache")
+        for size in SIZES:
+            path = os.path.join(folder, f"packages-{size}.xml")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(make_packages_xml(size))
+            print(f"--- {size} lignes")
+
+            report("ouverture complète", measure(full_open, editor, path, repeat=5))
+
+            # Première ouverture : analyse, puis tokenisation rendue par la vue XML
+            cache = editor.ParseCache(folder=cache_folder)
+            document = cache.load(path)
+            ranges = editor.tokenize_xml_ranges(document.content)
+            cache.attach_spans(document.digest, tuple((tag, tuple(indices)) for tag, indices in ranges.items()
+                                                      if indices))
+            report("réouverture (cache mémoire)", measure(cached_open, cache, path, repeat=20))
+            print(f"{'':<45} {document.cost() / 1e6:9.2f} Mo en cache")
+
+            report("après redémarrage (cache disque)",
+                   measure(lambda: cached_open(editor.ParseCache(folder=cache_folder), path), repeat=5))
+
+
+if __name__ == "__main__":
+    main()
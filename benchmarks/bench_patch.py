@@ -0,0 +1,38 @@
+"""Régénération de la vue XML : texte complet contre plage modifiée seulement
+
+Pour des documents synthétiques de 10k et 100k lignes dont un attribut d'un paquet au
+milieu change, mesure la recherche de la plage qui diffère (changed_range) et compare la
+tokenisation nécessaire à la recoloration : tout le document (ancien comportement, après
+suppression et réinsertion du texte) contre les seules lignes réécrites par patch_text.
+La mise à jour du widget Tk lui-même n'est pas mesurée (pas d'affichage requis).
+
+    python benchmarks/bench_patch.py
+"""
+
+from _common import load_editor, make_packages_xml, measure, report
+
+SIZES = (10_000, 100_000)
+
+
+def main():
+    editor = load_editor()
+
+    for size in SIZES:
+        old = make_packages_xml(size)
+        target = f'revision = "1.0.{size // 40}"'
+        new = old.replace(target, f'revision = "2.0.{size // 40}"', 1)
+        print(f"--- {size} lignes")
+
+        report("plage modifiée (changed_range)", measure(editor.changed_range, old, new, repeat=20))
+        start, old_end, new_end = editor.changed_range(old, new)
+        first = new.rfind("\n", 0, start) + 1
+        last = new.find("\n", new_end)
+        patched = new[first:last if last >= 0 else len(new)]
+        print(f"{patched.count(chr(10)) + 1} ligne(s) réécrite(s) sur {new.count(chr(10)) + 1}")
+
+        report("tokenisation du document complet", measure(editor.tokenize_xml_ranges, new, repeat=5))
+        report("tokenisation des lignes réécrites", measure(editor.tokenize_xml_ranges, patched, repeat=20))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Navigation dans les occurrences : index trié contre nouvelle recherche à chaque « Suivant »
+
+Pour des paquets synthétiques de 10k et 100k lignes et une occurrence rare (le cas où
+la recherche depuis le curseur parcourt tout le texte), mesure la construction de l'index,
+un « Suivant » par recherche bisectée, un « Suivant » par nouvelle recherche regex depuis
+le curseur, et la mise à jour de l'index après la modification d'une ligne.
+
+    python benchmarks/bench_search.py
+"""
+
+import re
+
+from _common import load_editor, make_packages_xml, measure, report
+
+SIZES = (10_000, 100_000)
+
+
+def rescan_next(pattern, content, offset):
+    # Équivalent de l'ancien comportement : recherche depuis le curseur, puis depuis le début
+    return pattern.search(content, offset) or pattern.search(content)
+
+
+def main():
+    editor = load_editor()
+    pattern = re.compile('id = "application-1"')
+
+    for size in SIZES:
+        content = make_packages_xml(size)
+        middle = len(content) // 2
+        print(f"--- {size} lignes")
+
+        report("construction de l'index", measure(editor.MatchIndex, pattern, content, repeat=5))
+        index = editor.MatchIndex(pattern, content)
+        print(f"{len(index)} occurrences")
+
+        report("suivant (index trié)", measure(index.next_after, size // 2, 0, repeat=1000))
+        report("suivant (nouvelle recherche)", measure(rescan_next, pattern, content, middle, repeat=1000))
+
+        line = content.split("\n")[size // 2 - 1]
+        report("mise à jour après édition d'une ligne",
+               measure(index.update, line, size // 2, size // 2, 0, repeat=100))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Écriture du document XML : arbre ElementTree + minidom contre sérialiseur direct
+
+Pour des dépôts synthétiques de 100, 1 000 et 5 000 paquets, mesure l'ancienne
+régénération (construction d'un arbre ElementTree, toprettyxml de minidom puis
+réinsertion des commentaires par str.replace) et write_packages, qui écrit le modèle
+directement dans un flux. Affiche aussi le débit en Mo/s du texte produit.
+
+    python benchmarks/bench_serialize.py
+"""
+
+import statistics
+import xml.etree.ElementTree as ET
+from xml.dom import minidom
+
+from _common import load_core, make_packages_xml, measure, report
+
+PACKAGE_COUNTS = (100, 1_000, 5_000)
+
+
+def minidom_serialize(core, packages, xml_declaration, comments):
+    # Équivalent de l'ancien regenerate_xml
+    root = ET.Element("packages")
+    for package in packages:
+        package_elem = ET.SubElement(root, "package")
+        for key in core.PACKAGE_ATTRIBUTES:
+            if getattr(package, key):
+                package_elem.set(key, getattr(package, key))
+        for tag in core.CHILD_TAGS:
+            for item in getattr(package, core.ELEMENT_LISTS[tag]):
+                child = ET.SubElement(package_elem, tag)
+                for name, attr, required in core.CHILD_ATTRIBUTES[tag]:
+                    if required or getattr(item, attr):
+                        child.set(name, getattr(item, attr))
+                if getattr(item, "exit_code", ""):
+                    ET.SubElement(child, "exit").set("code", item.exit_code)
+    xml_str = minidom.parseString(ET.tostring(root, encoding="utf-8")).toprettyxml(indent="  ")
+    xml_str = xml_declaration + "\n\n" + xml_str
+    comment_text = "\n<!--\n" + "\n\n".join(comments) + "\n-->\n"
+    return xml_str.replace("<packages>\n", "<packages>\n" + comment_text)
+
+
+def main():
+    core = load_core()
+
+    for count in PACKAGE_COUNTS:
+        result = core.parse_wpkg(make_packages_xml(count * 25))
+        packages = result.packages[:count]
+        comments = [comment.text for comment in result.comments]
+        placement = core.comment_placement(result.comments, result.element_lines)
+        size = len(core.serialize_packages(packages, result.xml_declaration, placement)) / 1e6
+        print(f"--- {len(packages)} paquets ({size:.1f} Mo)")
+
+        for label, samples in (
+            ("ElementTree + minidom", measure(minidom_serialize, core, packages,
+                                              result.xml_declaration, comments, repeat=3)),
+            ("write_packages", measure(core.serialize_packages, packages,
+                                       result.xml_declaration, placement, repeat=3)),
+        ):
+            report(label, samples)
+            print(f"{'':<45} {size / (statistics.median(samples) / 1000):9.1f} Mo/s")
+
+
+if __name__ == "__main__":
+    main()
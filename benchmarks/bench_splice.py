@@ -0,0 +1,54 @@
+"""Modification d'un champ : réécriture en place contre régénération du document
+
+Pour des packages.xml de 500 et 5 000 paquets, mesure la modification de l'attribut
+« name » d'un paquet :
+- régénération : écriture de tous les paquets par serialize_packages (l'ancien chemin
+  ElementTree + minidom est mesuré par bench_serialize.py) ;
+- nouvelle : lecture et vérification de l'élément <package> (scan_element, lxml), calcul
+  des modifications (package_edits) et application sur son seul texte.
+Le coût de la nouvelle méthode ne dépend que de la taille du paquet modifié.
+
+    python benchmarks/bench_splice.py
+"""
+
+import copy
+import io
+
+from lxml import etree
+
+from _common import load_core, make_package, measure, report
+
+SIZES = (500, 5_000)
+
+
+def splice(core, text, snapshot, package):
+    element = core.scan_element(text)
+    source = text[:element.end]
+    written = core.package_from_element(etree.fromstring(source.encode("utf-8")))
+    assert core.package_content(written) == core.package_content(snapshot)
+    for start, end, replacement in reversed(sorted(core.package_edits(source, element, snapshot, package),
+                                                   key=lambda edit: edit[:2])):
+        source = source[:start] + replacement + source[end:]
+    return source
+
+
+def main():
+    core = load_core()
+    for size in SIZES:
+        document = "<packages>\n" + "".join(make_package(index) for index in range(size)) + "</packages>\n"
+        packages = list(core.iter_packages(io.BytesIO(document.encode("utf-8"))))
+
+        # Paquet du milieu, renommé
+        middle = size // 2
+        snapshot = packages[middle]
+        edited = copy.deepcopy(snapshot)
+        edited.name = "Application renommée"
+        start = document.index(f'<package id = "application-{middle}"')
+
+        report(f"{size} paquets, régénération", measure(core.serialize_packages, packages, repeat=3))
+        report(f"{size} paquets, réécriture en place",
+               measure(splice, core, document[start:], snapshot, edited, repeat=50))
+
+
+if __name__ == "__main__":
+    main()
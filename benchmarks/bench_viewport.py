@@ -0,0 +1,53 @@
+"""Ouverture et défilement d'un très gros fichier en coloration différée
+
+Mesure highlight_syntax puis des sauts de défilement sur un document
+d'environ 50 Mo, au-delà du seuil de coloration différée. Nécessite un affichage.
+
+    python benchmarks/bench_viewport.py
+"""
+
+import random
+import tkinter as tk
+
+from _common import load_editor, make_packages_xml, measure, report
+
+TARGET_BYTES = 50 * 1024 * 1024
+
+
+def main():
+    editor = load_editor()
+    root = tk.Tk()
+    root.geometry("1000x700")
+    widget = editor.XmlTextWithLineNumbers(root)
+    widget.pack(fill=tk.BOTH, expand=True)
+    root.update()
+    
+    # Environ 1,2 Ko pour 25 lignes de paquet synthétique
+    content = make_packages_xml(TARGET_BYTES // 48)
+    widget.insert("end", content)
+    line_count = content.count("\n")
+    
+    report(f"ouverture ({len(content) // (1024 * 1024)} Mo)", measure(widget.highlight_syntax, repeat=3))
+    print(f"coloration différée active : {widget.lazy_highlighting}")
+    
+    rng = random.Random(0)
+    
+    def scroll_jump():
+        widget.text.yview_moveto(rng.random())
+        root.update()
+    
+    def scroll_step():
+        widget.text.yview_scroll(3, "units")
+        root.update()
+    
+    report("saut de défilement aléatoire", measure(scroll_jump, repeat=30))
+    report("défilement molette (3 lignes)", measure(scroll_step, repeat=100))
+    
+    tag_ranges = sum(len(widget.text.tag_ranges(tag)) // 2 for tag in editor.HIGHLIGHT_TAGS)
+    print(f"plages de tags en mémoire : {tag_ranges} pour {line_count} lignes")
+    
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Surveillance des fichiers : coût d'une relève selon le nombre de fichiers suivis
+
+Pour 10, 100 et 1 000 fichiers suivis dans un dossier temporaire, mesure :
+- une relève naïve, qui vérifie la date et la taille de tous les fichiers ;
+- une relève de FileWatcher sans inotify : le fichier ouvert et WATCH_FILES_PER_POLL autres ;
+- avec inotify (Linux), le délai entre l'enregistrement atomique d'un fichier suivi et son
+  signalement dans la file `changes` (aucune relève des fichiers récents).
+
+Vérifie aussi la fusion à trois voies (merge_texts) proposée quand le fichier ouvert est
+modifié par ailleurs.
+
+    python benchmarks/bench_watch.py
+"""
+
+import os
+import statistics
+import tempfile
+import time
+
+from _common import load_editor, measure, report
+
+COUNTS = (10, 100, 1_000)
+
+
+def check_merge(editor):
+    base = "".join(f"ligne {i}\n" for i in range(10))
+    ours = base.replace("ligne 2\n", "ligne 2 (éditeur)\n")
+    theirs = base.replace("ligne 7\n", "ligne 7 (partage)\n") + "ligne 10\n"
+    merged, conflicts = editor.merge_texts(base, ours, theirs)
+    assert conflicts == 0 and merged == theirs.replace("ligne 2\n", "ligne 2 (éditeur)\n")
+    merged, conflicts = editor.merge_texts(base, ours, base.replace("ligne 2\n", "ligne 2 (partage)\n"))
+    assert conflicts == 1 and merged == ours
+    print("vérifications de fusion : ok")
+
+
+def naive_poll(paths):
+    return [(stat.st_mtime_ns, stat.st_size) for stat in map(os.stat, paths)]
+
+
+def watcher_poll(editor, watcher, paths, cursor):
+    batch = [paths[(cursor[0] + i) % len(paths)] for i in range(editor.WATCH_FILES_PER_POLL)]
+    cursor[0] += len(batch)
+    for path in [paths[0]] + batch:
+        watcher._check(path)
+
+
+def notification_delay(editor, watcher, path):
+    while not watcher.changes.empty():
+        watcher.changes.get()
+    start = time.perf_counter()
+    editor.atomic_write_bytes(path, os.urandom(16))
+    watcher.changes.get(timeout=5)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    editor = load_editor()
+    check_merge(editor)
+
+    with tempfile.TemporaryDirectory() as folder:
+        for count in COUNTS:
+            paths = []
+            for i in range(count):
+                path = os.path.join(folder, f"paquet-{count}-{i}.xml")
+                with open(path, "wb") as file:
+                    file.write(b"<packages />")
+                paths.append(path)
+            print(f"--- {count} fichiers suivis")
+
+            report("relève naïve (tous les fichiers)", measure(naive_poll, paths, repeat=20))
+            watcher = editor.FileWatcher()
+            watcher.watch(paths[1:], primary=paths[0])
+            report("relève FileWatcher", measure(watcher_poll, editor, watcher, paths, [0], repeat=20))
+
+            if watcher.uses_inotify:
+                time.sleep(editor.WATCH_POLL_MS / 1000 * 1.5)  # dossiers suivis au tour suivant
+                delays = [notification_delay(editor, watcher, paths[count // 2]) for _ in range(5)]
+                label = "signalement inotify d'un fichier récent"
+                print(f"{label:<45} médiane {statistics.median(delays):9.3f} ms")
+            watcher.stop()
+
+
+if __name__ == "__main__":
+    main()
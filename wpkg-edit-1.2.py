@@ -2,8 +2,8 @@
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext, simpledialog
+import tkinter.font as tkfont
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
 from lxml import etree
 import re
 import os
@@ -12,12 +12,22 @@ import platform
 import subprocess
 import string
 import json
+import pickle
+import copy
+import queue
 import threading
-from dataclasses import dataclass, field, asdict
-from typing import List, Dict, Optional, Any, Union, Tuple
+import mmap
+import select
+import struct
+from bisect import bisect_left
+from contextlib import contextmanager
+from difflib import SequenceMatcher
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Any, Union, Tuple
 from pathlib import Path
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import pygments
 from pygments.lexers import XmlLexer
 from pygments.formatters import HtmlFormatter
@@ -25,54 +35,478 @@ import html
 import time
 import datetime
 
-# Utilisation de dataclasses pour un code plus propre et meilleur typage (Python 3.7+)
+# Modèle, analyse, écriture et contrôle des paquets, sans interface graphique (wpkg_core.py)
+from wpkg_core import (
+    Variable, Check, Command, PACKAGE_ATTRIBUTES, Package, ELEMENT_LISTS, package_from_element,
+    parse_wpkg, scan_element, LineIndex, serialize_packages, comment_placement,
+    equivalent_xml, locate_packages, package_content, package_edits, VariableResolver,
+    content_digest, atomic_write_bytes, user_cache_folder, SINGLE_BYTE_ENCODINGS, declared_encoding,
+    file_encoding, decode_package, read_package_document, write_package_file, result_to_plain,
+    result_from_plain, run_cli
+)
+
+
+# Historique d'annulation : opérations réversibles, rejouées dans un sens ou dans l'autre.
+# `apply(packages, text, undo)` modifie la liste des paquets ou la vue XML (insert/delete).
+
+# Champs du modèle suivis par l'historique en plus des attributs de <package>
+HISTORY_FIELDS = PACKAGE_ATTRIBUTES + ("comments", "xml_declaration")
+
+
+@dataclass
+class FieldSet:
+    package: int
+    field: str
+    old: Any
+    new: Any
+    
+    def apply(self, packages, text, undo):
+        setattr(packages[self.package], self.field, copy.copy(self.old if undo else self.new))
+
+
 @dataclass
-class Variable:
-    name: str
-    value: str
-    architecture: str = ""
+class ListInsert:
+    package: int
+    list_name: str
+    position: int
+    items: List[Any]
+    
+    def apply(self, packages, text, undo):
+        items = getattr(packages[self.package], self.list_name)
+        if undo:
+            del items[self.position:self.position + len(self.items)]
+        else:
+            items[self.position:self.position] = [copy.copy(item) for item in self.items]
+
 
 @dataclass
-class Check:
-    type: str
-    condition: str
-    path: str
-    value: str = ""
-    architecture: str = ""
+class ListDelete(ListInsert):
+    def apply(self, packages, text, undo):
+        ListInsert.apply(self, packages, text, not undo)
+
 
 @dataclass
-class Command:
-    cmd: str = ""
-    include: str = ""
-    timeout: str = ""
-    exit_code: str = ""
+class ListMove:
+    package: int
+    list_name: str
+    source: int
+    target: int
+    
+    def apply(self, packages, text, undo):
+        items = getattr(packages[self.package], self.list_name)
+        source, target = (self.target, self.source) if undo else (self.source, self.target)
+        items.insert(target, items.pop(source))
+
 
 @dataclass
-class Package:
-    id: str = ""
-    name: str = ""
-    revision: str = ""
-    date: str = ""
-    reboot: str = "false"
-    category: str = ""
-    priority: str = ""
-    variables: List[Variable] = field(default_factory=list)
-    checks: List[Check] = field(default_factory=list)
-    installs: List[Command] = field(default_factory=list)
-    upgrades: List[Command] = field(default_factory=list)
-    removes: List[Command] = field(default_factory=list)
-    comments: List[str] = field(default_factory=list)
-    xml_declaration: str = '<?xml version="1.0" encoding="iso-8859-1"?>'
+class ReplacePackages:
+    """Changement de la liste des paquets elle-même (paquets ajoutés ou retirés dans le XML)"""
+    old: List[Package]
+    new: List[Package]
+    
+    def apply(self, packages, text, undo):
+        packages[:] = copy.deepcopy(self.old if undo else self.new)
+
+
+@dataclass
+class TextSplice:
+    """Remplacement de `removed` par `inserted` à la position `offset` (ligne, colonne) du texte"""
+    offset: int
+    line: int
+    column: int
+    removed: str
+    inserted: str
+    
+    def apply(self, packages, text, undo):
+        removed, inserted = (self.inserted, self.removed) if undo else (self.removed, self.inserted)
+        index = f"{self.line}.{self.column}"
+        if removed:
+            text.delete(index, f"{index}+{len(removed)}c")
+        if inserted:
+            text.insert(index, inserted)
+    
+    def apply_text(self, content, undo):
+        """Même remplacement sur une chaîne"""
+        removed, inserted = (self.inserted, self.removed) if undo else (self.removed, self.inserted)
+        return content[:self.offset] + inserted + content[self.offset + len(removed):]
+
+
+def text_splice(old, new):
+    """Opération transformant le texte `old` en `new` (None s'ils sont identiques)"""
+    start, old_end, new_end = changed_range(old, new)
+    if start == old_end == new_end:
+        return None
+    line = old.count("\n", 0, start) + 1
+    column = start - (old.rfind("\n", 0, start) + 1)
+    return TextSplice(start, line, column, old[start:old_end], new[start:new_end])
+
+
+def package_operations(index, old, new):
+    """Opérations transformant le paquet `old` en `new` (paquet numéro `index`)"""
+    operations = [
+        FieldSet(index, key, copy.copy(getattr(old, key)), copy.copy(getattr(new, key)))
+        for key in HISTORY_FIELDS
+        if getattr(old, key) != getattr(new, key)
+    ]
+    for list_name in ELEMENT_LISTS.values():
+        old_items, new_items = getattr(old, list_name), getattr(new, list_name)
+        if old_items == new_items:
+            continue
+        
+        # De la fin vers le début : les positions de l'ancienne liste restent valides
+        matcher = SequenceMatcher(None, [item.values() for item in old_items],
+                                  [item.values() for item in new_items], autojunk=False)
+        changes = []
+        for operation, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+            if operation == "equal":
+                continue
+            if i2 > i1:
+                changes.append(ListDelete(index, list_name, i1, [copy.copy(item) for item in old_items[i1:i2]]))
+            if j2 > j1:
+                changes.append(ListInsert(index, list_name, i1, [copy.copy(item) for item in new_items[j1:j2]]))
+        
+        # Un élément retiré puis réinséré ailleurs : un déplacement
+        if (len(changes) == 2 and len(changes[0].items) == len(changes[1].items) == 1
+                and changes[0].items == changes[1].items and type(changes[0]) is not type(changes[1])):
+            first, second = changes
+            if isinstance(first, ListDelete):
+                changes = [ListMove(index, list_name, first.position, second.position)]
+            else:
+                changes = [ListMove(index, list_name, second.position, first.position - 1)]
+        operations += changes
+    return operations
+
+
+def packages_operations(old_packages, new_packages):
+    """Opérations transformant une liste de paquets en une autre"""
+    if len(old_packages) != len(new_packages):
+        return [ReplacePackages(copy.deepcopy(old_packages), copy.deepcopy(new_packages))]
+    return [operation
+            for index, (old, new) in enumerate(zip(old_packages, new_packages))
+            for operation in package_operations(index, old, new)]
+
+
+class EditHistory:
+    """Pile d'annulation : chaque entrée est la liste des opérations d'une action"""
+    def __init__(self, limit=50):
+        self.limit = limit
+        self.entries = []
+        # Nombre d'entrées appliquées : celles qui suivent peuvent être refaites
+        self.position = 0
+    
+    def record(self, operations):
+        if not operations:
+            return
+        del self.entries[self.position:]
+        self.entries.append(operations)
+        if len(self.entries) > self.limit:
+            del self.entries[0]
+        self.position = len(self.entries)
+    
+    def undo(self):
+        """Opérations à annuler (dans l'ordre inverse), None s'il n'y en a plus"""
+        if self.position == 0:
+            return None
+        self.position -= 1
+        return self.entries[self.position]
+    
+    def redo(self):
+        if self.position == len(self.entries):
+            return None
+        self.position += 1
+        return self.entries[self.position - 1]
+    
+    def clear(self):
+        self.entries = []
+        self.position = 0
+
+
+# Tags de coloration syntaxique gérés par le tokeniseur
+HIGHLIGHT_TAGS = ("tag", "attribute", "attributevalue", "comment", "xml_declaration")
+
+# Au-delà de cette taille (en caractères), seule la zone visible est colorée
+LAZY_HIGHLIGHT_THRESHOLD = 2_000_000
+# Lignes colorées au-dessus et au-dessous de la zone visible en mode différé
+VIEWPORT_MARGIN_LINES = 100
+
+# Au-delà de cette taille (en caractères), une région est tokenisée sur un thread de travail
+ASYNC_HIGHLIGHT_THRESHOLD = 20_000
+# Durée maximale d'une tranche d'application des tags dans la boucle Tk
+HIGHLIGHT_SLICE_MS = 8
+# Nombre d'index (paires début/fin) passés à chaque appel tag_add d'une tranche
+HIGHLIGHT_CHUNK_SIZE = 2000
+# Délai avant de recolorer une région dont le résultat est devenu obsolète pendant la frappe
+HIGHLIGHT_RETRY_MS = 300
+
+# Police des numéros de ligne et intervalle minimal entre deux mises à jour (une par image)
+GUTTER_FONT = ("Courier", 10)
+GUTTER_FRAME_MS = 16
+
+# Taille des blocs comparés pour trouver la plage modifiée entre deux versions du document
+PATCH_BLOCK = 4096
+
+# Pause de frappe après laquelle les modifications du texte XML forment une entrée d'historique
+HISTORY_TYPING_PAUSE_MS = 1000
+
+# Cache des documents analysés : budget mémoire par défaut, dossier (propre à l'utilisateur) et
+# nombre de fichiers du cache sur disque, version du format (à incrémenter si le modèle change)
+PARSE_CACHE_BUDGET_MB = 64
+PARSE_CACHE_FOLDER = user_cache_folder("parse_cache")
+PARSE_CACHE_DISK_FILES = 200
+PARSE_CACHE_VERSION = 4
+
+# Journal des modifications non enregistrées : dossier (propre à l'utilisateur), délai de
+# regroupement des écritures avant synchronisation sur disque, version du format, position
+# de l'octet verrouillé sous Windows (au-delà des données, que le verrou ne doit pas bloquer)
+JOURNAL_FOLDER = user_cache_folder("journal")
+JOURNAL_BATCH_MS = 200
+JOURNAL_VERSION = 1
+JOURNAL_LOCK_OFFSET = 1 << 30
+
+# Relève de la fin d'un enregistrement fait sur le thread d'enregistrement
+SAVE_POLL_MS = 50
+
+# Surveillance du fichier ouvert et des fichiers récents : intervalle de relève, et fichiers
+# récents vérifiés par relève sans inotify (le coût d'une relève ne dépend pas de leur nombre)
+WATCH_POLL_MS = 1000
+WATCH_FILES_PER_POLL = 4
+
+
+# Recherche dans un dossier : extensions analysées, longueur des extraits, fichiers par tâche
+# du pool (les paquets sont petits, une tâche par fichier coûterait surtout en échanges), relève
+FOLDER_SEARCH_EXTENSIONS = (".xml",)
+FOLDER_SEARCH_SNIPPET = 200
+FOLDER_SEARCH_BATCH = 32
+FOLDER_SEARCH_POLL_MS = 50
+
+
+# Complétion : nombre de propositions, taille maximale d'une feuille du trie (filtrée linéairement),
+# attributs dont on propose aussi les préfixes de chemin, lignes examinées pour trouver la balise
+COMPLETION_LIMIT = 15
+COMPLETION_BUCKET = 64
+COMPLETION_PATH_ATTRIBUTES = ("cmd", "path")
+COMPLETION_CONTEXT_LINES = 50
+
+
+# Touches qui ne modifient pas le texte (pas de recoloration au relâchement)
+NAVIGATION_KEYS = {
+    "Shift_L", "Shift_R", "Control_L", "Control_R", "Alt_L", "Alt_R", "Caps_Lock", "Escape",
+    "Up", "Down", "Left", "Right", "Prior", "Next", "Home", "End"
+}
+
+# Expressions compilées une seule fois : un seul passage sur le texte au lieu de quatre
+# (les valeurs d'attributs ne peuvent pas contenir '<', ce qui borne une balise non fermée)
+_XML_TOKEN_RE = re.compile(
+    r'(?P<comment><!--.*?(?:-->|\Z))'
+    r'|(?P<xml_declaration><\?xml[^>]*\?>)'
+    r'|(?P<markup><(?:[^<>"\']+|"[^"<]*"|\'[^\'<]*\')*>?)',
+    re.DOTALL
+)
+_XML_TAG_NAME_RE = re.compile(r'</?([a-zA-Z0-9_:-]+)')
+_XML_ATTRIBUTE_RE = re.compile(r'([a-zA-Z0-9_:-]+)(\s*=\s*)("[^"]*"|\'[^\']*\')')
+
+
+def tokenize_xml(content, pos=0, endpos=None):
+    """Découpe le XML en segments (tag, début, fin) pour la coloration syntaxique"""
+    if endpos is None:
+        endpos = len(content)
+    
+    spans = []
+    append = spans.append
+    for match in _XML_TOKEN_RE.finditer(content, pos, endpos):
+        kind = match.lastgroup
+        start, end = match.span()
+        
+        if kind != "markup":
+            append((kind, start, end))
+            continue
+        
+        # Nom de la balise puis attributs et leurs valeurs
+        name_match = _XML_TAG_NAME_RE.match(content, start, end)
+        if name_match is None:
+            continue
+        append(("tag", name_match.start(1), name_match.end(1)))
+        for attr_match in _XML_ATTRIBUTE_RE.finditer(content, name_match.end(), end):
+            append(("attribute", attr_match.start(1), attr_match.end(1)))
+            append(("attributevalue", attr_match.start(3), attr_match.end(3)))
+    
+    return spans
+
+
+def _common_length(old, new, reverse=False):
+    """Longueur du préfixe (ou du suffixe) commun, comparé par blocs puis par dichotomie"""
+    limit = min(len(old), len(new))
+    
+    def same(start, end):
+        if reverse:
+            return old[len(old) - end:len(old) - start] == new[len(new) - end:len(new) - start]
+        return old[start:end] == new[start:end]
+    
+    done = 0
+    while done < limit:
+        end = min(done + PATCH_BLOCK, limit)
+        if not same(done, end):
+            break
+        done = end
+    else:
+        return limit
+    
+    # Le premier écart est dans le bloc [done, end) : le situer par dichotomie
+    low, high = done, end
+    while high - low > 1:
+        middle = (low + high) // 2
+        if same(done, middle):
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def changed_range(old, new):
+    """Plus petite plage qui diffère entre deux textes : (début, fin dans old, fin dans new)"""
+    start = _common_length(old, new)
+    suffix = _common_length(old[start:], new[start:], reverse=True)
+    return start, len(old) - suffix, len(new) - suffix
+
+
+def tokenize_xml_ranges(content, first_line=1):
+    """Tokenise le XML et regroupe les index « ligne.colonne » par tag, prêts pour un tag_add groupé"""
+    starts = LineIndex(content, first_line).starts
+    last_row = len(starts) - 1
+    ranges = {tag: [] for tag in HIGHLIGHT_TAGS}
+    
+    # Les segments sont produits dans l'ordre du texte : la ligne courante ne fait qu'avancer
+    row = 0
+    for tag, start, end in tokenize_xml(content):
+        indices = ranges[tag]
+        for offset in (start, end):
+            while row < last_row and starts[row + 1] <= offset:
+                row += 1
+            indices.append(f"{first_line + row}.{offset - starts[row]}")
+    return ranges
+
+
+_COMPLETION_TAG_RE = re.compile(r'<([\w:-]*)$')
+# Les valeurs s'écrivent entre guillemets ou apostrophes (cmd='"%SOFTWARE%\..." /S') : la valeur
+# en cours de saisie peut contenir l'autre délimiteur
+_COMPLETION_ATTRIBUTE_RE = re.compile(r'''<([\w:-]+)(?:\s+[\w:-]+\s*=\s*(?:"[^"]*"|'[^']*'))*\s+([\w:-]*)$''')
+_COMPLETION_VALUE_RE = re.compile(
+    r'''<([\w:-]+)(?:\s+[\w:-]+\s*=\s*(?:"[^"]*"|'[^']*'))*\s+([\w:-]+)\s*=\s*(["'])((?:(?!\3)[\s\S])*)$''')
+
+
+class CompletionTrie:
+    """Trie de préfixes immuable donnant les valeurs les plus fréquentes pour un préfixe
+
+    Chaque nœud garde ses COMPLETION_LIMIT meilleures valeurs, déjà classées ; un sous-arbre de
+    moins de COMPLETION_BUCKET valeurs reste une simple liste, filtrée à la demande. La recherche
+    coûte ainsi au plus len(préfixe) accès de dictionnaire et un filtrage borné.
+    """
+    __slots__ = ("root", "size")
+    
+    def __init__(self, counts=None):
+        # Classement par fréquence décroissante puis ordre alphabétique
+        ranked = sorted((counts or {}).items(), key=lambda item: (-item[1], item[0]))
+        self.size = len(ranked)
+        self.root = self._build([value for value, count in ranked], 0)
+    
+    def __len__(self):
+        return self.size
+    
+    @classmethod
+    def _build(cls, values, depth):
+        # Nœud : (enfants par caractère, valeurs classées) ; enfants à None pour une feuille
+        if len(values) <= COMPLETION_BUCKET:
+            return None, values
+        children = {}
+        for value in values:
+            if len(value) > depth:
+                children.setdefault(value[depth], []).append(value)
+        return {char: cls._build(group, depth + 1) for char, group in children.items()}, values[:COMPLETION_LIMIT]
+    
+    def complete(self, prefix, limit=COMPLETION_LIMIT):
+        """Valeurs commençant par `prefix`, les plus fréquentes d'abord"""
+        children, values = self.root
+        for char in prefix:
+            if children is None:
+                break
+            node = children.get(char)
+            if node is None:
+                return []
+            children, values = node
+        else:
+            if children is not None:
+                return values[:limit]
+        return [value for value in values if value.startswith(prefix)][:limit]
+
+
+class CompletionIndex:
+    """Balises, attributs et valeurs d'attributs proposés à la complétion, par fréquence"""
+    def __init__(self, tag_counts=None, attribute_counts=None, value_counts=None):
+        self.tags = CompletionTrie(tag_counts)
+        self.attributes = {tag: CompletionTrie(counts) for tag, counts in (attribute_counts or {}).items()}
+        self.values = {key: CompletionTrie(counts) for key, counts in (value_counts or {}).items()}
+    
+    @classmethod
+    def from_files(cls, file_paths, builtin_tags=(), builtin_attributes=None):
+        """Construit l'index à partir de paquets existants et des balises/attributs WPKG connus"""
+        tag_counts = Counter(builtin_tags)
+        attribute_counts = {tag: Counter(names) for tag, names in (builtin_attributes or {}).items()}
+        value_counts = {}
+        
+        for file_path in file_paths:
+            try:
+                for event, element in ET.iterparse(file_path):
+                    tag_counts[element.tag] += 1
+                    names = attribute_counts.setdefault(element.tag, Counter())
+                    for name, value in element.attrib.items():
+                        names[name] += 1
+                        values = value_counts.setdefault((element.tag, name), Counter())
+                        values[value] += 1
+                        if name in COMPLETION_PATH_ATTRIBUTES:
+                            # Préfixes de chemin : « %SOFTWARE%\ », « %SOFTWARE%\app\ »...
+                            for end in (match.end() for match in re.finditer(r"\\", value)):
+                                if end < len(value):
+                                    values[value[:end]] += 1
+                    element.clear()
+            except (ET.ParseError, OSError):
+                continue
+        
+        return cls(tag_counts, attribute_counts, value_counts)
+    
+    @classmethod
+    def from_folder(cls, folder, builtin_tags=(), builtin_attributes=None):
+        file_paths = [
+            os.path.join(directory, filename)
+            for directory, dirnames, filenames in os.walk(folder)
+            for filename in filenames
+            if filename.lower().endswith(FOLDER_SEARCH_EXTENSIONS)
+        ]
+        return cls.from_files(file_paths, builtin_tags, builtin_attributes)
+    
+    def complete_tag(self, prefix):
+        return self.tags.complete(prefix)
+    
+    def complete_attribute(self, tag, prefix):
+        trie = self.attributes.get(tag)
+        return trie.complete(prefix) if trie is not None else []
+    
+    def complete_value(self, tag, attribute, prefix):
+        trie = self.values.get((tag, attribute))
+        return trie.complete(prefix) if trie is not None else []
 
 
 class XmlTextWithLineNumbers(tk.Frame):
     """Widget Text avec numéros de ligne et coloration syntaxique pour XML avec complétion"""
+    
+    lazy_threshold = LAZY_HIGHLIGHT_THRESHOLD
+    async_threshold = ASYNC_HIGHLIGHT_THRESHOLD
+    
     def __init__(self, master, *args, **kwargs):
         tk.Frame.__init__(self, master)
         self.text = tk.Text(self, wrap="none", *args, **kwargs)
         self.vsb = ttk.Scrollbar(self, orient="vertical", command=self.text.yview)
         self.hsb = ttk.Scrollbar(self, orient="horizontal", command=self.text.xview)
-        self.text.configure(yscrollcommand=self.vsb.set, xscrollcommand=self.hsb.set)
+        self.text.configure(yscrollcommand=self._on_yscroll, xscrollcommand=self.hsb.set)
         self.text.grid(row=0, column=1, sticky="nsew")
         self.vsb.grid(row=0, column=2, sticky="ns")
         self.hsb.grid(row=1, column=1, sticky="ew")
@@ -106,10 +540,52 @@ class XmlTextWithLineNumbers(tk.Frame):
             "exit": ["code"]
         }
         
+        # Index de complétion, remplacé par celui du dépôt une fois son analyse terminée
+        self.completion_index = CompletionIndex.from_files([], self.wpkg_tags, self.wpkg_attributes)
+        self._completion_folder = None
+        # Fonction donnant les noms de variables proposés dans les références %NOM%
+        self.variable_names = None
+        
+        # Région modifiée en attente de recoloration (première et dernière ligne)
+        self._dirty_lines = None
+        # Première ligne visible suivie pendant une série de modifications (voir frozen)
+        self._frozen_top = None
+        self._key_press_state = None
+        
+        # Observateurs : edit_listeners(first, last, delta) reçoit les lignes [first, last]
+        # qui remplacent les anciennes lignes [first, last - delta] ; scroll_listeners() le défilement
+        self.edit_listeners = []
+        self.scroll_listeners = []
+        
+        # Coloration différée : seules les lignes de la fenêtre colorée portent des tags
+        self.lazy_highlighting = False
+        self._highlighted_window = None
+        self._viewport_pending = False
+        
+        # Tokenisation en arrière-plan : chaque modification du texte incrémente la
+        # génération, les résultats d'une génération antérieure sont abandonnés
+        self._tokenizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wpkg-tokenizer")
+        self._generation = 0
+        self._highlight_results = queue.Queue()
+        self._pending_jobs = 0
+        self._applying = None
+        self._drain_job = None
+        self._stale_lines = None
+        self._retry_job = None
+        
+        # Numéros de ligne : éléments du canevas réutilisés et (numéro, y) affiché par chacun
+        self._gutter_items = []
+        self._gutter_state = []
+        self._gutter_job = None
+        self._gutter_digit_width = tkfont.Font(font=GUTTER_FONT).measure("0")
+        self.gutter_stats = {"redraws": 0, "total_ms": 0.0, "max_ms": 0.0}
+        
         # Bind des événements pour autocomplétion et coloration
+        self.text.bind("<KeyPress>", self.on_key_press)
         self.text.bind("<KeyRelease>", self.on_key_release)
         self.text.bind("<Tab>", self.handle_tab)
         self.text.bind("<less>", self.on_less_than)
+        self.text.bind("<percent>", self.on_percent)
         self.text.bind("<space>", self.on_space)
         
         # Mettre à jour les numéros de ligne quand le contenu change
@@ -120,32 +596,152 @@ class XmlTextWithLineNumbers(tk.Frame):
         self._update_line_numbers()
     
     def _on_text_modified(self, event=None):
-        self._update_line_numbers()
+        self._schedule_line_numbers()
         self.text.edit_modified(False)
     
     def _on_text_configure(self, event=None):
-        self._update_line_numbers()
-    
-    def _update_line_numbers(self):
-        self.linenumbers.delete("all")
-        i = self.text.index("@0,0")
-        while True:
-            dline = self.text.dlineinfo(i)
+        self._schedule_line_numbers()
+        if self.lazy_highlighting:
+            self._schedule_viewport_highlight()
+    
+    def _on_yscroll(self, first, last):
+        self.vsb.set(first, last)
+        self._schedule_line_numbers()
+        for listener in self.scroll_listeners:
+            listener()
+        if self.lazy_highlighting:
+            self._schedule_viewport_highlight()
+    
+    def _schedule_line_numbers(self):
+        """Regroupe les mises à jour des numéros de ligne : au plus une par image"""
+        if self._gutter_job is None:
+            self._gutter_job = self.after(GUTTER_FRAME_MS, self._update_line_numbers)
+    
+    def _visible_lines(self):
+        """Liste des (numéro de ligne, y) affichés dans la zone visible"""
+        first = self._line_of("@0,0")
+        last = self._line_of(f"@0,{self.text.winfo_height()}")
+        first_info = self.text.dlineinfo(f"{first}.0")
+        last_info = self.text.dlineinfo(f"{last}.0")
+        if first_info is None:
+            return []
+        
+        # Hauteur de ligne uniforme : positions calculées sans interroger chaque ligne
+        height = first_info[3]
+        if last_info is not None and last_info[3] == height and \
+                last_info[1] - first_info[1] == (last - first) * height:
+            return [(line, first_info[1] + (line - first) * height) for line in range(first, last + 1)]
+        
+        visible = []
+        for line in range(first, last + 1):
+            dline = self.text.dlineinfo(f"{line}.0")
             if dline is None:
                 break
-            y = dline[1]
-            linenum = str(i).split(".")[0]
-            self.linenumbers.create_text(2, y, anchor="nw", text=linenum, font=("Courier", 10))
-            i = self.text.index(f"{i}+1line")
+            visible.append((line, dline[1]))
+        return visible
+    
+    def _update_line_numbers(self):
+        """Met à jour les numéros de ligne en ne modifiant que les éléments qui ont changé"""
+        self._gutter_job = None
+        started = time.perf_counter()
+        canvas = self.linenumbers
+        visible = self._visible_lines()
+        
+        # Élargir la gouttière pour les grands numéros de ligne
+        if visible:
+            width = self._gutter_digit_width * len(str(visible[-1][0])) + 6
+            if width > int(canvas.cget("width")):
+                canvas.configure(width=width)
+        
+        for slot, (line, y) in enumerate(visible):
+            if slot == len(self._gutter_items):
+                self._gutter_items.append(canvas.create_text(2, y, anchor="nw", text=str(line), font=GUTTER_FONT))
+                self._gutter_state.append((line, y))
+                continue
+            
+            item = self._gutter_items[slot]
+            shown = self._gutter_state[slot]
+            if shown is None:
+                canvas.itemconfigure(item, text=str(line), state="normal")
+                canvas.coords(item, 2, y)
+            else:
+                if shown[0] != line:
+                    canvas.itemconfigure(item, text=str(line))
+                if shown[1] != y:
+                    canvas.coords(item, 2, y)
+            self._gutter_state[slot] = (line, y)
+        
+        # Masquer les éléments en trop plutôt que de les détruire
+        for slot in range(len(visible), len(self._gutter_items)):
+            if self._gutter_state[slot] is not None:
+                canvas.itemconfigure(self._gutter_items[slot], state="hidden")
+                self._gutter_state[slot] = None
+        
+        elapsed = (time.perf_counter() - started) * 1000
+        self.gutter_stats["redraws"] += 1
+        self.gutter_stats["total_ms"] += elapsed
+        self.gutter_stats["max_ms"] = max(self.gutter_stats["max_ms"], elapsed)
     
     def get(self, *args, **kwargs):
         return self.text.get(*args, **kwargs)
     
-    def delete(self, *args, **kwargs):
-        return self.text.delete(*args, **kwargs)
-    
-    def insert(self, *args, **kwargs):
-        return self.text.insert(*args, **kwargs)
+    def delete(self, index1, index2=None):
+        first = self._line_of(index1)
+        last = self._line_of(index2 if index2 is not None else f"{index1}+1c")
+        result = self.text.delete(index1, index2)
+        self._generation += 1
+        self._shift_dirty(last, first - last)
+        self.mark_dirty(first)
+        self._notify_edit(first, first, first - last)
+        return result
+    
+    def insert(self, index, chars, *args):
+        first = self._line_of(index)
+        added = chars.count("\n")
+        result = self.text.insert(index, chars, *args)
+        self._generation += 1
+        self._shift_dirty(first, added)
+        self.mark_dirty(first, first + added)
+        self._notify_edit(first, first + added, added)
+        return result
+    
+    @contextmanager
+    def frozen(self):
+        """Regroupe une série de modifications : vue conservée et une seule recoloration à la fin
+        
+        La première ligne visible reste la même ligne du document, décalée des lignes ajoutées
+        ou retirées au-dessus d'elle ; les lignes modifiées sont recolorées à la sortie.
+        """
+        if self._frozen_top is not None:
+            yield
+            return
+        top = self._frozen_top = self._line_of("@0,0")
+        try:
+            yield
+        finally:
+            top, self._frozen_top = self._frozen_top, None
+            if self._line_of("@0,0") != top:
+                self.text.yview(f"{top}.0")
+            self.highlight_dirty()
+    
+    def patch_text(self, content):
+        """Remplace le document par `content` en ne réécrivant que la plage qui diffère"""
+        old = self.text.get("1.0", "end-1c")
+        start, old_end, new_end = changed_range(old, content)
+        if start == old_end == new_end:
+            return
+        
+        lines = LineIndex(old)
+        index = lines.index(start)
+        with self.frozen():
+            if old_end > start:
+                self.delete(index, lines.index(old_end))
+            if new_end > start:
+                self.insert(index, content[start:new_end])
+            
+            # Le document a franchi le seuil de coloration différée : tout recolorer
+            if (self._char_count() > self.lazy_threshold) != self.lazy_highlighting:
+                self.highlight_syntax()
     
     def mark_set(self, *args, **kwargs):
         return self.text.mark_set(*args, **kwargs)
@@ -163,53 +759,272 @@ class XmlTextWithLineNumbers(tk.Frame):
         for tag in ["tag", "attribute", "attributevalue", "comment", "xml_declaration", "error", "completion"]:
             self.text.tag_remove(tag, "1.0", "end")
     
+    def _line_of(self, index):
+        """Numéro de ligne d'un index Tk"""
+        return int(self.text.index(index).split(".")[0])
+    
+    def _line_count(self):
+        return self._line_of("end-1c")
+    
+    def _notify_edit(self, first, last, delta):
+        if self._frozen_top is not None and first < self._frozen_top:
+            if delta >= 0:
+                self._frozen_top += delta
+            else:
+                self._frozen_top -= min(last - delta, self._frozen_top) - first
+        for listener in self.edit_listeners:
+            listener(first, last, delta)
+    
+    def mark_dirty(self, first_line, last_line=None):
+        """Ajoute une plage de lignes à la région à recolorer"""
+        if last_line is None:
+            last_line = first_line
+        if self._dirty_lines is not None:
+            first_line = min(first_line, self._dirty_lines[0])
+            last_line = max(last_line, self._dirty_lines[1])
+        self._dirty_lines = (first_line, last_line)
+    
+    def _shift_dirty(self, after_line, delta):
+        """Décale la région en attente après une insertion ou suppression de lignes"""
+        if self._dirty_lines is None or delta == 0:
+            return
+        first, last = self._dirty_lines
+        if first > after_line:
+            first += delta
+        if last > after_line:
+            last += delta
+        self._dirty_lines = (first, last)
+    
+    def _char_count(self):
+        """Nombre de caractères du document"""
+        count = self.text.count("1.0", "end-1c", "chars") or 0
+        if isinstance(count, tuple):
+            count = count[0]
+        return count
+    
     def highlight_syntax(self):
-        """Applique la coloration syntaxique au code XML"""
-        self.clear_highlighting()
-        content = self.text.get("1.0", "end-1c")
-        
-        # Mise en évidence des déclarations XML
-        for match in re.finditer(r'<\?xml[^>]*\?>', content):
-            start_idx = f"1.0 + {match.start()} chars"
-            end_idx = f"1.0 + {match.end()} chars"
-            self.text.tag_add("xml_declaration", start_idx, end_idx)
-        
-        # Mise en évidence des commentaires
-        for match in re.finditer(r'<!--(.*?)-->', content, re.DOTALL):
-            start_idx = f"1.0 + {match.start()} chars"
-            end_idx = f"1.0 + {match.end()} chars"
-            self.text.tag_add("comment", start_idx, end_idx)
-        
-        # Mise en évidence des balises
-        for match in re.finditer(r'<[^>]*>', content):
-            tag_text = match.group()
-            start_idx = f"1.0 + {match.start()} chars"
-            end_idx = f"1.0 + {match.end()} chars"
-            
-            # Highlighting des noms de balises
-            tag_match = re.search(r'</?([a-zA-Z0-9_:-]+)', tag_text)
-            if tag_match:
-                tag_start = match.start() + tag_match.start(1)
-                tag_end = match.start() + tag_match.end(1)
-                tag_start_idx = f"1.0 + {tag_start} chars"
-                tag_end_idx = f"1.0 + {tag_end} chars"
-                self.text.tag_add("tag", tag_start_idx, tag_end_idx)
-            
-            # Highlighting des attributs et leurs valeurs
-            for attr_match in re.finditer(r'([a-zA-Z0-9_:-]+)(\s*=\s*)(["\'](.*?)["\'])', tag_text):
-                # Nom d'attribut
-                attr_start = match.start() + attr_match.start(1)
-                attr_end = match.start() + attr_match.end(1)
-                attr_start_idx = f"1.0 + {attr_start} chars"
-                attr_end_idx = f"1.0 + {attr_end} chars"
-                self.text.tag_add("attribute", attr_start_idx, attr_end_idx)
-                
-                # Valeur d'attribut
-                val_start = match.start() + attr_match.start(3)
-                val_end = match.start() + attr_match.end(3)
-                val_start_idx = f"1.0 + {val_start} chars"
-                val_end_idx = f"1.0 + {val_end} chars"
-                self.text.tag_add("attributevalue", val_start_idx, val_end_idx)
+        """Applique la coloration syntaxique au code XML (zone visible seulement pour les gros fichiers)"""
+        self._dirty_lines = None
+        self.lazy_highlighting = self._char_count() > self.lazy_threshold
+        
+        if self.lazy_highlighting:
+            self._highlighted_window = None
+            self._highlight_viewport()
+        else:
+            self._highlight_range("1.0", "end-1c", expand=False)
+    
+    def highlight_dirty(self):
+        """Recolore uniquement les lignes modifiées depuis la dernière coloration"""
+        if self._dirty_lines is None or self._frozen_top is not None:
+            return
+        first, last = self._dirty_lines
+        self._dirty_lines = None
+        
+        # En mode différé, une modification hors de la fenêtre colorée la déplace
+        if self.lazy_highlighting:
+            window = self._highlighted_window
+            if window is None or first < window[0] or last > window[1]:
+                self._highlighted_window = None
+                self._highlight_viewport()
+                return
+        
+        self._highlight_range(f"{first}.0", f"{last}.0 lineend")
+    
+    def _schedule_viewport_highlight(self):
+        """Regroupe les demandes de coloration de la zone visible (défilement rapide)"""
+        if not self._viewport_pending:
+            self._viewport_pending = True
+            self.after_idle(self._highlight_viewport)
+    
+    def _highlight_viewport(self):
+        """Colore la zone visible et une marge si elle sort de la fenêtre déjà colorée"""
+        self._viewport_pending = False
+        first = self._line_of("@0,0")
+        last = self._line_of(f"@0,{self.text.winfo_height()}")
+        wanted = (max(1, first - VIEWPORT_MARGIN_LINES), last + VIEWPORT_MARGIN_LINES)
+        
+        window = self._highlighted_window
+        if window is not None and window[0] <= first and last <= window[1]:
+            return
+        
+        # Libérer les tags de l'ancienne fenêtre avant de colorer la nouvelle
+        for tag in HIGHLIGHT_TAGS:
+            self.text.tag_remove(tag, "1.0", "end")
+        self._highlighted_window = wanted
+        self._highlight_range(f"{wanted[0]}.0", f"{wanted[1]}.0 lineend")
+    
+    def _expand_region(self, start, end):
+        """Étend la région aux commentaires et balises multilignes qui la chevauchent"""
+        text = self.text
+        
+        # Début : commentaire ouvert avant la région (connu par ses tags, sauf en mode différé)
+        if self.lazy_highlighting:
+            marker = text.search(r"<!--|-->", start, "1.0", backwards=True, regexp=True)
+            if marker and text.get(marker, f"{marker}+4c") == "<!--":
+                start = marker
+        else:
+            comment = text.tag_prevrange("comment", start)
+            if comment and text.compare(comment[1], ">", start):
+                start = comment[0]
+        open_tag = text.search("<", start, "1.0", backwards=True)
+        if open_tag and not text.search(">", open_tag, start):
+            start = open_tag
+        
+        # Fin : commentaire coloré qui déborde ou balise refermée plus loin
+        comment = text.tag_prevrange("comment", end)
+        if comment and text.compare(comment[1], ">", end):
+            end = comment[1]
+        close_tag = text.search(">", end, "end")
+        if close_tag and not text.search("<", end, close_tag):
+            end = f"{close_tag}+1c"
+        
+        return text.index(f"{start} linestart"), text.index(f"{end} lineend")
+    
+    def _highlight_range(self, start, end, expand=True):
+        """Re-tokenise et recolore le texte compris entre deux index"""
+        if expand:
+            start, end = self._expand_region(start, end)
+        else:
+            start, end = self.text.index(start), self.text.index(end)
+        content = self.text.get(start, end)
+        
+        # Commentaire ouvert dans la région : il se poursuit jusqu'à sa fermeture
+        if content.rfind("<!--") > content.rfind("-->"):
+            close = self.text.search("-->", end, "end")
+            end = self.text.index(f"{close}+3c lineend" if close else "end-1c")
+            content = self.text.get(start, end)
+        
+        # La région commence toujours en début de ligne : les index sont calculés
+        # directement, sans faire parcourir le texte à Tk, puis appliqués en un appel par tag
+        first_line = int(start.split(".")[0])
+        if len(content) > self.async_threshold:
+            self._submit_highlight(start, end, content, first_line)
+            return
+        
+        for tag in HIGHLIGHT_TAGS:
+            self.text.tag_remove(tag, start, end)
+        for tag, indices in tokenize_xml_ranges(content, first_line).items():
+            if indices:
+                self.text.tag_add(tag, *indices)
+    
+    def _submit_highlight(self, start, end, content, first_line, on_tokenized=None):
+        """Confie la tokenisation d'une grande région au thread de travail
+        
+        `on_tokenized(spans)` est appelé avec le résultat dans la boucle Tk, à sa relève.
+        """
+        generation = self._generation
+        
+        def tokenize():
+            # Aucun accès à Tk ici : le résultat immuable repasse par la file, même en cas
+            # d'échec (spans None), pour que le nombre de tâches en cours redescende
+            spans = None
+            try:
+                ranges = tokenize_xml_ranges(content, first_line)
+                spans = tuple((tag, tuple(indices)) for tag, indices in ranges.items() if indices)
+            finally:
+                self._highlight_results.put((generation, start, end, spans, on_tokenized))
+        
+        self._pending_jobs += 1
+        self._tokenizer.submit(tokenize)
+        self._schedule_drain()
+    
+    def _schedule_drain(self):
+        if self._drain_job is None:
+            self._drain_job = self.after(10, self._drain_highlight_results)
+    
+    def set_content(self, content, spans=None, on_tokenized=None):
+        """Remplace tout le texte par `content` et le colore
+        
+        `spans` est une tokenisation de tout `content` déjà faite (voir _submit_highlight) :
+        elle est appliquée sans re-tokeniser. Sinon le texte est tokenisé sur le thread de
+        travail et le résultat transmis à `on_tokenized`, pour une prochaine ouverture.
+        """
+        self.delete("1.0", tk.END)
+        self.insert(tk.END, content)
+        self._dirty_lines = None
+        self.lazy_highlighting = self._char_count() > self.lazy_threshold
+        if self.lazy_highlighting:
+            # Seule la zone visible est colorée : une tokenisation complète ne servirait pas
+            self._highlighted_window = None
+            self._highlight_viewport()
+            return
+        
+        end = self.text.index("end-1c")
+        if spans is None:
+            self._submit_highlight("1.0", end, content, 1, on_tokenized)
+        else:
+            self._pending_jobs += 1
+            self._highlight_results.put((self._generation, "1.0", end, spans, None))
+            self._schedule_drain()
+    
+    def _drain_highlight_results(self):
+        """Applique les résultats de tokenisation par tranches de durée bornée"""
+        self._drain_job = None
+        deadline = time.perf_counter() + HIGHLIGHT_SLICE_MS / 1000
+        
+        while time.perf_counter() < deadline:
+            if self._applying is None:
+                try:
+                    generation, start, end, spans, on_tokenized = self._highlight_results.get_nowait()
+                except queue.Empty:
+                    break
+                self._pending_jobs -= 1
+                if spans is None:
+                    # Échec de la tokenisation : la région reste sans coloration
+                    continue
+                if on_tokenized is not None:
+                    on_tokenized(spans)
+                if generation != self._generation:
+                    self._mark_stale(start, end)
+                    continue
+                for tag in HIGHLIGHT_TAGS:
+                    self.text.tag_remove(tag, start, end)
+                chunks = (
+                    (tag, *indices[i:i + HIGHLIGHT_CHUNK_SIZE])
+                    for tag, indices in spans
+                    for i in range(0, len(indices), HIGHLIGHT_CHUNK_SIZE)
+                )
+                self._applying = (generation, start, end, chunks)
+            
+            generation, start, end, chunks = self._applying
+            if generation != self._generation:
+                # Le texte a changé pendant l'application : reprendre plus tard
+                self._applying = None
+                self._mark_stale(start, end)
+                continue
+            chunk = next(chunks, None)
+            if chunk is None:
+                self._applying = None
+            else:
+                self.text.tag_add(*chunk)
+        
+        if self._applying is not None or self._pending_jobs > 0:
+            self._drain_job = self.after(1 if self._applying is not None else 10, self._drain_highlight_results)
+    
+    def _mark_stale(self, start, end):
+        """Reprogramme la coloration d'une région dont le résultat est obsolète"""
+        first, last = int(start.split(".")[0]), int(end.split(".")[0])
+        if self._stale_lines is not None:
+            first, last = min(first, self._stale_lines[0]), max(last, self._stale_lines[1])
+        self._stale_lines = (first, last)
+        
+        if self._retry_job is not None:
+            self.after_cancel(self._retry_job)
+        self._retry_job = self.after(HIGHLIGHT_RETRY_MS, self._retry_stale)
+    
+    def _retry_stale(self):
+        self._retry_job = None
+        if self._stale_lines is not None:
+            self.mark_dirty(*self._stale_lines)
+            self._stale_lines = None
+            self.highlight_dirty()
+    
+    def destroy(self):
+        for job in (self._drain_job, self._retry_job, self._gutter_job):
+            if job is not None:
+                self.after_cancel(job)
+        self._tokenizer.shutdown(wait=False, cancel_futures=True)
+        tk.Frame.destroy(self)
     
     def highlight_error(self, line_number):
         """Surligne une ligne contenant une erreur"""
@@ -218,16 +1033,43 @@ class XmlTextWithLineNumbers(tk.Frame):
         self.text.tag_add("error", start_idx, end_idx)
         self.text.see(start_idx)  # Faire défiler pour voir l'erreur
     
+    def on_key_press(self, event):
+        """Mémorise la ligne du curseur et le nombre de lignes avant la modification"""
+        if self._key_press_state is None:
+            self._key_press_state = (self._line_of(tk.INSERT), self._line_count())
+        if event.keysym not in NAVIGATION_KEYS:
+            self._generation += 1
+    
     def on_key_release(self, event):
-        """Mise à jour de la coloration syntaxique lors de la frappe"""
-        if event.keysym not in ('Tab', 'less', 'space'):  # Éviter les duplications
-            self.highlight_syntax()
+        """Mise à jour de la coloration syntaxique des seules lignes touchées par la frappe"""
+        first = self._line_of(tk.INSERT)
+        last = first
+        delta = 0
+        if self._key_press_state is not None:
+            press_line, press_count = self._key_press_state
+            first, last = min(first, press_line), max(last, press_line)
+            delta = self._line_count() - press_count
+            self._key_press_state = None
+        
+        if event.keysym not in NAVIGATION_KEYS:
+            self.mark_dirty(first, last)
+            self._notify_edit(first, last, delta)
+        self.highlight_dirty()
     
     def on_less_than(self, event):
         """Gestion de l'autocomplétion lors de la frappe de <"""
-        self.text.insert(tk.INSERT, "<")
+        self.insert(tk.INSERT, "<")
         return "break"  # Empêche l'insertion du < par défaut
     
+    def on_percent(self, event):
+        """Propose les variables connues à l'ouverture d'une référence %NOM% dans cmd ou path"""
+        self.insert(tk.INSERT, "%")
+        pos = self.text.index(tk.INSERT)
+        context = self.completion_context(pos)
+        if context is not None and context[2] == "%" and context[0]:
+            self.show_completion_menu(context[0], pos, "", "%")
+        return "break"
+    
     def on_space(self, event):
         """Gestion de l'autocomplétion des attributs après un espace dans une balise"""
         # Obtenir la position actuelle
@@ -239,67 +1081,82 @@ class XmlTextWithLineNumbers(tk.Frame):
             tag_match = re.search(r'<([a-zA-Z0-9_:-]+)', line)
             if tag_match and tag_match.group(1) in self.wpkg_attributes:
                 # Insérer un espace normal
-                self.text.insert(tk.INSERT, " ")
+                self.insert(tk.INSERT, " ")
                 return "break"
         # Comportement par défaut
         return None
     
+    def scan_completions(self, folder):
+        """Analyse en arrière-plan les paquets de `folder` pour enrichir la complétion"""
+        folder = os.path.abspath(folder)
+        if folder == self._completion_folder:
+            return
+        self._completion_folder = folder
+        
+        def scan():
+            index = CompletionIndex.from_folder(folder, self.wpkg_tags, self.wpkg_attributes)
+            # Remplacement d'une seule référence : sans danger depuis le thread d'analyse
+            if folder == self._completion_folder:
+                self.completion_index = index
+        
+        threading.Thread(target=scan, daemon=True).start()
+    
+    def completion_context(self, pos):
+        """Détermine ce qui est complété au curseur : (suggestions, préfixe, suffixe) ou None"""
+        start = self.text.search("<", pos, f"{pos} linestart - {COMPLETION_CONTEXT_LINES} lines", backwards=True)
+        if not start:
+            return None
+        before = self.text.get(start, pos)
+        index = self.completion_index
+        
+        # Valeur d'attribut, nom d'attribut ou nom de balise, du plus spécifique au plus général
+        match = _COMPLETION_VALUE_RE.search(before)
+        if match:
+            tag, attribute, quote, prefix = match.groups()
+            if attribute in COMPLETION_PATH_ATTRIBUTES and prefix.count("%") % 2 and self.variable_names:
+                # Référence %NOM% ouverte : compléter le nom de variable et fermer la référence
+                reference = prefix[prefix.rfind("%") + 1:].upper()
+                names = [name for name in self.variable_names() if name.upper().startswith(reference)]
+                return names, prefix[prefix.rfind("%") + 1:], "%"
+            if attribute in COMPLETION_PATH_ATTRIBUTES:
+                # Les suggestions peuvent être des préfixes de chemin : la valeur reste ouverte
+                return index.complete_value(tag, attribute, prefix), prefix, ""
+            return index.complete_value(tag, attribute, prefix), prefix, quote
+        match = _COMPLETION_ATTRIBUTE_RE.search(before)
+        if match:
+            tag, prefix = match.groups()
+            return index.complete_attribute(tag, prefix), prefix, '="'
+        match = _COMPLETION_TAG_RE.search(before)
+        if match:
+            prefix = match.group(1)
+            return index.complete_tag(prefix), prefix, " "
+        return None
+    
     def handle_tab(self, event):
         """Gestion de l'autocomplétion avec Tab"""
-        # Obtenir la position actuelle
         pos = self.text.index(tk.INSERT)
-        
-        # Vérifier si nous sommes dans une balise ouvrante
-        line = self.text.get(f"{pos} linestart", f"{pos} lineend")
-        current_pos_in_line = int(pos.split('.')[1])
-        
-        # Si nous sommes après un <, suggérer des balises
-        if "<" in line and ">" not in line[line.rfind("<"):]:
-            prefix = line[line.rfind("<")+1:current_pos_in_line]
-            
-            # Filtrer les balises correspondant au préfixe
-            matches = [tag for tag in self.wpkg_tags if tag.startswith(prefix)]
-            
-            if len(matches) == 1:
-                # Une seule correspondance, remplacer directement
-                self.text.delete(f"{pos} linestart+{line.rfind('<')+1}c", pos)
-                self.text.insert(tk.INSERT, matches[0])
-                self.text.insert(tk.INSERT, " ")  # Espace pour attributs
-            elif len(matches) > 1:
-                # Afficher un menu de suggestions
-                self.show_completion_menu(matches, pos, prefix)
-        
-        # Si nous sommes dans une balise et après un espace, suggérer des attributs
-        elif re.search(r'<[a-zA-Z0-9_:-]+\s+[^>]*$', line[:current_pos_in_line]):
-            tag_match = re.search(r'<([a-zA-Z0-9_:-]+)', line)
-            if tag_match and tag_match.group(1) in self.wpkg_attributes:
-                # Trouver le dernier mot (attribut potentiel)
-                last_word_match = re.search(r'[a-zA-Z0-9_:-]*$', line[:current_pos_in_line])
-                if last_word_match:
-                    prefix = last_word_match.group(0)
-                    attributes = self.wpkg_attributes[tag_match.group(1)]
-                    # Filtrer les attributs correspondant au préfixe
-                    matches = [attr for attr in attributes if attr.startswith(prefix)]
-                    
-                    if len(matches) == 1:
-                        # Une seule correspondance, remplacer directement
-                        self.text.delete(f"{pos} linestart+{current_pos_in_line-len(prefix)}c", pos)
-                        self.text.insert(tk.INSERT, matches[0])
-                        self.text.insert(tk.INSERT, '="')  # Préparer pour la valeur
-                    elif len(matches) > 1:
-                        # Afficher un menu de suggestions
-                        self.show_completion_menu(matches, pos, prefix)
+        context = self.completion_context(pos)
+        if context is None:
+            return "break"  # Empêche le comportement par défaut de Tab
+        
+        matches, prefix, suffix = context
+        if len(matches) == 1:
+            # Une seule correspondance, remplacer directement
+            self.apply_completion(matches[0], pos, prefix, suffix)
+        elif len(matches) > 1:
+            # Afficher un menu de suggestions
+            self.show_completion_menu(matches, pos, prefix, suffix)
         
         return "break"  # Empêche le comportement par défaut de Tab
     
-    def show_completion_menu(self, options, pos, prefix):
+    def show_completion_menu(self, options, pos, prefix, suffix=""):
         """Affiche un menu contextuel avec les options d'autocomplétion"""
         m = tk.Menu(self, tearoff=0)
         
         for option in options:
             m.add_command(
                 label=option,
-                command=lambda opt=option: self.apply_completion(opt, pos, prefix)
+                command=lambda opt=option: self.apply_completion(opt, pos, prefix, suffix)
             )
         
         try:
@@ -313,26 +1170,13 @@ class XmlTextWithLineNumbers(tk.Frame):
             # En cas d'erreur, afficher en position actuelle de la souris
             m.post(self.winfo_pointerx(), self.winfo_pointery())
     
-    def apply_completion(self, option, pos, prefix):
+    def apply_completion(self, option, pos, prefix, suffix=""):
         """Applique l'option d'autocomplétion sélectionnée"""
-        # Supprimer le préfixe
-        current_pos_in_line = int(pos.split('.')[1])
-        line = self.text.get(f"{pos} linestart", f"{pos} lineend")
+        # Remplacer le préfixe saisi par l'option, suivie de ce qui prépare la saisie suivante
+        self.delete(f"{pos}-{len(prefix)}c", pos)
+        self.insert(tk.INSERT, option + suffix)
         
-        # Déterminer si nous complétons une balise ou un attribut
-        if "<" in line and ">" not in line[line.rfind("<"):]:
-            if re.search(r'<[a-zA-Z0-9_:-]+\s+[^>]*$', line[:current_pos_in_line]):
-                # Complétion d'attribut
-                last_word_match = re.search(r'[a-zA-Z0-9_:-]*$', line[:current_pos_in_line])
-                if last_word_match:
-                    self.text.delete(f"{pos} linestart+{current_pos_in_line-len(prefix)}c", pos)
-                    self.text.insert(tk.INSERT, option)
-                    self.text.insert(tk.INSERT, '="')  # Préparer pour la valeur
-            else:
-                # Complétion de balise
-                self.text.delete(f"{pos} linestart+{line.rfind('<')+1}c", pos)
-                self.text.insert(tk.INSERT, option)
-                self.text.insert(tk.INSERT, " ")  # Espace pour attributs
+        self.highlight_dirty()
 
 
 class StatusBar(ttk.Frame):
@@ -365,9 +1209,815 @@ class StatusBar(ttk.Frame):
         self.cursor_position.config(text=f"Ligne: {line}, Col: {column}")
 
 
+def search_pattern(search_text, case_sensitive=False, whole_word=False, regex=False):
+    """Source et drapeaux de l'expression régulière correspondant aux options de recherche"""
+    pattern = search_text if regex else re.escape(search_text)
+    if whole_word:
+        pattern = rf"\b(?:{pattern})\b"
+    return pattern, 0 if case_sensitive else re.IGNORECASE
+
+
+def read_file_bytes(file_path):
+    """Contenu brut d'un fichier, projeté en mémoire (mmap) quand il n'est pas vide"""
+    with open(file_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def decode_file_text(data):
+    """Texte et encodage réel du contenu brut d'un fichier (octets ou mmap, sans copie)
+
+    Même règle que file_encoding : un fichier déclaré dans un encodage mono-octet mais écrit
+    en UTF-8 est décodé en UTF-8. Le texte n'est pas normalisé (BOM, fins de ligne) : le
+    réencoder redonne exactement le contenu du fichier.
+    """
+    encoding = declared_encoding(data)
+    if encoding in SINGLE_BYTE_ENCODINGS:
+        try:
+            return str(data, 'utf-8'), 'utf-8'
+        except UnicodeDecodeError:
+            pass
+    return str(data, encoding), encoding
+
+
+def search_file(file_path, pattern_source, flags):
+    """Recherche dans un fichier (exécuté dans un processus du pool)
+
+    Retourne (chemin, empreinte du contenu, [(ligne, colonne, extrait), ...]). La recherche
+    porte sur le texte décodé, comme dans l'éditeur : la casse et les mots entiers suivent
+    les règles Unicode (é, É) et ^ et $ s'ancrent en début et fin de ligne. La colonne est
+    en caractères.
+    """
+    data = read_file_bytes(file_path)
+    try:
+        digest = content_digest(data)
+        text, encoding = decode_file_text(data)
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+    
+    pattern = re.compile(pattern_source, flags | re.MULTILINE)
+    hits = []
+    line, last = 1, 0
+    for match in pattern.finditer(text):
+        start = match.start()
+        line += text.count("\n", last, start)
+        last = start
+        line_start = text.rfind("\n", 0, start) + 1
+        line_end = text.find("\n", start)
+        if line_end == -1:
+            line_end = len(text)
+        snippet = text[line_start:min(line_end, line_start + FOLDER_SEARCH_SNIPPET)]
+        hits.append((line, start - line_start, snippet.strip()))
+    return file_path, digest, hits
+
+
+def search_files(file_paths, pattern_source, flags):
+    """Recherche dans un lot de fichiers ; une erreur de lecture n'interrompt pas le lot"""
+    results = []
+    for file_path in file_paths:
+        try:
+            results.append(search_file(file_path, pattern_source, flags))
+        except (OSError, UnicodeError) as e:
+            results.append((file_path, None, str(e)))
+    return results
+
+
+def replace_in_file(file_path, pattern_source, flags, replacement, regex, expected_digest):
+    """Remplace toutes les occurrences d'un fichier (exécuté dans un processus du pool)
+
+    Le fichier n'est réécrit, de façon atomique, que si son contenu correspond toujours à
+    l'aperçu (`expected_digest`). Retourne (chemin, nombre de remplacements, nouvelle empreinte),
+    avec un nombre de None si le fichier a changé depuis l'aperçu.
+    """
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    if content_digest(data) != expected_digest:
+        return file_path, None, None
+    
+    # Remplacement sur le texte décodé, comme la recherche, réécrit dans l'encodage du fichier
+    text, encoding = decode_file_text(data)
+    pattern = re.compile(pattern_source, flags | re.MULTILINE)
+    if regex:
+        new_text, count = pattern.subn(replacement, text)
+    else:
+        new_text, count = pattern.subn(lambda match: replacement, text)
+    if not count:
+        return file_path, 0, expected_digest
+    new_data = new_text.encode(encoding, errors='xmlcharrefreplace')
+    atomic_write_bytes(file_path, new_data)
+    return file_path, count, content_digest(new_data)
+
+
+class FolderSearchCache:
+    """Résultats de recherche par fichier, réutilisés tant que le contenu n'a pas changé
+
+    Un fichier dont la date et la taille sont inchangées garde son empreinte ; sinon elle est
+    recalculée à la relecture. Les résultats étant indexés par (empreinte, recherche), un
+    fichier simplement touché ou restauré à l'identique n'est pas analysé de nouveau pour une
+    recherche déjà faite.
+    """
+    def __init__(self):
+        self.digests = {}
+        self.results = {}
+    
+    def lookup(self, file_path, stat, query):
+        entry = self.digests.get(file_path)
+        if entry is None:
+            return None
+        if entry[:2] != (stat.st_mtime_ns, stat.st_size):
+            with open(file_path, 'rb') as file:
+                digest = content_digest(file.read())
+            if (digest, query) not in self.results:
+                return None
+            self.digests[file_path] = (stat.st_mtime_ns, stat.st_size, digest)
+            return self.results[(digest, query)]
+        return self.results.get((entry[2], query))
+    
+    def store(self, file_path, digest, query, hits):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return
+        self.digests[file_path] = (stat.st_mtime_ns, stat.st_size, digest)
+        self.results[(digest, query)] = hits
+    
+    def digest(self, file_path):
+        entry = self.digests.get(file_path)
+        return entry[2] if entry else None
+
+
+@dataclass
+class CachedDocument:
+    """Fichier analysé : texte, analyse (sérialisée, chaque lecture en donne une copie) et tokenisation"""
+    digest: str
+    content: str
+    payload: bytes
+    # Tags et index de coloration de tout le texte (voir tokenize_xml_ranges), None si pas encore connus
+    spans: Optional[Tuple[Tuple[str, Tuple[str, ...]], ...]] = None
+    # Encodage dans lequel le fichier était réellement écrit (voir file_encoding)
+    encoding: str = "utf-8"
+    
+    def parse_result(self):
+        return pickle.loads(self.payload)
+    
+    def cost(self):
+        """Estimation de la mémoire occupée, en octets"""
+        indices = sum(len(indices) for _, indices in self.spans) if self.spans else 0
+        return sys.getsizeof(self.content) + len(self.payload) + indices * 64
+
+
+class ParseCache:
+    """Documents analysés réutilisés à la réouverture d'un fichier inchangé
+
+    Les documents sont indexés par empreinte du contenu ; un fichier dont la date et la taille
+    n'ont pas changé n'est pas même relu. Au-delà du budget mémoire, les moins récemment
+    ouverts sont oubliés. Avec `folder`, l'analyse et la tokenisation sont aussi conservées
+    sur disque et survivent au redémarrage de l'éditeur.
+    """
+    def __init__(self, budget=PARSE_CACHE_BUDGET_MB * 1_000_000, folder=None):
+        self.budget = budget
+        self.folder = folder
+        self.paths = {}
+        self.documents = OrderedDict()
+        self.stats = Counter()
+    
+    def load(self, file_path):
+        """Document de `file_path`, analysé seulement si son contenu n'est pas déjà connu"""
+        stat = os.stat(file_path)
+        entry = self.paths.get(file_path)
+        if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size) and entry[2] in self.documents:
+            self.documents.move_to_end(entry[2])
+            self.stats["memory"] += 1
+            return self.documents[entry[2]]
+        
+        with open(file_path, 'rb') as file:
+            data = file.read()
+        digest = content_digest(data)
+        document = self.documents.get(digest)
+        if document is not None:
+            self.documents.move_to_end(digest)
+            self.stats["memory"] += 1
+        else:
+            document = self._read_disk(digest, data)
+            if document is not None:
+                self.stats["disk"] += 1
+            else:
+                content, encoding, result = read_package_document(data)
+                document = CachedDocument(digest, content, pickle.dumps(result, pickle.HIGHEST_PROTOCOL),
+                                          encoding=encoding)
+                self._write_disk(document)
+                self.stats["parsed"] += 1
+            self.documents[digest] = document
+        
+        self.paths[file_path] = (stat.st_mtime_ns, stat.st_size, digest)
+        self.trim()
+        return document
+    
+    def attach_spans(self, digest, spans):
+        """Mémorise la tokenisation d'un document (depuis la boucle Tk, comme toute utilisation du cache)"""
+        document = self.documents.get(digest)
+        if document is not None and document.spans is None:
+            document.spans = spans
+            self._write_disk(document)
+    
+    def trim(self):
+        """Oublie les documents les moins récemment ouverts au-delà du budget"""
+        total = sum(document.cost() for document in self.documents.values())
+        while total > self.budget and len(self.documents) > 1:
+            _, document = self.documents.popitem(last=False)
+            total -= document.cost()
+    
+    def _disk_path(self, digest):
+        return os.path.join(self.folder, f"{digest}.json")
+    
+    def _read_disk(self, digest, data):
+        """Document conservé sur disque, None s'il est absent, d'une autre version ou illisible
+
+        Le fichier est en JSON (listes, chaînes et nombres, voir result_to_plain) : le lire ne
+        peut qu'échouer, jamais exécuter de code, contrairement à pickle.
+        """
+        if self.folder is None:
+            return None
+        path = self._disk_path(digest)
+        try:
+            with open(path, 'rb') as file:
+                version, plain, spans = json.load(file)
+            if version != PARSE_CACHE_VERSION:
+                return None
+            result = result_from_plain(plain)
+            if spans is not None:
+                spans = tuple((tag, tuple(indices)) for tag, indices in spans)
+            os.utime(path)
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
+        encoding = file_encoding(data)
+        return CachedDocument(digest, decode_package(data, encoding), pickle.dumps(result, pickle.HIGHEST_PROTOCOL),
+                              spans, encoding)
+    
+    def _write_disk(self, document):
+        """Conserve l'analyse sur disque ; le cache reste utilisable en mémoire si l'écriture échoue"""
+        if self.folder is None:
+            return
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            plain = result_to_plain(document.parse_result())
+            atomic_write_bytes(self._disk_path(document.digest), json.dumps(
+                (PARSE_CACHE_VERSION, plain, document.spans), ensure_ascii=False).encode('utf-8'))
+            
+            # Ne garder que les fichiers les plus récemment utilisés
+            entries = [entry for entry in os.scandir(self.folder) if entry.name.endswith(".json")]
+            if len(entries) > PARSE_CACHE_DISK_FILES:
+                entries.sort(key=lambda entry: entry.stat().st_mtime)
+                for entry in entries[:len(entries) - PARSE_CACHE_DISK_FILES]:
+                    os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def journal_name(file_path, owner):
+    """Nom du journal d'un document : dérivé de son chemin et propre à l'instance `owner`
+    (deux éditeurs ouverts sur le même fichier ont chacun leur journal)"""
+    if file_path is None:
+        return f"sans-titre-{owner}.journal"
+    digest = content_digest(os.path.abspath(file_path).encode('utf-8', 'surrogatepass'))
+    return f"{digest}-{owner}.journal"
+
+
+def lock_file(file):
+    """Verrou exclusif, sans attente, sur le fichier ouvert `file` ; OSError s'il est déjà pris
+
+    Le système le libère à la fin du processus, même brutale : un journal qu'on peut
+    verrouiller n'appartient plus à aucune instance ouverte.
+    """
+    if os.name == "nt":
+        import msvcrt
+        position = file.tell()
+        file.seek(JOURNAL_LOCK_OFFSET)
+        try:
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        finally:
+            file.seek(position)
+    else:
+        import fcntl
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def release_file(file):
+    """Libère le verrou de lock_file et ferme le fichier"""
+    try:
+        if os.name == "nt":
+            import msvcrt
+            file.seek(JOURNAL_LOCK_OFFSET)
+            msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    except OSError:
+        pass
+    file.close()
+
+
+def create_journal(journal_path, header):
+    """Crée le journal `journal_path`, verrouillé, avec sa ligne d'en-tête ; retourne le fichier ouvert
+
+    Hors Windows, il est écrit et verrouillé sous un nom temporaire puis renommé : une autre
+    instance ne le voit jamais sans verrou. Windows ne renomme pas un fichier ouvert.
+    """
+    temp_path = journal_path if os.name == "nt" else journal_path + ".tmp"
+    file = open(temp_path, 'wb')
+    try:
+        lock_file(file)
+        file.write(header)
+        if temp_path != journal_path:
+            os.replace(temp_path, journal_path)
+    except OSError:
+        file.close()
+        raise
+    return file
+
+
+def claim_journal(journal_path):
+    """Ouvre et verrouille le journal d'une session terminée ; None s'il est encore tenu par une
+    instance ouverte (ou repris par une autre instance pour sa récupération)"""
+    try:
+        file = open(journal_path, 'rb+')
+    except OSError:
+        return None
+    try:
+        lock_file(file)
+    except OSError:
+        file.close()
+        return None
+    return file
+
+
+def remove_journal(file, journal_path):
+    """Supprime un journal verrouillé par cette instance
+
+    Il est vidé avant d'être libéré : Windows ne supprime pas un fichier ouvert, et une autre
+    instance qui le prendrait entre la libération et la suppression n'y trouverait rien.
+    """
+    try:
+        file.seek(0)
+        file.truncate()
+    finally:
+        release_file(file)
+    os.remove(journal_path)
+
+
+def read_journal(journal_path):
+    """En-tête et remplacements [position, longueur retirée, texte inséré] d'un journal
+
+    Une dernière ligne incomplète (arrêt pendant l'écriture) est ignorée. Retourne None si
+    le journal est illisible ou d'une autre version.
+    """
+    try:
+        with open(journal_path, 'rb') as file:
+            lines = file.read().split(b"\n")
+        header = json.loads(lines[0])
+    except (OSError, ValueError):
+        return None
+    if not isinstance(header, dict) or header.get("version") != JOURNAL_VERSION:
+        return None
+    
+    records = []
+    for line in lines[1:]:
+        try:
+            offset, removed, inserted = json.loads(line)
+        except (ValueError, TypeError):
+            break
+        records.append((offset, removed, inserted))
+    return header, records
+
+
+def replay_journal(text, records):
+    """Texte obtenu en rejouant les remplacements d'un journal sur son texte de départ"""
+    for offset, removed, inserted in records:
+        if offset + removed > len(text):
+            raise ValueError("journal incompatible avec le texte de départ")
+        text = text[:offset] + inserted + text[offset + removed:]
+    return text
+
+
+def pending_journals(folder=JOURNAL_FOLDER):
+    """Journaux laissés par des sessions interrompues, du plus récent au plus ancien
+
+    Ceux qu'une instance de l'éditeur encore ouverte tient verrouillés sont ignorés. Le
+    verrou n'est pas gardé : le prendre à nouveau avec claim_journal avant la récupération.
+    """
+    try:
+        entries = list(os.scandir(folder))
+    except OSError:
+        return []
+    
+    # Journal en cours de création lors d'un arrêt (voir create_journal) : sans contenu utile
+    for entry in entries:
+        if entry.name.endswith(".journal.tmp"):
+            file = claim_journal(entry.path)
+            if file is not None:
+                try:
+                    remove_journal(file, entry.path)
+                except OSError:
+                    pass
+    
+    entries = [entry for entry in entries if entry.name.endswith(".journal")]
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    journals = []
+    for entry in entries:
+        file = claim_journal(entry.path)
+        if file is not None:
+            release_file(file)
+            journals.append(entry.path)
+    return journals
+
+
+def recover_journal(journal_path):
+    """Document retrouvé dans un journal : (chemin du fichier ou None, texte)
+
+    Retourne None si le journal ne contient aucune modification ; lève ValueError si le
+    fichier de départ a changé depuis l'ouverture du journal.
+    """
+    journal = read_journal(journal_path)
+    if journal is None or not journal[1]:
+        return None
+    header, records = journal
+    text = header.get("text")
+    if text is None:
+        with open(header["path"], 'rb') as file:
+            data = file.read()
+        if content_digest(data) != header.get("digest"):
+            raise ValueError(f"{header['path']} a été modifié depuis")
+        text = decode_package(data, file_encoding(data))
+    return header.get("path"), replay_journal(text, records)
+
+
+class EditJournal:
+    """Journal en ajout seul des modifications du document ouvert, rejoué après un arrêt brutal
+
+    La première ligne décrit le texte de départ : le fichier et l'empreinte de son contenu,
+    ou le texte complet d'un document qui n'a pas de fichier. Chaque ligne suivante est un
+    remplacement [position, longueur retirée, texte inséré]. Un thread d'écriture regroupe
+    les lignes reçues pendant JOURNAL_BATCH_MS et les synchronise sur disque (fsync) en une
+    fois : la saisie n'attend jamais le disque.
+    
+    Le journal porte le nom de l'instance (`owner`) et reste verrouillé tant qu'elle l'écrit :
+    les autres instances ne le prennent ni pour le leur ni pour celui d'une session interrompue.
+    """
+    def __init__(self, folder=JOURNAL_FOLDER):
+        self.folder = folder
+        self.owner = f"{os.getpid()}-{os.urandom(4).hex()}"
+        # Dernière erreur d'écriture, relevée par l'éditeur
+        self.error = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="wpkg-journal", daemon=True)
+        self._thread.start()
+    
+    def start(self, text, file_path=None, digest=None):
+        """Recommence le journal à partir de `text`, contenu du fichier d'empreinte `digest`
+        (ouverture ou enregistrement) ; le journal précédent est supprimé"""
+        header = {
+            "version": JOURNAL_VERSION,
+            "path": os.path.abspath(file_path) if file_path else None,
+            "digest": digest,
+            "text": text if digest is None else None,
+        }
+        path = os.path.join(self.folder, journal_name(file_path or None, self.owner))
+        self._queue.put(("start", path, json.dumps(header, ensure_ascii=False)))
+    
+    def append(self, offset, removed, inserted):
+        """Ajoute le remplacement de `removed` caractères par `inserted` à la position `offset`"""
+        self._queue.put(("append", None, json.dumps([offset, removed, inserted], ensure_ascii=False)))
+    
+    def discard(self):
+        """Supprime le journal (modifications enregistrées ou abandonnées)"""
+        self._queue.put(("discard", None, None))
+    
+    def close(self):
+        """Termine les écritures en attente et arrête le thread d'écriture"""
+        self._queue.put(("stop", None, None))
+        self._thread.join()
+    
+    def _run(self):
+        file = None
+        current = None
+        while True:
+            batch = [self._queue.get()]
+            # Regrouper les écritures qui se suivent de près : une seule synchronisation
+            deadline = time.monotonic() + JOURNAL_BATCH_MS / 1000
+            while batch[-1][0] != "stop":
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            
+            for action, path, line in batch:
+                try:
+                    if action == "append":
+                        if file is not None:
+                            file.write(line.encode('utf-8') + b"\n")
+                        continue
+                    if file is not None and action == "start" and path == current:
+                        # Même document (enregistrement) : le journal, toujours verrouillé,
+                        # repart de son en-tête
+                        file.seek(0)
+                        file.truncate()
+                        file.write(line.encode('utf-8') + b"\n")
+                        continue
+                    if file is not None:
+                        previous, previous_path = file, current
+                        file = current = None
+                        if action == "stop":
+                            # Journal gardé pour la récupération s'il n'a pas été abandonné
+                            try:
+                                previous.flush()
+                                os.fsync(previous.fileno())
+                            finally:
+                                release_file(previous)
+                        else:
+                            remove_journal(previous, previous_path)
+                    if action == "start":
+                        os.makedirs(self.folder, exist_ok=True)
+                        file = create_journal(path, line.encode('utf-8') + b"\n")
+                        current = path
+                except OSError as e:
+                    # Le journal est une sécurité : son échec n'interrompt pas l'édition
+                    self.error = str(e)
+            
+            if file is not None:
+                try:
+                    file.flush()
+                    os.fsync(file.fileno())
+                except OSError as e:
+                    self.error = str(e)
+            if batch[-1][0] == "stop":
+                return
+
+
+def merge_texts(base, ours, theirs):
+    """Fusion à trois voies, par lignes, des modifications de `ours` et de `theirs` depuis `base`
+
+    Retourne (texte fusionné, nombre de conflits) ; là où les deux versions modifient
+    différemment les mêmes lignes, `ours` est gardée.
+    """
+    base_lines = base.splitlines(keepends=True)
+    
+    def changes(text):
+        lines = text.splitlines(keepends=True)
+        matcher = SequenceMatcher(None, base_lines, lines, autojunk=False)
+        return [(i1, i2, lines[j1:j2]) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+    
+    def apply(hunks, start, end):
+        lines, pos = [], start
+        for i1, i2, replacement in hunks:
+            lines += base_lines[pos:i1] + replacement
+            pos = i2
+        return lines + base_lines[pos:end]
+    
+    sides = (changes(ours), changes(theirs))
+    cursors = [0, 0]
+    merged, pos, conflicts = [], 0, 0
+    while cursors[0] < len(sides[0]) or cursors[1] < len(sides[1]):
+        # Groupe de modifications qui se chevauchent, d'un côté ou des deux
+        start = min(side[cursor][0] for side, cursor in zip(sides, cursors) if cursor < len(side))
+        end = start
+        groups = ([], [])
+        extended = True
+        while extended:
+            extended = False
+            for side, group, number in zip(sides, groups, (0, 1)):
+                while cursors[number] < len(side) and (side[cursors[number]][0] < end
+                                                        or side[cursors[number]][0] == start):
+                    hunk = side[cursors[number]]
+                    group.append(hunk)
+                    end = max(end, hunk[1])
+                    cursors[number] += 1
+                    extended = True
+        
+        ours_lines, theirs_lines = apply(groups[0], start, end), apply(groups[1], start, end)
+        merged += base_lines[pos:start]
+        if not groups[1] or ours_lines == theirs_lines:
+            merged += ours_lines
+        elif not groups[0]:
+            merged += theirs_lines
+        else:
+            merged += ours_lines
+            conflicts += 1
+        pos = end
+    merged += base_lines[pos:]
+    return "".join(merged), conflicts
+
+
+class Inotify:
+    """Accès minimal à inotify (Linux) par ctypes : événements d'écriture dans des dossiers"""
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    _EVENT = struct.Struct("iIII")
+    
+    def __init__(self, libc, fd):
+        self.libc = libc
+        self.fd = fd
+        self.directories = {}
+    
+    @classmethod
+    def create(cls):
+        """Instance prête à l'emploi, ou None hors de Linux ou si inotify est indisponible"""
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        return cls(libc, fd) if fd >= 0 else None
+    
+    def watch_directories(self, directories):
+        """Suit exactement `directories` ; retourne ceux qui n'ont pas pu l'être"""
+        failed = set()
+        for wd, directory in list(self.directories.items()):
+            if directory not in directories:
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.directories[wd]
+        watched = set(self.directories.values())
+        for directory in directories - watched:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+            if wd < 0:
+                failed.add(directory)
+            else:
+                self.directories[wd] = directory
+        return failed
+    
+    def read(self, timeout):
+        """Chemins modifiés signalés pendant au plus `timeout` secondes"""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        paths = []
+        pos = 0
+        while pos + self._EVENT.size <= len(data):
+            wd, mask, cookie, length = self._EVENT.unpack_from(data, pos)
+            pos += self._EVENT.size
+            name = os.fsdecode(data[pos:pos + length].rstrip(b"\0"))
+            pos += length
+            if wd in self.directories and name:
+                paths.append(os.path.join(self.directories[wd], name))
+        return paths
+    
+    def close(self):
+        os.close(self.fd)
+
+
+# Fichier suivi dont la date et la taille ne sont pas encore connues
+_UNSEEN = object()
+
+
+class FileWatcher:
+    """Signale les fichiers suivis modifiés par ailleurs (collègue, synchronisation du partage)
+
+    Un thread compare la date et la taille de chaque fichier à celles de la dernière
+    vérification. Sous Linux, inotify désigne les fichiers à vérifier, sans relève, et seul
+    le fichier prioritaire (le fichier ouvert, peut-être sur un partage réseau qu'inotify ne
+    voit pas) est relevé à chaque intervalle. Sans inotify (ou pour un dossier qu'il ne peut
+    suivre), chaque relève vérifie en plus WATCH_FILES_PER_POLL autres fichiers à tour de
+    rôle : son coût reste constant quel que soit le nombre de fichiers suivis. Les chemins modifiés arrivent dans la file `changes`,
+    vidée par la boucle Tk.
+    """
+    def __init__(self):
+        self.changes = queue.Queue()
+        self._lock = threading.Lock()
+        # Chemin absolu -> (date, taille) à la dernière vérification, None si absent ou pas encore vu
+        self._signatures = {}
+        self._order = []
+        self._primary = None
+        self._changed = False
+        self._stop = threading.Event()
+        self._inotify = Inotify.create()
+        self._thread = threading.Thread(target=self._run, name="wpkg-watch", daemon=True)
+        self._thread.start()
+    
+    @property
+    def uses_inotify(self):
+        return self._inotify is not None
+    
+    def watch(self, file_paths, primary=None):
+        """Remplace les fichiers suivis ; `primary` est vérifié à chaque relève"""
+        primary = os.path.abspath(primary) if primary else None
+        order = [path for path in dict.fromkeys(map(os.path.abspath, file_paths)) if path != primary]
+        with self._lock:
+            self._signatures = {file_path: self._signatures.get(file_path, _UNSEEN)
+                                for file_path in order + ([primary] if primary else [])}
+            self._order = order
+            self._primary = primary
+            self._changed = True
+    
+    def stop(self):
+        """Arrête la surveillance à la fin de la relève en cours"""
+        self._stop.set()
+    
+    def _check(self, file_path):
+        try:
+            stat = os.stat(file_path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+        with self._lock:
+            if file_path not in self._signatures:
+                return
+            previous = self._signatures[file_path]
+            self._signatures[file_path] = signature
+        if previous is not _UNSEEN and previous != signature:
+            self.changes.put(file_path)
+    
+    def _run(self):
+        # Fichiers relevés à tour de rôle : tous sans inotify, sinon ceux qu'il ne suit pas
+        polled = []
+        cursor = 0
+        while not self._stop.is_set():
+            with self._lock:
+                changed, self._changed = self._changed, False
+                order, primary = self._order, self._primary
+            
+            if changed:
+                # Nouvelle liste : date et taille de départ de tous les fichiers
+                for file_path in order:
+                    self._check(file_path)
+                polled = order
+                if self._inotify is not None:
+                    failed = self._inotify.watch_directories(
+                        {os.path.dirname(file_path) for file_path in order + ([primary] if primary else [])})
+                    polled = [file_path for file_path in order if os.path.dirname(file_path) in failed]
+                cursor = 0
+            elif polled:
+                for i in range(min(WATCH_FILES_PER_POLL, len(polled))):
+                    self._check(polled[(cursor + i) % len(polled)])
+                cursor = (cursor + WATCH_FILES_PER_POLL) % len(polled)
+            if primary:
+                self._check(primary)
+            
+            if self._inotify is None:
+                self._stop.wait(WATCH_POLL_MS / 1000)
+                continue
+            for file_path in set(self._inotify.read(WATCH_POLL_MS / 1000)):
+                self._check(file_path)
+        if self._inotify is not None:
+            self._inotify.close()
+
+
+class MatchIndex:
+    """Index trié des occurrences d'une recherche, tenu à jour ligne par ligne lors des modifications"""
+    def __init__(self, pattern, content):
+        self.pattern = pattern
+        # Tuples (ligne, colonne, ligne de fin, colonne de fin) triés par position
+        self.matches = self._scan(content, 1)
+    
+    def __len__(self):
+        return len(self.matches)
+    
+    def _scan(self, content, first_line):
+        lines = LineIndex(content, first_line)
+        return [
+            (*lines.position(match.start()), *lines.position(match.end()))
+            for match in self.pattern.finditer(content)
+        ]
+    
+    def update(self, content, first, last, delta):
+        """Remplace les occurrences des anciennes lignes [first, last - delta] par celles de
+        `content`, texte des nouvelles lignes [first, last], et décale les suivantes"""
+        matches = self.matches
+        lo = bisect_left(matches, (first,))
+        hi = bisect_left(matches, (last - delta + 1,))
+        tail = matches[hi:]
+        if delta:
+            tail = [(line + delta, col, end_line + delta, end_col) for line, col, end_line, end_col in tail]
+        matches[lo:] = self._scan(content, first) + tail
+    
+    def next_after(self, line, col):
+        """Position de la première occurrence commençant à (line, col) ou après, sinon None"""
+        position = bisect_left(self.matches, (line, col))
+        return position if position < len(self.matches) else None
+    
+    def previous_before(self, line, col):
+        """Position de la dernière occurrence commençant avant (line, col), sinon None"""
+        position = bisect_left(self.matches, (line, col)) - 1
+        return position if position >= 0 else None
+    
+    def in_lines(self, first, last):
+        """Occurrences commençant entre les lignes first et last"""
+        return self.matches[bisect_left(self.matches, (first,)):bisect_left(self.matches, (last + 1,))]
+
+
 class SearchReplaceDialog(tk.Toplevel):
     """Dialogue de recherche et remplacement pour l'éditeur XML"""
-    def __init__(self, parent, text_widget):
+    def __init__(self, parent, text_widget, status_bar=None, on_change=None):
         super().__init__(parent)
         self.title("Rechercher et remplacer")
         self.transient(parent)
@@ -375,6 +2025,9 @@ class SearchReplaceDialog(tk.Toplevel):
         
         self.parent = parent
         self.text_widget = text_widget
+        self.status_bar = status_bar
+        # Appelé une fois après chaque modification du texte (historique d'annulation)
+        self.on_change = on_change
         self.result = None
         
         # Variables
@@ -387,6 +2040,17 @@ class SearchReplaceDialog(tk.Toplevel):
         # Position de recherche courante
         self.current_pos = "1.0"
         
+        # Index des occurrences de la recherche courante, reconstruit quand elle change
+        self.match_index = None
+        self.current_match = None
+        self._viewport_pending = False
+        for var in (self.search_var, self.case_sensitive, self.whole_word, self.regex_search):
+            var.trace_add("write", self.invalidate_matches)
+        self.text_widget.edit_listeners.append(self._on_text_edit)
+        self.text_widget.scroll_listeners.append(self._schedule_viewport_matches)
+        self.text_widget.text.tag_configure("match", background="#fff5b0")
+        self.text_widget.text.tag_raise("found", "match")
+        
         # Construction du dialogue
         self.create_widgets()
         
@@ -405,6 +2069,8 @@ class SearchReplaceDialog(tk.Toplevel):
         self.grab_set()
         self.protocol("WM_DELETE_WINDOW", self.cancel)
         self.bind("<Escape>", lambda event: self.cancel())
+        self.bind("<Return>", lambda event: self.find_next())
+        self.bind("<Shift-Return>", lambda event: self.find_previous())
         
     def create_widgets(self):
         frame = ttk.Frame(self, padding="10")
@@ -432,68 +2098,151 @@ class SearchReplaceDialog(tk.Toplevel):
         buttons_frame = ttk.Frame(frame)
         buttons_frame.grid(row=3, column=0, columnspan=2, pady=10)
         
-        ttk.Button(buttons_frame, text="Rechercher", command=self.find_next).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="Précédent", command=self.find_previous).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="Suivant", command=self.find_next).pack(side=tk.LEFT, padx=5)
         ttk.Button(buttons_frame, text="Remplacer", command=self.replace).pack(side=tk.LEFT, padx=5)
         ttk.Button(buttons_frame, text="Remplacer tout", command=self.replace_all).pack(side=tk.LEFT, padx=5)
         ttk.Button(buttons_frame, text="Fermer", command=self.cancel).pack(side=tk.LEFT, padx=5)
         
+        # Nombre d'occurrences (« n sur N »)
+        self.count_label = ttk.Label(frame, text="")
+        self.count_label.grid(row=4, column=0, columnspan=2, sticky=tk.W)
+        
         # Configuration de la grille
         frame.columnconfigure(1, weight=1)
     
+    def set_status(self, message):
+        """Affiche un message dans la barre de statut de l'éditeur"""
+        if self.status_bar is not None:
+            self.status_bar.set_status(message)
+    
+    def compile_pattern(self):
+        """Construit l'expression régulière Python correspondant aux options de recherche"""
+        search_text = self.search_var.get()
+        if not search_text:
+            return None
+        
+        pattern, flags = search_pattern(search_text, self.case_sensitive.get(),
+                                        self.whole_word.get(), self.regex_search.get())
+        
+        # ^ et $ s'ancrent en début et fin de ligne, comme dans la recherche de Tk
+        try:
+            return re.compile(pattern, flags | re.MULTILINE)
+        except re.error as e:
+            self.set_status(f"Expression régulière invalide: {str(e)}")
+            return None
+    
+    def invalidate_matches(self, *args):
+        """Oublie l'index des occurrences (recherche ou options modifiées)"""
+        self.match_index = None
+        self.current_match = None
+        self.text_widget.text.tag_remove("match", "1.0", tk.END)
+        self.count_label.config(text="")
+    
+    def ensure_match_index(self):
+        """Construit l'index des occurrences de la recherche courante en un seul passage"""
+        if self.match_index is None:
+            pattern = self.compile_pattern()
+            if pattern is None:
+                return None
+            self.match_index = MatchIndex(pattern, self.text_widget.text.get("1.0", "end-1c"))
+        return self.match_index
+    
+    def _on_text_edit(self, first, last, delta):
+        """Met à jour l'index pour les seules lignes modifiées"""
+        if self.match_index is None:
+            return
+        content = self.text_widget.text.get(f"{first}.0", f"{last}.0 lineend")
+        self.match_index.update(content, first, last, delta)
+        self.current_match = None
+        self.update_count_label()
+        self._schedule_viewport_matches()
+    
+    def _schedule_viewport_matches(self):
+        if self.match_index is not None and not self._viewport_pending:
+            self._viewport_pending = True
+            self.after_idle(self.highlight_viewport_matches)
+    
+    def highlight_viewport_matches(self):
+        """Surligne toutes les occurrences de la zone visible"""
+        self._viewport_pending = False
+        text = self.text_widget.text
+        text.tag_remove("match", "1.0", tk.END)
+        if self.match_index is None:
+            return
+        
+        first = int(text.index("@0,0").split(".")[0])
+        last = int(text.index(f"@0,{text.winfo_height()}").split(".")[0])
+        indices = []
+        for line, col, end_line, end_col in self.match_index.in_lines(first, last):
+            indices += (f"{line}.{col}", f"{end_line}.{end_col}")
+        if indices:
+            text.tag_add("match", *indices)
+    
+    def update_count_label(self):
+        total = len(self.match_index) if self.match_index is not None else 0
+        current = self.current_match + 1 if self.current_match is not None else "-"
+        self.count_label.config(text=f"{current} sur {total}")
+    
+    def show_match(self, position):
+        """Sélectionne l'occurrence numéro `position` de l'index"""
+        text = self.text_widget.text
+        line, col, end_line, end_col = self.match_index.matches[position]
+        pos, end_pos = f"{line}.{col}", f"{end_line}.{end_col}"
+        
+        # Mettre en évidence la correspondance
+        text.tag_remove("found", "1.0", tk.END)
+        text.tag_configure("found", background="yellow")
+        text.tag_add("found", pos, end_pos)
+        self.text_widget.see(pos)
+        
+        # Position courante pour la prochaine recherche (après une correspondance vide : +1c)
+        self.current_pos = end_pos if end_pos != pos else text.index(f"{pos}+1c")
+        self.current_match = position
+        
+        self.update_count_label()
+        self.highlight_viewport_matches()
+        self.set_status(f"Occurrence {position + 1} sur {len(self.match_index)}.")
+    
     def find_next(self, start_pos=None):
         """Trouve la prochaine occurrence du texte recherché"""
         if start_pos is None:
             start_pos = self.current_pos
         
-        search_text = self.search_var.get()
-        if not search_text:
+        index = self.ensure_match_index()
+        if index is None:
             return False
-        
-        # Options de recherche
-        kwargs = {}
-        if not self.case_sensitive.get():
-            kwargs["nocase"] = True
-        if self.regex_search.get():
-            kwargs["regexp"] = True
-        if self.whole_word.get():
-            kwargs["regexp"] = True
-            search_text = f"\\y{search_text}\\y"
-        
-        # Supprimer le tag 'found' précédent
-        self.text_widget.text.tag_remove("found", "1.0", tk.END)
-        self.text_widget.text.tag_configure("found", background="yellow")
-        
-        # Rechercher
-        try:
-            pos = self.text_widget.text.search(search_text, start_pos, tk.END, **kwargs)
-            if not pos:
-                # Rechercher depuis le début si on atteint la fin
-                if start_pos != "1.0":
-                    self.parent.status_bar.set_status("Recherche depuis le début...")
-                    return self.find_next("1.0")
-                else:
-                    self.parent.status_bar.set_status(f"Aucune occurrence de '{search_text}' trouvée.")
-                    return False
-            
-            # Calculer la fin de la correspondance
-            line, char = pos.split('.')
-            end_pos = f"{line}.{int(char) + len(search_text)}"
-            if "regexp" in kwargs:
-                # Pour les regex, il faut utiliser tag_add
-                end_pos = self.text_widget.text.index(f"{pos}+{len(self.text_widget.text.get(pos, pos+'+1c'))}c")
-            
-            # Mettre en évidence la correspondance
-            self.text_widget.text.tag_add("found", pos, end_pos)
-            self.text_widget.see(pos)
-            
-            # Mettre à jour la position courante pour la prochaine recherche
-            self.current_pos = end_pos
-            
-            self.parent.status_bar.set_status(f"Occurrence trouvée.")
-            return True
-        except Exception as e:
-            self.parent.status_bar.set_status(f"Erreur lors de la recherche: {str(e)}")
+        if not len(index):
+            self.text_widget.text.tag_remove("found", "1.0", tk.END)
+            self.update_count_label()
+            self.set_status(f"Aucune occurrence de '{self.search_var.get()}' trouvée.")
             return False
+        
+        line, col = map(int, self.text_widget.text.index(start_pos).split("."))
+        position = index.next_after(line, col)
+        if position is None:
+            # Reprendre depuis le début si on atteint la fin
+            self.set_status("Recherche depuis le début...")
+            position = 0
+        self.show_match(position)
+        return True
+    
+    def find_previous(self):
+        """Trouve l'occurrence précédant la sélection courante"""
+        index = self.ensure_match_index()
+        if index is None or not len(index):
+            return self.find_next()
+        
+        found = self.text_widget.text.tag_ranges("found")
+        start_pos = found[0] if found else self.current_pos
+        line, col = map(int, self.text_widget.text.index(start_pos).split("."))
+        position = index.previous_before(line, col)
+        if position is None:
+            # Reprendre depuis la fin si on atteint le début
+            self.set_status("Recherche depuis la fin...")
+            position = len(index) - 1
+        self.show_match(position)
+        return True
     
     def replace(self):
         """Remplace l'occurrence actuelle du texte recherché"""
@@ -506,9 +2255,13 @@ class SearchReplaceDialog(tk.Toplevel):
         # Si une occurrence est déjà trouvée (tag 'found')
         if self.text_widget.text.tag_ranges("found"):
             start, end = self.text_widget.text.tag_ranges("found")[0], self.text_widget.text.tag_ranges("found")[1]
-            self.text_widget.text.delete(start, end)
-            self.text_widget.text.insert(start, replace_text)
+            start = self.text_widget.text.index(start)
+            self.text_widget.delete(start, end)
+            self.text_widget.insert(start, replace_text)
             self.text_widget.text.tag_remove("found", "1.0", tk.END)
+            self.text_widget.highlight_dirty()
+            if self.on_change:
+                self.on_change()
             
             # Position après le texte de remplacement
             self.current_pos = f"{start}+{len(replace_text)}c"
@@ -520,52 +2273,443 @@ class SearchReplaceDialog(tk.Toplevel):
             self.find_next()
     
     def replace_all(self):
-        """Remplace toutes les occurrences du texte recherché"""
-        search_text = self.search_var.get()
+        """Remplace toutes les occurrences du texte recherché en une seule modification"""
+        pattern = self.compile_pattern()
+        if pattern is None:
+            return
         replace_text = self.replace_var.get()
         
+        # Les références de groupe (\1, \g<nom>) ne sont interprétées qu'en mode regex
+        if self.regex_search.get():
+            expand = lambda match: match.expand(replace_text)
+        else:
+            expand = lambda match: replace_text
+        
+        # Un seul passage sur le texte : le nouveau contenu est construit en mémoire,
+        # de la première à la dernière correspondance
+        content = self.text_widget.text.get("1.0", "end-1c")
+        pieces = []
+        first = last = None
+        try:
+            for match in pattern.finditer(content):
+                if first is None:
+                    first = last = match.start()
+                pieces.append(content[last:match.start()])
+                pieces.append(expand(match))
+                last = match.end()
+        except (re.error, IndexError) as e:
+            self.set_status(f"Remplacement invalide: {str(e)}")
+            return
+        
+        count = len(pieces) // 2
+        if count:
+            # Sauvegarder la position actuelle
+            current_view = self.text_widget.text.yview()
+            
+            # Appliquer le résultat en une seule modification (une seule étape d'annulation)
+            lines = LineIndex(content)
+            start, end = lines.index(first), lines.index(last)
+            self.text_widget.text.tag_remove("found", "1.0", tk.END)
+            self.text_widget.delete(start, end)
+            self.text_widget.insert(start, "".join(pieces))
+            self.text_widget.highlight_dirty()
+            
+            # Restaurer la vue
+            self.text_widget.text.yview_moveto(current_view[0])
+            self.current_pos = "1.0"
+            
+            if self.on_change:
+                self.on_change()
+        
+        self.set_status(f"{count} occurrences remplacées.")
+    
+    def cancel(self):
+        """Ferme le dialogue"""
+        self.text_widget.edit_listeners.remove(self._on_text_edit)
+        self.text_widget.scroll_listeners.remove(self._schedule_viewport_matches)
+        self.text_widget.text.tag_remove("found", "1.0", tk.END)
+        self.text_widget.text.tag_remove("match", "1.0", tk.END)
+        self.destroy()
+
+
+class FolderSearchDialog(tk.Toplevel):
+    """Recherche et remplacement dans tous les paquets XML d'un dossier"""
+    def __init__(self, parent, cache, initial_dir="", on_open=None, on_files_changed=None):
+        super().__init__(parent)
+        self.title("Rechercher dans un dossier")
+        self.transient(parent)
+        self.geometry("800x500")
+        
+        self.cache = cache
+        # on_open(chemin, ligne) ouvre un résultat ; on_files_changed(chemins) après un remplacement
+        self.on_open = on_open
+        self.on_files_changed = on_files_changed
+        
+        # Variables
+        self.folder_var = tk.StringVar(value=initial_dir)
+        self.search_var = tk.StringVar()
+        self.replace_var = tk.StringVar()
+        self.case_sensitive = tk.BooleanVar(value=False)
+        self.whole_word = tk.BooleanVar(value=False)
+        self.regex_search = tk.BooleanVar(value=False)
+        
+        # Recherche en cours : les résultats d'une recherche précédente sont ignorés
+        self._pool = None
+        self._futures = set()
+        self._queue = queue.Queue()
+        self._search_id = 0
+        self._poll_job = None
+        self._expected = None
+        self._received = 0
+        self.query = None
+        # Remplacement en cours : résultats (futures) déjà relevés, None hors remplacement
+        self._replaced = None
+        self._replace_expected = 0
+        self._replace_job = None
+        # Résultats de la dernière recherche : chemin -> [(ligne, colonne, extrait), ...]
+        self.results = {}
+        
+        self.create_widgets()
+        
+        self.protocol("WM_DELETE_WINDOW", self.cancel)
+        self.bind("<Escape>", lambda event: self.cancel())
+        self.search_entry.bind("<Return>", lambda event: self.start_search())
+        self.search_entry.focus_set()
+    
+    def create_widgets(self):
+        frame = ttk.Frame(self, padding="10")
+        frame.pack(fill=tk.BOTH, expand=True)
+        
+        # Dossier
+        ttk.Label(frame, text="Dossier:").grid(row=0, column=0, sticky=tk.W, pady=5)
+        ttk.Entry(frame, textvariable=self.folder_var).grid(row=0, column=1, sticky=tk.EW, padx=5, pady=5)
+        ttk.Button(frame, text="Parcourir...", command=self.browse_folder).grid(row=0, column=2, padx=5)
+        
+        # Recherche et remplacement
+        ttk.Label(frame, text="Rechercher:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        self.search_entry = ttk.Entry(frame, textvariable=self.search_var)
+        self.search_entry.grid(row=1, column=1, columnspan=2, sticky=tk.EW, padx=5, pady=5)
+        
+        ttk.Label(frame, text="Remplacer par:").grid(row=2, column=0, sticky=tk.W, pady=5)
+        ttk.Entry(frame, textvariable=self.replace_var).grid(row=2, column=1, columnspan=2, sticky=tk.EW, padx=5, pady=5)
+        
+        # Options de recherche
+        options_frame = ttk.Frame(frame)
+        options_frame.grid(row=3, column=0, columnspan=3, sticky=tk.W, pady=5)
+        ttk.Checkbutton(options_frame, text="Respecter la casse", variable=self.case_sensitive).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(options_frame, text="Mot entier", variable=self.whole_word).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(options_frame, text="Expression régulière", variable=self.regex_search).pack(side=tk.LEFT, padx=5)
+        
+        # Boutons
+        buttons_frame = ttk.Frame(frame)
+        buttons_frame.grid(row=4, column=0, columnspan=3, pady=5)
+        ttk.Button(buttons_frame, text="Rechercher", command=self.start_search).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="Remplacer tout...", command=self.preview_replace).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="Arrêter", command=self.stop).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="Fermer", command=self.cancel).pack(side=tk.LEFT, padx=5)
+        
+        # Résultats : un nœud par fichier, une ligne par occurrence
+        results_frame = ttk.Frame(frame)
+        results_frame.grid(row=5, column=0, columnspan=3, sticky=tk.NSEW, pady=5)
+        self.results_tree = ttk.Treeview(results_frame, columns=("line", "snippet"), show="tree headings")
+        self.results_tree.heading("#0", text="Fichier")
+        self.results_tree.heading("line", text="Ligne")
+        self.results_tree.heading("snippet", text="Extrait")
+        self.results_tree.column("#0", width=220)
+        self.results_tree.column("line", width=60, anchor=tk.E, stretch=False)
+        self.results_tree.column("snippet", width=450)
+        scrollbar = ttk.Scrollbar(results_frame, orient=tk.VERTICAL, command=self.results_tree.yview)
+        self.results_tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.results_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.results_tree.bind("<Double-1>", self.open_selected)
+        
+        self.status_label = ttk.Label(frame, text="", anchor=tk.W)
+        self.status_label.grid(row=6, column=0, columnspan=3, sticky=tk.EW)
+        
+        # Configuration de la grille
+        frame.columnconfigure(1, weight=1)
+        frame.rowconfigure(5, weight=1)
+    
+    def browse_folder(self):
+        folder = filedialog.askdirectory(parent=self, initialdir=self.folder_var.get() or None)
+        if folder:
+            self.folder_var.set(folder)
+    
+    def get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor()
+        return self._pool
+    
+    def start_search(self):
+        """Lance la recherche : parcours du dossier sur un thread, analyse dans le pool de processus"""
+        search_text = self.search_var.get()
+        folder = self.folder_var.get()
         if not search_text:
             return
+        if self._replaced is not None:
+            self.status_label.config(text="Remplacement en cours...")
+            return
+        if not os.path.isdir(folder):
+            self.status_label.config(text=f"Dossier introuvable: {folder}")
+            return
         
-        # Sauvegarder la position actuelle
-        current_view = self.text_widget.text.yview()
-        
-        # Commencer depuis le début
-        self.current_pos = "1.0"
-        count = 0
+        source, flags = search_pattern(search_text, self.case_sensitive.get(),
+                                       self.whole_word.get(), self.regex_search.get())
+        try:
+            re.compile(source, flags)
+        except re.error as e:
+            self.status_label.config(text=f"Expression régulière invalide: {str(e)}")
+            return
         
-        # Utiliser un indicateur pour terminer la boucle
-        text_modified = False
+        self.stop()
+        self.results_tree.delete(*self.results_tree.get_children())
+        self.results = {}
+        self.query = (source, flags)
+        self._expected = None
+        self._received = 0
+        self.status_label.config(text="Recherche en cours...")
         
-        while True:
-            if self.find_next("1.0" if count == 0 else self.current_pos):
-                if self.text_widget.text.tag_ranges("found"):
-                    start, end = self.text_widget.text.tag_ranges("found")[0], self.text_widget.text.tag_ranges("found")[1]
-                    self.text_widget.text.delete(start, end)
-                    self.text_widget.text.insert(start, replace_text)
-                    self.text_widget.text.tag_remove("found", "1.0", tk.END)
-                    
-                    # Position après le texte de remplacement
-                    self.current_pos = f"{start}+{len(replace_text)}c"
-                    count += 1
-                    text_modified = True
+        pool = self.get_pool()
+        threading.Thread(target=self._walk, args=(pool, self._search_id, folder, self.query), daemon=True).start()
+        self._poll_job = self.after(FOLDER_SEARCH_POLL_MS, self._poll_results)
+    
+    def _walk(self, pool, search_id, folder, query):
+        """Parcourt le dossier et soumet au pool, par lots, les fichiers absents du cache"""
+        count = 0
+        batch = []
+        for directory, dirnames, filenames in os.walk(folder):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if not filename.lower().endswith(FOLDER_SEARCH_EXTENSIONS):
+                    continue
+                if search_id != self._search_id:
+                    return
+                file_path = os.path.join(directory, filename)
+                count += 1
+                try:
+                    hits = self.cache.lookup(file_path, os.stat(file_path), query)
+                except OSError as e:
+                    self._queue.put((search_id, "error", file_path, str(e)))
+                    continue
+                if hits is not None:
+                    self._queue.put((search_id, "cached", file_path, hits))
+                    continue
+                batch.append(file_path)
+                if len(batch) >= FOLDER_SEARCH_BATCH:
+                    if not self._submit_batch(pool, search_id, batch, query):
+                        return
+                    batch = []
+        if batch and not self._submit_batch(pool, search_id, batch, query):
+            return
+        self._queue.put((search_id, "walked", None, count))
+    
+    def _submit_batch(self, pool, search_id, batch, query):
+        try:
+            future = pool.submit(search_files, batch, *query)
+        except RuntimeError:
+            # Pool arrêté : le dialogue a été fermé
+            return False
+        self._futures.add(future)
+        future.add_done_callback(self._futures.discard)
+        future.add_done_callback(lambda future: self._put_batch_results(search_id, batch, future))
+        return True
+    
+    def _put_batch_results(self, search_id, batch, future):
+        if future.cancelled():
+            for file_path in batch:
+                self._queue.put((search_id, "cancelled", file_path, None))
+        elif future.exception() is not None:
+            for file_path in batch:
+                self._queue.put((search_id, "error", file_path, str(future.exception())))
+        else:
+            for file_path, digest, hits in future.result():
+                if digest is None:
+                    self._queue.put((search_id, "error", file_path, hits))
                 else:
-                    break
-            else:
+                    self._queue.put((search_id, "result", file_path, (file_path, digest, hits)))
+    
+    def _poll_results(self):
+        """Affiche les résultats arrivés depuis la dernière relève"""
+        self._poll_job = None
+        deadline = time.perf_counter() + HIGHLIGHT_SLICE_MS / 1000
+        while time.perf_counter() < deadline:
+            try:
+                search_id, kind, file_path, payload = self._queue.get_nowait()
+            except queue.Empty:
                 break
+            if search_id != self._search_id:
+                continue
+            if kind == "walked":
+                self._expected = payload
+                continue
+            
+            self._received += 1
+            if kind == "result":
+                _, digest, hits = payload
+                self.cache.store(file_path, digest, self.query, hits)
+            elif kind == "cached":
+                hits = payload
+            else:
+                hits = []
+                if kind == "error":
+                    self.results_tree.insert("", tk.END, text=os.path.basename(file_path),
+                                             values=("", f"Erreur: {payload}"))
+            if hits:
+                self.add_file_results(file_path, hits)
+        
+        total = sum(len(hits) for hits in self.results.values())
+        if self._expected is not None and self._received >= self._expected:
+            self.status_label.config(
+                text=f"{total} occurrence(s) dans {len(self.results)} fichier(s) sur {self._expected} analysé(s).")
+        else:
+            self.status_label.config(text=f"Recherche en cours... {self._received} fichier(s), {total} occurrence(s)")
+            self._poll_job = self.after(FOLDER_SEARCH_POLL_MS, self._poll_results)
+    
+    def add_file_results(self, file_path, hits):
+        self.results[file_path] = hits
+        node = self.results_tree.insert("", tk.END, text=os.path.relpath(file_path, self.folder_var.get()),
+                                        values=(len(hits), ""), open=len(self.results) <= 20)
+        for line, column, snippet in hits:
+            self.results_tree.insert(node, tk.END, values=(line, snippet), tags=(file_path,))
+    
+    def open_selected(self, event=None):
+        selection = self.results_tree.selection()
+        if not selection or self.on_open is None:
+            return
+        tags = self.results_tree.item(selection[0], "tags")
+        if tags:
+            self.on_open(tags[0], int(self.results_tree.set(selection[0], "line")))
+    
+    def stop(self):
+        """Abandonne la recherche en cours"""
+        self._search_id += 1
+        if self._poll_job is not None:
+            self.after_cancel(self._poll_job)
+            self._poll_job = None
+        for future in list(self._futures):
+            future.cancel()
+    
+    def preview_replace(self):
+        """Montre les remplacements prévus avant de les appliquer"""
+        search_text = self.search_var.get()
+        source, flags = search_pattern(search_text, self.case_sensitive.get(),
+                                       self.whole_word.get(), self.regex_search.get())
+        if self._replaced is not None:
+            self.status_label.config(text="Remplacement en cours...")
+            return
+        if not search_text or (source, flags) != self.query or self._expected is None or self._received < self._expected:
+            messagebox.showinfo("Remplacer tout", "Lancez d'abord la recherche et attendez la fin de l'analyse.", parent=self)
+            return
+        if not self.results:
+            messagebox.showinfo("Remplacer tout", "Aucune occurrence à remplacer.", parent=self)
+            return
         
-        # Restaurer la vue
-        self.text_widget.text.yview_moveto(current_view[0])
-        
-        if text_modified:
-            # Si des remplacements ont été effectués, mettre à jour la coloration syntaxique
-            self.text_widget.highlight_syntax()
+        pattern = re.compile(source, flags)
+        replace_text = self.replace_var.get()
+        regex = self.regex_search.get()
+        
+        preview = tk.Toplevel(self)
+        preview.title("Aperçu du remplacement")
+        preview.transient(self)
+        preview.geometry("750x450")
+        
+        text = scrolledtext.ScrolledText(preview, wrap=tk.NONE, font=("Courier", 10))
+        text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        text.tag_configure("file", font=("Courier", 10, "bold"))
+        text.tag_configure("before", foreground="#b00000")
+        text.tag_configure("after", foreground="#007000")
+        
+        total = 0
+        for file_path, hits in self.results.items():
+            total += len(hits)
+            text.insert(tk.END, f"{file_path} ({len(hits)})\n", "file")
+            for line in sorted({hit[0] for hit in hits}):
+                snippet = next(hit[2] for hit in hits if hit[0] == line)
+                replaced = pattern.sub(replace_text if regex else lambda match: replace_text, snippet)
+                text.insert(tk.END, f"  {line:>5}- {snippet}\n", "before")
+                text.insert(tk.END, f"  {line:>5}+ {replaced}\n", "after")
+        text.config(state=tk.DISABLED)
+        
+        buttons_frame = ttk.Frame(preview)
+        buttons_frame.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Label(buttons_frame, text=f"{total} occurrence(s) dans {len(self.results)} fichier(s)").pack(side=tk.LEFT)
+        ttk.Button(buttons_frame, text="Annuler", command=preview.destroy).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(buttons_frame, text="Appliquer",
+                   command=lambda: (preview.destroy(), self.apply_replace(replace_text, regex))).pack(side=tk.RIGHT, padx=5)
+        preview.grab_set()
+    
+    def apply_replace(self, replace_text, regex):
+        """Remplace dans chaque fichier de l'aperçu, par écriture atomique, dans le pool de processus
+
+        Les résultats arrivent par la file de la recherche et sont relevés par _poll_replace :
+        l'interface reste disponible pendant le remplacement.
+        """
+        self.stop()
+        pool = self.get_pool()
+        self._replaced = []
+        self._replace_expected = len(self.results)
+        for file_path in self.results:
+            future = pool.submit(replace_in_file, file_path, *self.query, replace_text, regex,
+                                 self.cache.digest(file_path))
+            future.add_done_callback(lambda future: self._queue.put((None, "replaced", None, future)))
+        self.status_label.config(text="Remplacement en cours...")
+        self._replace_job = self.after(FOLDER_SEARCH_POLL_MS, self._poll_replace)
+    
+    def _poll_replace(self):
+        """Relève les remplacements terminés ; à la fin, affiche le bilan et relance la recherche"""
+        self._replace_job = None
+        while True:
+            try:
+                _, kind, _, payload = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            # Les résultats restants de la recherche arrêtée sont ignorés
+            if kind == "replaced":
+                self._replaced.append(payload)
+        if len(self._replaced) < self._replace_expected:
+            self.status_label.config(
+                text=f"Remplacement en cours... {len(self._replaced)} fichier(s) sur {self._replace_expected}")
+            self._replace_job = self.after(FOLDER_SEARCH_POLL_MS, self._poll_replace)
+            return
         
-        self.parent.status_bar.set_status(f"{count} occurrences remplacées.")
+        futures, self._replaced = self._replaced, None
+        changed, skipped, errors, count = [], [], [], 0
+        for future in futures:
+            if future.cancelled():
+                continue
+            try:
+                file_path, replaced, digest = future.result()
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            if replaced is None:
+                skipped.append(file_path)
+            elif replaced:
+                changed.append(file_path)
+                count += replaced
+        
+        message = f"{count} remplacement(s) dans {len(changed)} fichier(s)."
+        if skipped:
+            message += f" {len(skipped)} fichier(s) modifié(s) depuis l'aperçu ignoré(s)."
+        if errors:
+            message += f" {len(errors)} erreur(s): {errors[0]}"
+        # Relancer la recherche pour refléter le nouveau contenu
+        self.start_search()
+        messagebox.showinfo("Remplacer tout", message, parent=self)
+        
+        if changed and self.on_files_changed:
+            self.on_files_changed(changed)
     
     def cancel(self):
         """Ferme le dialogue"""
-        self.text_widget.text.tag_remove("found", "1.0", tk.END)
+        self.stop()
+        if self._replace_job is not None:
+            self.after_cancel(self._replace_job)
+            self._replace_job = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
         self.destroy()
 
 
@@ -675,6 +2819,16 @@ class WPKGEditor:
         # Utilisation de la nouvelle classe Package
         self.package = Package()
         
+        # Paquets du fichier ouvert (un packages.xml peut en contenir plusieurs) et paquet affiché
+        self.packages = [self.package]
+        self.package_index = 0
+        # Dernière analyse réussie (lignes source des éléments, commentaires)
+        self.last_parse = None
+        # Ligne de début de chaque <package> dans la vue XML et paquet affiché tel qu'il y est
+        # écrit : permettent de ne réécrire que les éléments modifiés
+        self.package_starts = None
+        self.package_snapshot = None
+        
         # Variables pour contrôler l'affichage des panneaux
         self.show_xml_panel = tk.BooleanVar(value=True)
         self.show_log_panel = tk.BooleanVar(value=True)
@@ -693,22 +2847,63 @@ class WPKGEditor:
             "autosave": False,
             "autosave_interval": 5,  # minutes
             "xml_font_size": 10,
-            "log_font_size": 10
+            "log_font_size": 10,
+            # Guillemets des attributs écrits par l'éditeur (les commandes contiennent souvent des ")
+            "xml_quote": '"',
+            "cmd_quote": "'",
+            "parse_cache_mb": PARSE_CACHE_BUDGET_MB
         }
         self.load_settings()
         
         # Timer pour sauvegarde automatique
         self.autosave_timer = None
         
-        # Historique des actions pour annuler/refaire
-        self.history = []
-        self.history_position = -1
+        # Historique des actions pour annuler/refaire : opérations réversibles, et texte XML
+        # tel qu'il était à la dernière entrée (les saisies sont comparées à ce texte)
         self.max_history = 50
+        self.history = EditHistory(self.max_history)
+        self.history_text = ""
+        self._history_job = None
+        
+        # Texte XML enregistré ou ouvert : comparé au texte de référence de l'historique pour
+        # savoir si le document est modifié (voir is_modified) ; il sert aussi de base à la
+        # fusion avec une version du fichier modifiée par ailleurs
+        self.saved_text = ""
+        # Empreinte du contenu du fichier tel que l'éditeur l'a lu ou écrit
+        self.file_digest = None
+        
+        # Résolution des références %NOM%, recalculée seulement quand les variables changent
+        self.variable_resolver = None
+        
+        # Résultats de la recherche dans un dossier, conservés d'une recherche à l'autre
+        self.folder_search_cache = FolderSearchCache()
+        
+        # Documents déjà analysés, pour rouvrir instantanément un fichier inchangé
+        self.parse_cache = ParseCache(self.user_settings["parse_cache_mb"] * 1_000_000, PARSE_CACHE_FOLDER)
+        
+        # Journal des modifications non enregistrées, rejoué au démarrage après un arrêt brutal
+        self.journal = EditJournal(JOURNAL_FOLDER)
+        
+        # Enregistrements faits hors du thread de l'interface (partages réseau lents), dans l'ordre
+        self.save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wpkg-save")
+        self.pending_saves = []
+        
+        # Surveillance du fichier ouvert et des fichiers récents, modifiés par ailleurs
+        self.file_watcher = FileWatcher()
+        self._external_change_prompt = False
         
         # Configuration de la fenêtre
         self.setup_ui()
         self.apply_settings()
         
+        # Proposer de restaurer le travail d'une session interrompue, sinon partir du document vide
+        if not self.recover_journals():
+            self.reset_history()
+            self.mark_saved()
+            self.update_title()
+        self.update_watched_files()
+        self.root.after(WATCH_POLL_MS, self.poll_file_changes)
+        
         # Démarrer la sauvegarde automatique si activée
         if self.user_settings["autosave"]:
             self.start_autosave_timer()
@@ -745,6 +2940,7 @@ class WPKGEditor:
         edit_menu.add_command(label="Coller", command=lambda: self.root.focus_get().event_generate("<<Paste>>"), accelerator="Ctrl+V")
         edit_menu.add_separator()
         edit_menu.add_command(label="Rechercher/Remplacer", command=self.show_search_dialog, accelerator="Ctrl+F")
+        edit_menu.add_command(label="Rechercher dans un dossier", command=self.show_folder_search_dialog, accelerator="Ctrl+Shift+F")
         
         # Menu Affichage
         view_menu = tk.Menu(menubar, tearoff=0)
@@ -842,6 +3038,17 @@ class WPKGEditor:
         self.verify_button.pack(side=tk.TOP, pady=5)
     
     def setup_form(self):
+        # Sélecteur du paquet affiché (fichiers packages.xml contenant plusieurs paquets)
+        picker_frame = ttk.Frame(self.form_frame)
+        picker_frame.pack(fill=tk.X, padx=5, pady=(5, 0))
+        ttk.Label(picker_frame, text="Paquet:").pack(side=tk.LEFT)
+        self.package_picker = ttk.Combobox(picker_frame, state="readonly")
+        self.package_picker.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.package_picker.bind("<<ComboboxSelected>>", self.on_package_picked)
+        self.package_count_label = ttk.Label(picker_frame, text="")
+        self.package_count_label.pack(side=tk.LEFT)
+        self.update_package_picker()
+        
         # Notebook pour les onglets du formulaire
         self.form_notebook = ttk.Notebook(self.form_frame)
         self.form_notebook.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -892,10 +3099,7 @@ class WPKGEditor:
         self.package_vars = {}
         
         row = 0
-        for key in asdict(self.package).keys():
-            if key in ["variables", "checks", "installs", "upgrades", "removes", "comments", "xml_declaration"]:
-                continue
-                
+        for key in PACKAGE_ATTRIBUTES:
             ttk.Label(form_frame, text=f"{key.capitalize()}:").grid(row=row, column=0, sticky=tk.W, padx=5, pady=5)
             
             if key == 'reboot':
@@ -1266,11 +3470,16 @@ class WPKGEditor:
         
         # Zone de texte avancée pour le code XML avec numéros de ligne et coloration syntaxique
         self.xml_text = XmlTextWithLineNumbers(self.xml_frame, width=80, height=15)
+        self.xml_text.variable_names = lambda: self.get_variable_resolver().names()
         self.xml_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
         # Observer le curseur pour la barre de statut
-        self.xml_text.text.bind("<KeyRelease>", self.update_cursor_position_from_text)
-        self.xml_text.text.bind("<ButtonRelease-1>", self.update_cursor_position_from_text)
+        self.xml_text.text.bind("<KeyRelease>", self.update_cursor_position_from_text, add="+")
+        self.xml_text.text.bind("<ButtonRelease-1>", self.update_cursor_position_from_text, add="+")
+        
+        # Saisies et remplacements dans le XML : regroupés dans l'historique après une pause
+        self.xml_text.text.bind("<KeyRelease>", self.schedule_text_history, add="+")
+        self.xml_text.edit_listeners.append(lambda first, last, delta: self.schedule_text_history())
         
         # Boutons pour les actions XML
         buttons_frame = ttk.Frame(self.xml_frame)
@@ -1337,6 +3546,7 @@ class WPKGEditor:
         self.root.bind("<Control-z>", lambda event: self.undo())
         self.root.bind("<Control-y>", lambda event: self.redo())
         self.root.bind("<Control-f>", lambda event: self.show_search_dialog())
+        self.root.bind("<Control-Shift-F>", lambda event: self.show_folder_search_dialog())
         
         # Raccourcis pour le menu Affichage
         self.root.bind("<Control-plus>", lambda event: self.change_font_size(1))
@@ -1431,54 +3641,49 @@ class WPKGEditor:
         # Insérer le caractère spécial dans la zone de texte XML
         try:
             self.xml_text.insert(tk.INSERT, char)
-            self.xml_text.highlight_syntax()
+            self.xml_text.highlight_dirty()
         except:
             pass
     
     def verify_xml(self):
         """Vérifier l'intégrité du XML et afficher les erreurs"""
-        self.clear_logs()
         xml_content = self.xml_text.get(1.0, tk.END)
         
+        try:
+            result = parse_wpkg(xml_content)
+        except Exception as e:
+            self.clear_logs()
+            self.log_message(f"Erreur lors de la validation: {str(e)}", "error")
+            self.status_bar.set_status("Erreur de validation XML")
+            return False
+        
+        valid = self.show_parse_result(result)
+        
+        # Mettre à jour la coloration syntaxique
+        self.xml_text.highlight_syntax()
+        
+        return valid
+    
+    def show_parse_result(self, result, clear_logs=True):
+        """Journalise le résultat d'une analyse et surligne la ligne de la première erreur"""
+        if clear_logs:
+            self.clear_logs()
+        
         # Supprimer les surlignages d'erreurs précédents
         self.xml_text.text.tag_remove("error", "1.0", "end")
         
-        try:
-            # Utiliser lxml pour la validation XML car il donne des messages d'erreur plus précis
-            parser = etree.XMLParser()
-            etree.fromstring(xml_content, parser)
-            
+        if not result.errors:
             # Si on arrive ici, c'est que le XML est valide
             self.log_message("Le XML est valide et bien formé.", "success")
-            
-            # Mettre à jour la coloration syntaxique
-            self.xml_text.highlight_syntax()
-            
-            # Mise à jour du statut
             self.status_bar.set_status("Validation XML réussie")
-            
             return True
-            
-        except etree.XMLSyntaxError as e:
-            # Afficher l'erreur dans les logs
-            self.log_message(f"Erreur XML: {str(e)}", "error")
-            
-            # Surligner la ligne contenant l'erreur
-            line_number = e.lineno if hasattr(e, 'lineno') else 1
-            self.xml_text.highlight_error(line_number)
-            
-            # Mettre à jour la coloration syntaxique
-            self.xml_text.highlight_syntax()
-            
-            # Mise à jour du statut
-            self.status_bar.set_status("Erreur XML détectée")
-            
-            return False
-            
-        except Exception as e:
-            self.log_message(f"Erreur lors de la validation: {str(e)}", "error")
-            self.status_bar.set_status("Erreur de validation XML")
-            return False
+        
+        # Afficher l'erreur dans les logs et surligner la ligne qui la contient
+        line, column, message = result.errors[0]
+        self.log_message(f"Erreur XML: {message}", "error")
+        self.xml_text.highlight_error(line or 1)
+        self.status_bar.set_status("Erreur XML détectée")
+        return False
     
     def new_package(self):
         # Demander confirmation si le fichier actuel a été modifié
@@ -1489,6 +3694,10 @@ class WPKGEditor:
         # Réinitialiser les données du paquet
         self.current_file = None
         self.package = Package()
+        self.packages = [self.package]
+        self.package_index = 0
+        self.package_starts = None
+        self.update_package_picker()
         
         # Mettre à jour l'interface
         self.update_ui()
@@ -1500,12 +3709,14 @@ class WPKGEditor:
         self.clear_logs()
         self.log_message("Nouveau paquet créé.", "info")
         
+        # Réinitialiser l'historique ; le paquet vide sert de référence aux modifications
+        self.reset_history()
+        self.mark_saved()
+        self.file_digest = None
+        self.update_watched_files()
+        
         # Mettre à jour le titre de la fenêtre
         self.update_title()
-        
-        # Réinitialiser l'historique
-        self.history = []
-        self.history_position = -1
     
     def open_package(self):
         # Vérifier s'il y a des modifications non enregistrées
@@ -1525,41 +3736,49 @@ class WPKGEditor:
     
     def load_package_from_file(self, file_path):
         try:
-            # Lire le fichier XML
-            with open(file_path, 'r', encoding='utf-8') as file:
-                xml_content = file.read()
-            
-            # Analyser le contenu XML
-            self.parse_xml(xml_content)
+            # Lire et analyser le fichier (modèle, commentaires et erreurs), sauf s'il est
+            # déjà dans le cache avec le même contenu
+            document = self.parse_cache.load(file_path)
+            xml_content = document.content
+            result = document.parse_result()
+            if not result.errors:
+                self.apply_parse_result(result)
+            else:
+                self.package_starts = None
             
             # Mettre à jour l'interface
             self.update_ui()
             
-            # Stocker le chemin du fichier actuel
+            # Stocker le chemin du fichier actuel et l'empreinte du contenu lu
             self.current_file = file_path
+            self.file_digest = document.digest
             
-            # Mettre à jour la vue XML
-            self.xml_text.delete(1.0, tk.END)
-            self.xml_text.insert(tk.END, xml_content)
-            self.xml_text.highlight_syntax()
+            # Mettre à jour la vue XML (coloration reprise du cache si elle y est)
+            self.xml_text.set_content(xml_content, document.spans,
+                                      lambda spans: self.parse_cache.attach_spans(document.digest, spans))
             
-            # Log
+            # Log et résultat de la vérification (issu de la même analyse)
             self.clear_logs()
             self.log_message(f"Paquet chargé depuis {file_path}", "success")
-            
-            # Vérifier le XML
-            self.verify_xml()
+            declared = declared_encoding(xml_content)
+            if document.encoding != declared:
+                self.log_message(f"Fichier déclaré en {declared} mais écrit en {document.encoding} : "
+                                 f"il sera enregistré en {declared}", "warning")
+            self.show_parse_result(result, clear_logs=False)
             
             # Ajouter aux fichiers récents
             self.add_recent_file(file_path)
             
+            # Enrichir la complétion avec les paquets du même dossier
+            self.xml_text.scan_completions(os.path.dirname(os.path.abspath(file_path)))
+            
+            # Réinitialiser l'historique (et le journal, qui repart du contenu du fichier)
+            self.reset_history(document.digest)
+            self.mark_saved()
+            
             # Mettre à jour le titre de la fenêtre
             self.update_title()
             
-            # Réinitialiser l'historique
-            self.history = []
-            self.history_position = -1
-            
             return True
             
         except Exception as e:
@@ -1571,24 +3790,7 @@ class WPKGEditor:
         if not self.current_file:
             return self.save_package_as()
         else:
-            try:
-                # Récupérer le contenu XML actuel
-                xml_content = self.xml_text.get(1.0, tk.END)
-                
-                # Sauvegarder dans le fichier
-                with open(self.current_file, 'w', encoding='utf-8') as file:
-                    file.write(xml_content)
-                
-                self.log_message(f"Paquet enregistré dans {self.current_file}", "success")
-                self.status_bar.set_status(f"Enregistré dans {self.current_file}")
-                
-                # Mettre à jour le titre (enlever l'indicateur de modification)
-                self.update_title(modified=False)
-                
-                return True
-            except Exception as e:
-                self.log_message(f"Échec de l'enregistrement: {str(e)}", "error")
-                return False
+            return self.start_save(self.current_file)
     
     def save_package_as(self):
         # Demander un nouveau fichier pour sauvegarder
@@ -1600,30 +3802,64 @@ class WPKGEditor:
         if not file_path:
             return False
         
+        return self.start_save(file_path, overwrite=True)
+    
+    def start_save(self, file_path, overwrite=False):
+        """Lance l'enregistrement du texte XML actuel dans `file_path`
+
+        Le fichier est écrit sur le thread d'enregistrement, de façon atomique (fichier
+        temporaire synchronisé puis renommé) : un lecteur ne voit jamais de paquet tronqué.
+        Sauf `overwrite`, le fichier ouvert n'est pas écrasé s'il a été modifié par ailleurs
+        depuis sa lecture. La fin est traitée dans la boucle Tk par finish_save.
+        """
+        # Les saisies en attente font partie de ce qui est enregistré
+        self.commit_text_history()
+        xml_content = self.history_text
+        
+        expected_digest = None if overwrite or file_path != self.current_file else self.file_digest
+        future = self.save_executor.submit(write_package_file, file_path, xml_content, expected_digest)
+        self.pending_saves.append(future)
+        self.status_bar.set_status(f"Enregistrement dans {file_path}...")
+        self.root.after(SAVE_POLL_MS, self.finish_save, future, file_path, self.current_file, xml_content)
+        return True
+    
+    def finish_save(self, future, file_path, document_file, xml_content):
+        """Termine un enregistrement : `document_file` est le fichier du document au lancement,
+        `xml_content` le texte enregistré"""
+        if not future.done():
+            self.root.after(SAVE_POLL_MS, self.finish_save, future, file_path, document_file, xml_content)
+            return
+        self.pending_saves.remove(future)
+        
         try:
-            # Récupérer le contenu XML actuel
-            xml_content = self.xml_text.get(1.0, tk.END)
-            
-            # Sauvegarder dans le fichier
-            with open(file_path, 'w', encoding='utf-8') as file:
-                file.write(xml_content)
-            
-            # Mettre à jour le fichier actuel
-            self.current_file = file_path
-            
-            # Ajouter aux fichiers récents
-            self.add_recent_file(file_path)
-            
-            self.log_message(f"Paquet enregistré dans {file_path}", "success")
-            self.status_bar.set_status(f"Enregistré dans {file_path}")
-            
-            # Mettre à jour le titre
-            self.update_title(modified=False)
-            
-            return True
+            data = future.result()
         except Exception as e:
             self.log_message(f"Échec de l'enregistrement: {str(e)}", "error")
-            return False
+            self.status_bar.set_status(f"Échec de l'enregistrement dans {file_path}")
+            return
+        if data is None:
+            # Fichier modifié par ailleurs depuis sa lecture : recharger, fusionner ou écraser
+            self.status_bar.set_status(f"Enregistrement annulé : {file_path} a été modifié par ailleurs")
+            if self.on_external_change(file_path):
+                self.start_save(file_path)
+            return
+        
+        self.log_message(f"Paquet enregistré dans {file_path}", "success")
+        self.status_bar.set_status(f"Enregistré dans {file_path}")
+        if self.current_file != document_file:
+            # Un autre document a été ouvert entre-temps
+            return
+        
+        # Mettre à jour le fichier actuel (Enregistrer sous) et les fichiers récents
+        if file_path != self.current_file:
+            self.current_file = file_path
+            self.add_recent_file(file_path)
+        self.file_digest = content_digest(data)
+        self.compact_journal(xml_content)
+        self.mark_saved(xml_content)
+        
+        # Mettre à jour le titre (sans indicateur, sauf saisies faites pendant l'écriture)
+        self.update_title()
     
     def export_to_html(self):
         """Exporte le code XML actuel en HTML avec coloration syntaxique"""
@@ -1749,7 +3985,33 @@ Python {platform.python_version()} - {platform.system()} {platform.release()}
     
     def show_search_dialog(self):
         """Affiche le dialogue de recherche et remplacement"""
-        search_dialog = SearchReplaceDialog(self.root, self.xml_text)
+        search_dialog = SearchReplaceDialog(self.root, self.xml_text, status_bar=self.status_bar,
+                                            on_change=self.commit_text_history)
+    
+    def show_folder_search_dialog(self):
+        """Affiche le dialogue de recherche et remplacement dans un dossier de paquets"""
+        initial_dir = os.path.dirname(self.current_file) if self.current_file else os.getcwd()
+        FolderSearchDialog(self.root, self.folder_search_cache, initial_dir=initial_dir,
+                           on_open=self.open_search_result, on_files_changed=self.on_files_replaced)
+    
+    def open_search_result(self, file_path, line):
+        """Ouvre le fichier d'un résultat de recherche et place le curseur sur la ligne"""
+        if os.path.abspath(file_path) != os.path.abspath(self.current_file or ""):
+            if self.is_modified():
+                if not messagebox.askyesno("Confirmer", "Des modifications non enregistrées seront perdues. Continuer ?"):
+                    return
+            if not self.load_package_from_file(file_path):
+                return
+        self.xml_text.text.mark_set(tk.INSERT, f"{line}.0")
+        self.xml_text.see(f"{line}.0")
+        self.xml_text.text.focus_set()
+    
+    def on_files_replaced(self, file_paths):
+        """Journalise un remplacement dans un dossier et propose de recharger le paquet ouvert"""
+        for file_path in file_paths:
+            self.log_message(f"Remplacement effectué dans {file_path}", "info")
+        if self.current_file and os.path.abspath(self.current_file) in map(os.path.abspath, file_paths):
+            self.on_external_change(self.current_file)
     
     def show_settings_dialog(self):
         """Affiche le dialogue des paramètres de l'application"""
@@ -1757,7 +4019,7 @@ Python {platform.python_version()} - {platform.system()} {platform.release()}
         settings_dialog.title("Paramètres")
         settings_dialog.transient(self.root)
         settings_dialog.grab_set()
-        settings_dialog.geometry("400x300")
+        settings_dialog.geometry("400x420")
         
         # Créer des frames pour les différentes sections
         general_frame = ttk.LabelFrame(settings_dialog, text="Général")
@@ -1792,6 +4054,23 @@ Python {platform.python_version()} - {platform.system()} {platform.release()}
         log_font_spin = ttk.Spinbox(general_frame, from_=8, to=24, textvariable=log_font_var, width=5)
         log_font_spin.grid(row=3, column=1, sticky=tk.W, padx=5, pady=5)
         
+        # Guillemets des attributs écrits
+        ttk.Label(general_frame, text="Guillemets des attributs:").grid(row=4, column=0, sticky=tk.W, padx=5, pady=5)
+        xml_quote_var = tk.StringVar(value=self.user_settings["xml_quote"])
+        ttk.Combobox(general_frame, textvariable=xml_quote_var, values=['"', "'"], state="readonly",
+                     width=3).grid(row=4, column=1, sticky=tk.W, padx=5, pady=5)
+        
+        ttk.Label(general_frame, text="Guillemets des commandes:").grid(row=5, column=0, sticky=tk.W, padx=5, pady=5)
+        cmd_quote_var = tk.StringVar(value=self.user_settings["cmd_quote"])
+        ttk.Combobox(general_frame, textvariable=cmd_quote_var, values=['"', "'"], state="readonly",
+                     width=3).grid(row=5, column=1, sticky=tk.W, padx=5, pady=5)
+        
+        # Mémoire du cache d'analyse
+        ttk.Label(general_frame, text="Cache d'analyse (Mo):").grid(row=6, column=0, sticky=tk.W, padx=5, pady=5)
+        cache_var = tk.IntVar(value=self.user_settings["parse_cache_mb"])
+        ttk.Spinbox(general_frame, from_=0, to=1024, textvariable=cache_var,
+                    width=5).grid(row=6, column=1, sticky=tk.W, padx=5, pady=5)
+        
         # Boutons
         buttons_frame = ttk.Frame(settings_dialog)
         buttons_frame.pack(pady=10)
@@ -1802,6 +4081,9 @@ Python {platform.python_version()} - {platform.system()} {platform.release()}
             self.user_settings["autosave_interval"] = interval_var.get()
             self.user_settings["xml_font_size"] = xml_font_var.get()
             self.user_settings["log_font_size"] = log_font_var.get()
+            self.user_settings["xml_quote"] = xml_quote_var.get()
+            self.user_settings["cmd_quote"] = cmd_quote_var.get()
+            self.user_settings["parse_cache_mb"] = cache_var.get()
             
             self.save_settings()
             self.apply_settings()
@@ -1819,7 +4101,11 @@ Python {platform.python_version()} - {platform.system()} {platform.release()}
             "autosave": False,
             "autosave_interval": 5,
             "xml_font_size": 10,
-            "log_font_size": 10
+            "log_font_size": 10,
+            # Guillemets des attributs écrits par l'éditeur (les commandes contiennent souvent des ")
+            "xml_quote": '"',
+            "cmd_quote": "'",
+            "parse_cache_mb": PARSE_CACHE_BUDGET_MB
         }
         self.save_settings()
         self.apply_settings()
@@ -1854,6 +4140,10 @@ Python {platform.python_version()} - {platform.system()} {platform.release()}
         self.xml_text.text.configure(font=("TkFixedFont", self.user_settings["xml_font_size"]))
         self.log_text.configure(font=("TkFixedFont", self.user_settings["log_font_size"]))
         
+        # Budget mémoire du cache d'analyse
+        self.parse_cache.budget = self.user_settings["parse_cache_mb"] * 1_000_000
+        self.parse_cache.trim()
+        
         # Configurer la sauvegarde automatique
         if self.user_settings["autosave"]:
             self.start_autosave_timer()
@@ -1887,7 +4177,7 @@ Python {platform.python_version()} - {platform.system()} {platform.release()}
         interval_ms = self.user_settings["autosave_interval"] * 60 * 1000
         
         def autosave_callback():
-            if self.current_file and self.is_modified():
+            if self.current_file and self.is_modified() and not self.pending_saves:
                 self.save_package()
                 self.log_message("Sauvegarde automatique effectuée", "info")
             
@@ -1904,13 +4194,24 @@ Python {platform.python_version()} - {platform.system()} {platform.release()}
             self.autosave_timer = None
     
     def is_modified(self):
-        """Vérifier si le paquet actuel a été modifié depuis le dernier enregistrement"""
-        # Pour l'instant, on considère toujours comme modifié si un fichier est ouvert
-        # Une méthode plus sophistiquée pourrait comparer le contenu actuel avec le fichier
-        return self.current_file is not None
+        """Vérifier si le paquet actuel a été modifié depuis le dernier enregistrement (ou l'ouverture)
+
+        Des saisies pas encore dans l'historique comptent comme une modification. Sinon le texte
+        de référence de l'historique est comparé au texte enregistré (la comparaison s'arrête
+        dès que les longueurs diffèrent).
+        """
+        if self._history_job is not None:
+            return True
+        return self.history_text != self.saved_text
+    
+    def mark_saved(self, xml_content=None):
+        """Le texte `xml_content` (par défaut le texte de référence de l'historique) est celui du fichier"""
+        self.saved_text = self.history_text if xml_content is None else xml_content
     
-    def update_title(self, modified=True):
-        """Mettre à jour le titre de la fenêtre"""
+    def update_title(self, modified=None):
+        """Mettre à jour le titre de la fenêtre (indicateur de modification calculé par défaut)"""
+        if modified is None:
+            modified = self.is_modified()
         title = "WPKG Package Editor v1.2"
         
         if self.current_file:
@@ -1952,6 +4253,9 @@ Python {platform.python_version()} - {platform.system()} {platform.release()}
         
         # Enregistrer la liste des fichiers récents
         self.save_recent_files()
+        
+        # Surveiller la nouvelle liste
+        self.update_watched_files()
     
     def update_recent_files_menu(self):
         """Mettre à jour le menu des fichiers récents"""
@@ -1977,6 +4281,7 @@ Python {platform.python_version()} - {platform.system()} {platform.release()}
         self.recent_files = []
         self.update_recent_files_menu()
         self.save_recent_files()
+        self.update_watched_files()
     
     def save_recent_files(self):
         """Enregistrer la liste des fichiers récents"""
@@ -1998,88 +4303,232 @@ Python {platform.python_version()} - {platform.system()} {platform.release()}
         except Exception as e:
             self.log_message(f"Erreur lors du chargement des fichiers récents: {str(e)}", "error")
     
-    def add_to_history(self):
-        """Ajouter l'état actuel à l'historique des actions"""
-        # Obtenir l'état actuel
-        current_state = {
-            'package': {
-                'id': self.package.id,
-                'name': self.package.name,
-                'revision': self.package.revision,
-                'date': self.package.date,
-                'reboot': self.package.reboot,
-                'category': self.package.category,
-                'priority': self.package.priority,
-                'variables': [asdict(var) for var in self.package.variables],
-                'checks': [asdict(check) for check in self.package.checks],
-                'installs': [asdict(cmd) for cmd in self.package.installs],
-                'upgrades': [asdict(cmd) for cmd in self.package.upgrades],
-                'removes': [asdict(cmd) for cmd in self.package.removes],
-                'comments': self.package.comments,
-                'xml_declaration': self.package.xml_declaration
-            },
-            'xml': self.xml_text.get(1.0, tk.END)
-        }
-        
-        # Si nous sommes au milieu de l'historique, supprimer les actions qui suivent
-        if self.history_position < len(self.history) - 1:
-            self.history = self.history[:self.history_position + 1]
-        
-        # Ajouter l'état à l'historique
-        self.history.append(current_state)
-        self.history_position = len(self.history) - 1
+    def add_to_history(self, operations=()):
+        """Ajoute une action à l'historique : ses opérations sur le modèle et la modification
+        du texte XML depuis la dernière entrée"""
+        operations = list(operations)
+        splice = text_splice(self.history_text, self.xml_text.get("1.0", "end-1c"))
+        if splice is not None:
+            operations.append(splice)
+            self.history_text = splice.apply_text(self.history_text, undo=False)
+            self.journal_splice(splice, undo=False)
+        self.history.record(operations)
+    
+    def schedule_text_history(self, event=None):
+        """Regroupe les frappes consécutives : une entrée après une pause de saisie"""
+        if self._history_job is not None:
+            self.root.after_cancel(self._history_job)
+        else:
+            # Première saisie depuis la dernière entrée : le document devient modifié
+            self.update_title(modified=True)
+        self._history_job = self.root.after(HISTORY_TYPING_PAUSE_MS, self.commit_text_history)
+    
+    def commit_text_history(self):
+        """Enregistre les saisies en attente dans le texte XML"""
+        if self._history_job is not None:
+            self.root.after_cancel(self._history_job)
+            self._history_job = None
+        self.add_to_history()
+        self.update_title()
+    
+    def reset_history(self, digest=None):
+        """Vide l'historique ; le texte XML actuel devient la référence, et le point de départ
+        du journal (`digest` : empreinte du fichier dont il est le contenu)"""
+        if self._history_job is not None:
+            self.root.after_cancel(self._history_job)
+            self._history_job = None
+        self.history.clear()
+        self.history_text = self.xml_text.get("1.0", "end-1c")
+        self.journal.start(self.history_text, self.current_file, digest)
+    
+    def journal_splice(self, splice, undo):
+        """Ajoute au journal un remplacement appliqué au texte de référence de l'historique"""
+        removed, inserted = (splice.inserted, splice.removed) if undo else (splice.removed, splice.inserted)
+        self.journal.append(splice.offset, len(removed), inserted)
+        if self.journal.error is not None:
+            self.log_message(f"Écriture du journal de récupération impossible: {self.journal.error}", "warning")
+            self.journal.error = None
+    
+    def compact_journal(self, xml_content):
+        """Après un enregistrement, le journal repart du fichier écrit (texte `xml_content`) ;
+        les saisies faites pendant l'écriture y sont reportées"""
+        self.journal.start(xml_content, self.current_file, self.file_digest)
+        splice = text_splice(xml_content, self.history_text)
+        if splice is not None:
+            self.journal_splice(splice, undo=False)
+    
+    def recover_journals(self):
+        """Propose de restaurer les modifications non enregistrées d'une session interrompue ;
+        retourne True si un document a été restauré"""
+        for journal_path in pending_journals(JOURNAL_FOLDER):
+            # Verrou gardé jusqu'à la suppression : une autre instance qui démarre ne propose
+            # pas la même récupération
+            claim = claim_journal(journal_path)
+            if claim is None:
+                continue
+            try:
+                recovered = recover_journal(journal_path)
+            except (OSError, KeyError, ValueError) as e:
+                self.log_message(f"Journal de récupération inutilisable ({journal_path}): {str(e)}", "warning")
+                recovered = None
+            
+            if recovered is not None:
+                file_path, text = recovered
+                accepted = messagebox.askyesno(
+                    "Récupération",
+                    f"Des modifications non enregistrées de {file_path or 'un nouveau paquet'} ont été "
+                    "retrouvées après un arrêt inattendu.\nLes restaurer ?")
+            try:
+                remove_journal(claim, journal_path)
+            except OSError:
+                pass
+            if recovered is None or not accepted:
+                continue
+            
+            self.load_with_text(file_path, text)
+            self.log_message("Modifications non enregistrées restaurées depuis le journal", "success")
+            return True
+        return False
+    
+    def load_with_text(self, file_path, text):
+        """Ouvre `file_path` puis remplace son contenu par `text` : les modifications par rapport
+        au fichier forment une entrée d'historique (et du journal) et restent à enregistrer"""
+        if file_path is None or not self.load_package_from_file(file_path):
+            self.reset_history()
+        self.xml_text.patch_text(text)
+        self.update_from_xml()
+        self.update_title()
+    
+    def update_watched_files(self):
+        """Surveille le fichier ouvert et les fichiers récents"""
+        self.file_watcher.watch(self.recent_files, primary=self.current_file)
+    
+    def poll_file_changes(self):
+        """Traite les fichiers signalés comme modifiés par la surveillance"""
+        changed = set()
+        while True:
+            try:
+                changed.add(self.file_watcher.changes.get_nowait())
+            except queue.Empty:
+                break
+        for file_path in changed:
+            if self.current_file and file_path == os.path.abspath(self.current_file):
+                if self.pending_saves:
+                    # Sans doute l'écriture de l'éditeur lui-même, dont finish_save n'a pas encore
+                    # relevé l'empreinte : examiné à la prochaine relève
+                    self.file_watcher.changes.put(file_path)
+                else:
+                    self.on_external_change(self.current_file)
+            elif not os.path.exists(file_path) and file_path in self.recent_files:
+                self.recent_files.remove(file_path)
+                self.update_recent_files_menu()
+                self.save_recent_files()
+                self.update_watched_files()
+        self.root.after(WATCH_POLL_MS, self.poll_file_changes)
+    
+    def on_external_change(self, file_path):
+        """Propose de recharger le fichier ouvert, modifié par ailleurs, ou d'y fusionner les
+        modifications non enregistrées ; retourne True si la version de l'éditeur est gardée
+        (le fichier peut alors être écrasé)"""
+        if self._external_change_prompt:
+            return False
+        try:
+            with open(file_path, 'rb') as file:
+                data = file.read()
+        except OSError:
+            self.log_message(f"Le fichier ouvert {file_path} n'est plus accessible", "warning")
+            return False
+        digest = content_digest(data)
+        if digest == self.file_digest:
+            # Écriture de l'éditeur lui-même, ou contenu inchangé
+            return True
         
-        # Limiter la taille de l'historique
-        if len(self.history) > self.max_history:
-            self.history.pop(0)
-            self.history_position -= 1
+        self._external_change_prompt = True
+        try:
+            self.commit_text_history()
+            if not self.is_modified():
+                choice = messagebox.askyesno(
+                    "Fichier modifié", f"{file_path} a été modifié par ailleurs.\nLe recharger ?")
+                choice = False if choice else None
+            else:
+                choice = messagebox.askyesnocancel(
+                    "Fichier modifié",
+                    f"{file_path} a été modifié par ailleurs et vous avez des modifications non enregistrées.\n\n"
+                    "Oui : les fusionner dans la nouvelle version\n"
+                    "Non : recharger (vos modifications seront perdues)\n"
+                    "Annuler : garder votre version")
+        finally:
+            self._external_change_prompt = False
+        
+        if choice is None:
+            # Version gardée : le prochain enregistrement écrasera la version extérieure
+            self.file_digest = digest
+            self.log_message(f"{file_path} modifié par ailleurs : votre version est conservée", "warning")
+        elif not choice:
+            self.load_package_from_file(file_path)
+        else:
+            theirs = decode_package(data, file_encoding(data))
+            merged, conflicts = merge_texts(self.saved_text, self.history_text, theirs)
+            self.load_with_text(file_path, merged)
+            if conflicts:
+                self.log_message(f"Fusion avec la version extérieure : {conflicts} conflit(s), "
+                                 "votre version a été gardée pour ces lignes", "warning")
+            else:
+                self.log_message("Vos modifications ont été fusionnées dans la version extérieure", "success")
+        return choice is None
     
     def undo(self):
         """Annuler la dernière action"""
-        if self.history_position > 0:
-            self.history_position -= 1
-            self.restore_state(self.history[self.history_position])
+        self.commit_text_history()
+        operations = self.history.undo()
+        if operations is not None:
+            self.apply_operations(reversed(operations), undo=True)
             self.status_bar.set_status("Action annulée")
         else:
             self.status_bar.set_status("Impossible d'annuler davantage")
     
     def redo(self):
         """Refaire la dernière action annulée"""
-        if self.history_position < len(self.history) - 1:
-            self.history_position += 1
-            self.restore_state(self.history[self.history_position])
+        self.commit_text_history()
+        operations = self.history.redo()
+        if operations is not None:
+            self.apply_operations(operations, undo=False)
             self.status_bar.set_status("Action refaite")
         else:
             self.status_bar.set_status("Impossible de refaire davantage")
     
-    def restore_state(self, state):
-        """Restaurer un état précédent"""
-        # Restaurer l'état du paquet
-        pkg_state = state['package']
-        self.package = Package(
-            id=pkg_state['id'],
-            name=pkg_state['name'],
-            revision=pkg_state['revision'],
-            date=pkg_state['date'],
-            reboot=pkg_state['reboot'],
-            category=pkg_state['category'],
-            priority=pkg_state['priority'],
-            variables=[Variable(**var) for var in pkg_state['variables']],
-            checks=[Check(**check) for check in pkg_state['checks']],
-            installs=[Command(**cmd) for cmd in pkg_state['installs']],
-            upgrades=[Command(**cmd) for cmd in pkg_state['upgrades']],
-            removes=[Command(**cmd) for cmd in pkg_state['removes']],
-            comments=pkg_state['comments'],
-            xml_declaration=pkg_state['xml_declaration']
-        )
-        
-        # Restaurer le contenu XML
-        self.xml_text.delete(1.0, tk.END)
-        self.xml_text.insert(tk.END, state['xml'])
-        self.xml_text.highlight_syntax()
-        
-        # Mettre à jour l'interface
+    def apply_operations(self, operations, undo):
+        """Rejoue des opérations de l'historique ; le coût ne dépend que de leur taille"""
+        shown = self.package_index
+        with self.xml_text.frozen():
+            for operation in operations:
+                operation.apply(self.packages, self.xml_text, undo)
+                if isinstance(operation, TextSplice):
+                    self.history_text = operation.apply_text(self.history_text, undo)
+                    self.journal_splice(operation, undo)
+                    self.shift_package_starts(operation, undo)
+                elif hasattr(operation, "package"):
+                    # Afficher le paquet concerné
+                    shown = operation.package
+        
+        self.package_index = shown if shown < len(self.packages) else 0
+        self.package = self.packages[self.package_index]
+        self.take_package_snapshot()
+        self.update_package_picker()
         self.update_ui()
+        self.update_title()
+    
+    def shift_package_starts(self, splice, undo):
+        """Met à jour les lignes de début des paquets après un remplacement dans le texte"""
+        if self.package_starts is None:
+            return
+        removed, inserted = (splice.inserted, splice.removed) if undo else (splice.removed, splice.inserted)
+        if "<package" in removed or "<package" in inserted:
+            self.package_starts = locate_packages(self.history_text)
+            return
+        delta = inserted.count("\n") - removed.count("\n")
+        if delta:
+            self.package_starts = [line + delta if line > splice.line else line for line in self.package_starts]
     
     def on_tree_button_press(self, event):
         """Gérer le début du glisser-déposer dans un treeview"""
@@ -2342,6 +4791,9 @@ Description du paquet personnalisé
         # Mettre à jour l'interface
         self.update_ui()
         
+        # Nouveau document : l'historique repart de ce modèle
+        self.reset_history()
+        
         # Mettre à jour le statut
         self.status_bar.set_status(f"Modèle '{template_type}' généré")
         self.log_message(f"Modèle de paquet '{template_type}' généré avec succès", "success")
@@ -2357,9 +4809,10 @@ Description du paquet personnalisé
             return
         
         try:
-            # Lire le fichier XML
-            with open(file_path, 'r', encoding='utf-8') as file:
-                compare_xml = file.read()
+            # Lire le fichier XML dans son encodage
+            with open(file_path, 'rb') as file:
+                data = file.read()
+            compare_xml = decode_package(data, file_encoding(data))
             
             # Créer une nouvelle instance du paquet pour comparaison
             compare_package = Package()
@@ -2406,6 +4859,16 @@ Description du paquet personnalisé
         except Exception as e:
             self.log_message(f"Erreur lors de la comparaison: {str(e)}", "error")
     
+    def get_variable_resolver(self):
+        """Résolveur des variables du paquet, créé à la demande"""
+        if self.variable_resolver is None:
+            self.variable_resolver = VariableResolver(self.package.variables)
+        return self.variable_resolver
+    
+    def invalidate_variables(self):
+        """À appeler après toute modification de l'onglet Variables"""
+        self.variable_resolver = None
+    
     def build_install_command(self):
         """Construit la commande d'installation en remplaçant les variables"""
         cmd = self.install_cmd.get()
@@ -2413,19 +4876,8 @@ Description du paquet personnalisé
             self.log_message("Aucune commande à construire.", "warning")
             return
         
-        # Remplacer les variables du paquet
-        for var in self.package.variables:
-            cmd = cmd.replace(f"%{var.name}%", var.value)
-        
-        # Remplacer les variables système communes
-        system_vars = {
-            "SYSTEMDRIVE": "C:",
-            "SOFTWARE": "C:\\Software",
-            "ComSpec": "C:\\Windows\\System32\\cmd.exe"
-        }
-        
-        for var_name, var_value in system_vars.items():
-            cmd = cmd.replace(f"%{var_name}%", var_value)
+        # Remplacer les variables du paquet et les variables système
+        cmd = self.get_variable_resolver().resolve(cmd)
         
         # Afficher la commande construite
         self.log_message("Commande construite:", "info")
@@ -2487,19 +4939,8 @@ Description du paquet personnalisé
             self.log_message("Aucune commande à construire.", "warning")
             return
         
-        # Remplacer les variables du paquet
-        for var in self.package.variables:
-            cmd = cmd.replace(f"%{var.name}%", var.value)
-        
-        # Remplacer les variables système communes
-        system_vars = {
-            "SYSTEMDRIVE": "C:",
-            "SOFTWARE": "C:\\Software",
-            "ComSpec": "C:\\Windows\\System32\\cmd.exe"
-        }
-        
-        for var_name, var_value in system_vars.items():
-            cmd = cmd.replace(f"%{var_name}%", var_value)
+        # Remplacer les variables du paquet et les variables système
+        cmd = self.get_variable_resolver().resolve(cmd)
         
         # Afficher la commande construite
         self.log_message("Commande construite:", "info")
@@ -2562,19 +5003,8 @@ Description du paquet personnalisé
             self.log_message("Aucune commande à construire.", "warning")
             return
         
-        # Remplacer les variables du paquet
-        for var in self.package.variables:
-            cmd = cmd.replace(f"%{var.name}%", var.value)
-        
-        # Remplacer les variables système communes
-        system_vars = {
-            "SYSTEMDRIVE": "C:",
-            "SOFTWARE": "C:\\Software",
-            "ComSpec": "C:\\Windows\\System32\\cmd.exe"
-        }
-        
-        for var_name, var_value in system_vars.items():
-            cmd = cmd.replace(f"%{var_name}%", var_value)
+        # Remplacer les variables du paquet et les variables système
+        cmd = self.get_variable_resolver().resolve(cmd)
         
         # Afficher la commande construite
         self.log_message("Commande construite:", "info")
@@ -2636,94 +5066,70 @@ Description du paquet personnalisé
         self.package_vars['date'].set(current_date)
     
     def parse_xml(self, xml_content):
-        # Extraire la déclaration XML
-        xml_decl_match = re.match(r'<\?xml[^>]*\?>', xml_content)
-        if xml_decl_match:
-            self.package.xml_declaration = xml_decl_match.group(0)
-        
-        # Extraire les commentaires
-        self.package.comments = []
-        comment_matches = re.findall(r'<!--(.*?)-->', xml_content, re.DOTALL)
-        for comment in comment_matches:
-            self.package.comments.append(comment.strip())
-        
-        # Analyser le XML avec ElementTree
-        try:
-            root = ET.fromstring(xml_content)
-            
-            # Extraire les données du paquet
-            package_elem = root.find('.//package')
-            if package_elem is not None:
-                # Attributs du paquet
-                self.package.id = package_elem.get('id', '')
-                self.package.name = package_elem.get('name', '')
-                self.package.revision = package_elem.get('revision', '')
-                self.package.date = package_elem.get('date', '')
-                self.package.reboot = package_elem.get('reboot', 'false')
-                self.package.category = package_elem.get('category', '')
-                self.package.priority = package_elem.get('priority', '')
-                
-                # Extraire les variables
-                self.package.variables = []
-                for var_elem in package_elem.findall('./variable'):
-                    self.package.variables.append(Variable(
-                        name=var_elem.get('name', ''),
-                        value=var_elem.get('value', ''),
-                        architecture=var_elem.get('architecture', '')
-                    ))
-                
-                # Extraire les checks
-                self.package.checks = []
-                for check_elem in package_elem.findall('./check'):
-                    self.package.checks.append(Check(
-                        type=check_elem.get('type', ''),
-                        condition=check_elem.get('condition', ''),
-                        path=check_elem.get('path', ''),
-                        value=check_elem.get('value', ''),
-                        architecture=check_elem.get('architecture', '')
-                    ))
-                
-                # Extraire les commandes d'installation
-                self.package.installs = []
-                for install_elem in package_elem.findall('./install'):
-                    exit_code = ""
-                    exit_elem = install_elem.find('./exit')
-                    if exit_elem is not None:
-                        exit_code = exit_elem.get('code', '')
-                    
-                    self.package.installs.append(Command(
-                        cmd=install_elem.get('cmd', ''),
-                        include=install_elem.get('include', ''),
-                        timeout=install_elem.get('timeout', ''),
-                        exit_code=exit_code
-                    ))
-                
-                # Extraire les commandes de mise à niveau
-                self.package.upgrades = []
-                for upgrade_elem in package_elem.findall('./upgrade'):
-                    self.package.upgrades.append(Command(
-                        include=upgrade_elem.get('include', ''),
-                        cmd=upgrade_elem.get('cmd', '')
-                    ))
-                
-                # Extraire les commandes de suppression
-                self.package.removes = []
-                for remove_elem in package_elem.findall('./remove'):
-                    exit_code = ""
-                    exit_elem = remove_elem.find('./exit')
-                    if exit_elem is not None:
-                        exit_code = exit_elem.get('code', '')
-                    
-                    self.package.removes.append(Command(
-                        cmd=remove_elem.get('cmd', ''),
-                        timeout=remove_elem.get('timeout', ''),
-                        exit_code=exit_code
-                    ))
-                
-                return True
-        except Exception as e:
-            self.log_message(f"Erreur lors de l'analyse XML: {str(e)}", "error")
+        """Analyse le XML et, s'il est bien formé, remplace le modèle par ses paquets"""
+        result = parse_wpkg(xml_content)
+        if result.errors:
+            line, column, message = result.errors[0]
+            self.log_message(f"Erreur lors de l'analyse XML: {message}", "error")
+            return False
+        return self.apply_parse_result(result)
+    
+    def apply_parse_result(self, result):
+        """Remplace le modèle par les paquets d'une analyse réussie"""
+        self.last_parse = result
+        if not result.packages:
             return False
+        
+        # Déclaration et commentaires appartiennent au fichier : ils suivent le paquet affiché
+        packages = result.packages
+        packages[0].comments = [comment.text for comment in result.comments]
+        packages[0].xml_declaration = result.xml_declaration or self.package.xml_declaration
+        self.packages = packages
+        self.package_index = 0
+        self.package = packages[0]
+        self.package_starts = [lines[("package", 0)] for lines in result.element_lines]
+        self.take_package_snapshot()
+        self.update_package_picker()
+        return True
+    
+    def update_package_picker(self):
+        """Met à jour la liste des paquets du sélecteur et le paquet affiché"""
+        self.package_picker['values'] = [f"{package.id} — {package.name}" for package in self.packages]
+        self.package_picker.current(self.package_index)
+        self.package_picker.config(state="readonly" if len(self.packages) > 1 else "disabled")
+        self.package_count_label.config(text=f"{self.package_index + 1}/{len(self.packages)}")
+    
+    def on_package_picked(self, event=None):
+        index = self.package_picker.current()
+        if index >= 0 and index != self.package_index:
+            self.select_package(index)
+    
+    def select_package(self, index):
+        """Affiche dans le formulaire le paquet numéro `index` du fichier"""
+        # Reporter le formulaire dans le paquet affiché avant d'en changer
+        for key, var in self.package_vars.items():
+            setattr(self.package, key, var.get())
+        
+        previous = self.package
+        self.package_index = index
+        self.package = self.packages[index]
+        self.package.comments = previous.comments
+        self.package.xml_declaration = previous.xml_declaration
+        self.take_package_snapshot()
+        
+        self.update_ui()
+        self.update_package_picker()
+        self.show_package_in_xml(index)
+        self.status_bar.set_status(f"Paquet {self.package.id} ({index + 1}/{len(self.packages)})")
+    
+    def show_package_in_xml(self, index):
+        """Fait défiler la vue XML jusqu'au paquet numéro `index`"""
+        if self.package_starts is None:
+            self.package_starts = locate_packages(self.xml_text.get("1.0", "end-1c"))
+        if index < len(self.package_starts):
+            position = f"{self.package_starts[index]}.0"
+            self.xml_text.text.mark_set(tk.INSERT, position)
+            self.xml_text.text.yview(position)
     
     def update_ui(self):
         # Mettre à jour l'onglet Général
@@ -2734,6 +5140,7 @@ Description du paquet personnalisé
         self.variables_tree.delete(*self.variables_tree.get_children())
         for var in self.package.variables:
             self.variables_tree.insert('', 'end', values=(var.name, var.value, var.architecture))
+        self.invalidate_variables()
         
         # Mettre à jour l'onglet Checks
         self.checks_tree.delete(*self.checks_tree.get_children())
@@ -2765,122 +5172,153 @@ Description du paquet personnalisé
         self.update_title()
     
     def update_xml(self):
+        # Les saisies en attente dans le XML forment leur propre entrée d'historique
+        self.commit_text_history()
+        
         # Récupérer les données du formulaire
         for key, var in self.package_vars.items():
             setattr(self.package, key, var.get())
         
-        # Créer le XML
-        root = ET.Element('packages')
+        # Ne réécrire que les éléments modifiés du paquet ; à défaut, régénérer tout le document
+        if not self.splice_package_changes():
+            self.regenerate_xml()
         
-        # Ajouter les commentaires
-        if self.package.comments:
-            comment_text = '<!--\n' + '\n\n'.join(self.package.comments) + '\n-->'
-            
-            # Note: ElementTree ne gère pas bien les commentaires, donc nous les ajouterons manuellement
-            # lors de la conversion en texte
+        # Ajouter à l'historique : changements du paquet depuis sa dernière écriture et du texte
+        snapshot = self.package_snapshot
+        self.add_to_history(package_operations(self.package_index, snapshot, self.package) if snapshot else ())
+        self.take_package_snapshot()
         
-        # Ajouter l'élément package
-        package = ET.SubElement(root, 'package')
-        for key, value in asdict(self.package).items():
-            if key in ["variables", "checks", "installs", "upgrades", "removes", "comments", "xml_declaration"]:
-                continue
-                
-            if value:  # Ne pas ajouter les attributs vides
-                package.set(key, value)
+        # Mettre à jour le titre (indique qu'il y a des modifications)
+        self.update_title()
+    
+    def take_package_snapshot(self):
+        """Mémorise le paquet affiché tel qu'il est écrit dans la vue XML"""
+        self.package_snapshot = copy.deepcopy(self.package)
+    
+    def read_package_source(self, line):
+        """Texte et structure de l'élément <package> commençant à la ligne `line` de la vue XML"""
+        start = self.xml_text.text.search("<package", f"{line}.0", f"{line}.end")
+        if not start:
+            return None
         
-        # Ajouter les variables
-        for var in self.package.variables:
-            var_elem = ET.SubElement(package, 'variable')
-            var_elem.set('name', var.name)
-            var_elem.set('value', var.value)
-            if var.architecture:
-                var_elem.set('architecture', var.architecture)
+        # Lire par blocs croissants jusqu'à la fermeture de l'élément
+        lines = 64
+        while True:
+            content = self.xml_text.text.get(start, f"{start} + {lines} lines")
+            element = scan_element(content)
+            if element is not None:
+                return start, content[:element.end], element
+            if self.xml_text.text.compare(f"{start} + {lines} lines", ">=", "end-1c"):
+                return None
+            lines *= 4
+    
+    def splice_package_changes(self):
+        """Applique à la vue XML les seules modifications du paquet affiché depuis sa dernière écriture
+
+        Retourne False si le texte ne correspond plus au paquet mémorisé (modifié à la main,
+        par exemple) ou si le changement ne se limite pas à l'élément <package> : il faut alors
+        régénérer le document.
+        """
+        snapshot = self.package_snapshot
+        if snapshot is None or self.package_starts is None or self.package_index >= len(self.package_starts):
+            return False
+        if (snapshot.comments, snapshot.xml_declaration) != (self.package.comments, self.package.xml_declaration):
+            return False
+        if package_content(snapshot) == package_content(self.package):
+            return True
         
-        # Ajouter les checks
-        for check in self.package.checks:
-            check_elem = ET.SubElement(package, 'check')
-            check_elem.set('type', check.type)
-            check_elem.set('condition', check.condition)
-            check_elem.set('path', check.path)
-            if check.value:
-                check_elem.set('value', check.value)
-            if check.architecture:
-                check_elem.set('architecture', check.architecture)
-        
-        # Ajouter les commandes d'installation
-        for install in self.package.installs:
-            install_elem = ET.SubElement(package, 'install')
-            if install.cmd:
-                install_elem.set('cmd', install.cmd)
-            if install.include:
-                install_elem.set('include', install.include)
-            if install.timeout:
-                install_elem.set('timeout', install.timeout)
-            if install.exit_code:
-                exit_elem = ET.SubElement(install_elem, 'exit')
-                exit_elem.set('code', install.exit_code)
-        
-        # Ajouter les commandes de mise à niveau
-        for upgrade in self.package.upgrades:
-            upgrade_elem = ET.SubElement(package, 'upgrade')
-            if upgrade.include:
-                upgrade_elem.set('include', upgrade.include)
-            if upgrade.cmd:
-                upgrade_elem.set('cmd', upgrade.cmd)
+        line = self.package_starts[self.package_index]
+        source = self.read_package_source(line)
+        if source is None:
+            return False
+        start, text, element = source
         
-        # Ajouter les commandes de suppression
-        for remove in self.package.removes:
-            remove_elem = ET.SubElement(package, 'remove')
-            if remove.cmd:
-                remove_elem.set('cmd', remove.cmd)
-            if remove.timeout:
-                remove_elem.set('timeout', remove.timeout)
-            if remove.exit_code:
-                exit_elem = ET.SubElement(remove_elem, 'exit')
-                exit_elem.set('code', remove.exit_code)
-        
-        # Convertir en texte XML
-        xml_str = minidom.parseString(ET.tostring(root, encoding='utf-8')).toprettyxml(indent="  ")
-        
-        # Ajouter la déclaration XML au début
-        xml_str = self.package.xml_declaration + '\n\n' + xml_str
-        
-        # Insérer les commentaires après la balise <packages>
-        if self.package.comments:
-            comment_text = '\n<!--\n' + '\n\n'.join(self.package.comments) + '\n-->\n'
-            xml_str = xml_str.replace('<packages>\n', '<packages>\n' + comment_text)
-        
-        # Mettre à jour la zone de texte XML
-        self.xml_text.delete(1.0, tk.END)
-        self.xml_text.insert(tk.END, xml_str)
-        self.xml_text.highlight_syntax()
+        # Le texte doit être celui du paquet mémorisé (coût proportionnel à l'élément)
+        try:
+            written = package_from_element(etree.fromstring(text.encode('utf-8')))
+        except etree.XMLSyntaxError:
+            return False
+        if package_content(written) != package_content(snapshot):
+            return False
         
-        # Ajouter à l'historique
-        self.add_to_history()
+        edits = package_edits(text, element, snapshot, self.package,
+                              self.user_settings["xml_quote"], self.user_settings["cmd_quote"])
+        if edits is None:
+            return False
         
-        # Mettre à jour le titre (indique qu'il y a des modifications)
-        self.update_title()
+        # Appliquer les modifications de la fin vers le début : les positions restent valides
+        lines = LineIndex(text, first_line=line)
+        start_col = int(start.split(".")[1])
+        
+        def to_index(offset):
+            edit_line, col = lines.position(offset)
+            return f"{edit_line}.{col + start_col if edit_line == line else col}"
+        
+        added_lines = 0
+        with self.xml_text.frozen():
+            for edit_start, edit_end, replacement in reversed(sorted(edits, key=lambda edit: edit[:2])):
+                index = to_index(edit_start)
+                if edit_end > edit_start:
+                    self.xml_text.delete(index, to_index(edit_end))
+                if replacement:
+                    self.xml_text.insert(index, replacement)
+                added_lines += replacement.count("\n") - text.count("\n", edit_start, edit_end)
+        
+        # Décaler les paquets suivants
+        if added_lines:
+            for index in range(self.package_index + 1, len(self.package_starts)):
+                self.package_starts[index] += added_lines
+        return True
+    
+    def regenerate_xml(self):
+        """Réécrit tout le document XML à partir du modèle"""
+        xml_str = serialize_packages(self.packages, self.package.xml_declaration, self.comment_placement(),
+                                     self.user_settings["xml_quote"], self.user_settings["cmd_quote"])
+        
+        # Mettre à jour la zone de texte XML (seule la partie qui diffère est réécrite)
+        self.xml_text.patch_text(xml_str)
+        
+        # Lignes de début des paquets, pour les prochaines modifications en place
+        self.package_starts = locate_packages(xml_str)
+    
+    def comment_placement(self):
+        """Commentaires à écrire devant chaque paquet (voir write_packages)
+        
+        Tant que les commentaires et les paquets sont ceux de la dernière analyse, chacun
+        reste devant son paquet ; sinon ils sont tous écrits en tête du document.
+        """
+        result = self.last_parse
+        if (result is not None and len(result.element_lines) == len(self.packages)
+                and [comment.text for comment in result.comments] == self.package.comments):
+            return comment_placement(result.comments, result.element_lines)
+        return {0: self.package.comments}
     
     def update_from_xml(self):
         # Récupérer le contenu XML de la zone de texte
         xml_content = self.xml_text.get(1.0, tk.END)
         
         try:
-            # Analyser le contenu XML
-            result = self.parse_xml(xml_content)
+            # Analyser le contenu XML (une seule analyse sert aussi à la vérification)
+            result = parse_wpkg(xml_content)
             
-            if result:
+            # Les saisies en attente forment leur propre entrée d'historique
+            self.commit_text_history()
+            previous_packages = self.packages
+            
+            if not result.errors and self.apply_parse_result(result):
                 # Mettre à jour l'interface
                 self.update_ui()
                 
+                self.clear_logs()
                 self.log_message("Formulaire mis à jour depuis XML", "success")
                 
                 # Ajouter à l'historique
-                self.add_to_history()
+                self.add_to_history(packages_operations(previous_packages, self.packages))
                 
-                # Vérifier le XML
-                self.verify_xml()
+                # Résultat de la vérification
+                self.show_parse_result(result, clear_logs=False)
             else:
+                self.show_parse_result(result)
                 self.log_message("Échec de l'analyse XML. Vérifiez le format du XML.", "error")
         except Exception as e:
             self.log_message(f"Échec d'analyse XML: {str(e)}", "error")
@@ -2890,26 +5328,37 @@ Description du paquet personnalisé
         xml_content = self.xml_text.get(1.0, tk.END)
         
         try:
-            # Formater le XML avec lxml pour une meilleure indentation
-            parser = etree.XMLParser(remove_blank_text=True)
-            root = etree.fromstring(xml_content.encode('utf-8'), parser)
-            formatted_xml = etree.tostring(root, pretty_print=True, encoding='utf-8').decode('utf-8')
-            
-            # Préserver la déclaration XML
-            xml_decl_match = re.match(r'<\?xml[^>]*\?>', xml_content)
-            if xml_decl_match:
-                formatted_xml = xml_decl_match.group(0) + '\n\n' + formatted_xml
-            
-            # Préserver les commentaires (approximation - une solution plus robuste nécessiterait un analyseur qui préserve les commentaires)
-            comment_matches = re.findall(r'<!--(.*?)-->', xml_content, re.DOTALL)
-            if comment_matches and '<packages>' in formatted_xml:
-                comment_text = '\n<!--\n' + '\n\n'.join(c.strip() for c in comment_matches) + '\n-->\n'
-                formatted_xml = formatted_xml.replace('<packages>\n', '<packages>\n' + comment_text)
+            # Réécrire le document dans le style des paquets WPKG, commentaires à leur place,
+            # si le modèle en couvre tout le contenu
+            formatted_xml = None
+            result = parse_wpkg(xml_content)
+            if not result.errors and result.packages:
+                candidate = serialize_packages(result.packages, result.xml_declaration,
+                                               comment_placement(result.comments, result.element_lines),
+                                               self.user_settings["xml_quote"], self.user_settings["cmd_quote"])
+                if equivalent_xml(candidate, xml_content):
+                    formatted_xml = candidate
+            
+            if formatted_xml is None:
+                # Formater le XML avec lxml pour une meilleure indentation
+                parser = etree.XMLParser(remove_blank_text=True)
+                root = etree.fromstring(xml_content.encode('utf-8'), parser)
+                formatted_xml = etree.tostring(root, pretty_print=True, encoding='utf-8').decode('utf-8')
+                
+                # Préserver la déclaration XML
+                xml_decl_match = re.match(r'<\?xml[^>]*\?>', xml_content)
+                if xml_decl_match:
+                    formatted_xml = xml_decl_match.group(0) + '\n\n' + formatted_xml
+                
+                # Préserver les commentaires (approximation - une solution plus robuste nécessiterait un analyseur qui préserve les commentaires)
+                comment_matches = re.findall(r'<!--(.*?)-->', xml_content, re.DOTALL)
+                if comment_matches and '<packages>' in formatted_xml:
+                    comment_text = '\n<!--\n' + '\n\n'.join(c.strip() for c in comment_matches) + '\n-->\n'
+                    formatted_xml = formatted_xml.replace('<packages>\n', '<packages>\n' + comment_text)
             
             # Mettre à jour la zone de texte XML
-            self.xml_text.delete(1.0, tk.END)
-            self.xml_text.insert(tk.END, formatted_xml)
-            self.xml_text.highlight_syntax()
+            self.xml_text.patch_text(formatted_xml)
+            self.package_starts = locate_packages(formatted_xml)
             
             self.log_message("XML formaté avec succès", "success")
         except Exception as e:
@@ -2961,6 +5410,7 @@ Description du paquet personnalisé
         
         # Ajouter à l'arbre
         self.variables_tree.insert('', 'end', values=(name, value, arch))
+        self.invalidate_variables()
         
         # Effacer les champs
         self.var_name.set('')
@@ -2999,6 +5449,7 @@ Description du paquet personnalisé
                 value=value,
                 architecture=arch
             )
+            self.invalidate_variables()
         
         # Mettre à jour le XML
         self.update_xml()
@@ -3023,6 +5474,7 @@ Description du paquet personnalisé
         # Supprimer de la liste des variables
         if 0 <= item_index < len(self.package.variables):
             del self.package.variables[item_index]
+            self.invalidate_variables()
         
         # Effacer les champs
         self.var_name.set('')
@@ -3061,6 +5513,7 @@ Description du paquet personnalisé
         
         # Ajouter à l'arbre
         self.variables_tree.insert('', 'end', values=(new_name, value, arch))
+        self.invalidate_variables()
         
         # Mettre à jour le XML
         self.update_xml()
@@ -3629,6 +6082,14 @@ Description du paquet personnalisé
         # Arrêter le timer de sauvegarde automatique
         self.stop_autosave_timer()
         
+        # Laisser se terminer les enregistrements en cours
+        self.save_executor.shutdown(wait=True)
+        self.file_watcher.stop()
+        
+        # Fermeture volontaire : les modifications non enregistrées sont abandonnées
+        self.journal.discard()
+        self.journal.close()
+        
         # Enregistrer les paramètres
         self.save_settings()
         
@@ -3638,6 +6099,10 @@ Description du paquet personnalisé
 
 # Point d'entrée de l'application
 def main():
+    # Avec des arguments : mode ligne de commande, sans interface graphique
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
+    
     root = tk.Tk()
     app = WPKGEditor(root)
     
@@ -0,0 +1,1153 @@
+"""Cœur de l'Éditeur de Paquets WPKG, sans interface graphique
+
+Modèle des paquets, analyse et écriture des fichiers packages.xml, modifications ciblées du
+texte, résolution des variables des commandes, contrôles (lint) et mode ligne de commande.
+Partagé par l'éditeur (wpkg-edit-1.2.py) et les traitements par lots. L'importer ne charge ni
+tkinter ni lxml : lxml, hashlib, tempfile, difflib et le pool de processus sont importés
+à la première utilisation.
+
+    python wpkg_core.py validate|lint|format [options] CHEMINS...
+"""
+
+import os
+import sys
+import re
+import _thread
+import io
+import codecs
+from bisect import bisect_right
+from itertools import accumulate
+from collections import Counter
+
+# Encodages mono-octets dans lesquels un fichier déclaré peut en réalité être écrit en UTF-8
+SINGLE_BYTE_ENCODINGS = ("iso8859-1", "iso8859-15", "cp1252")
+
+# Dossier des données propres à l'utilisateur (caches, journaux), voir user_cache_folder
+USER_CACHE_NAME = "wpkg-editor"
+
+# Mode ligne de commande : extensions des fichiers de paquets parcourus, fichiers par tâche du
+# pool, cache des résultats par fichier (dans le dossier de l'utilisateur) et version de son
+# format (à incrémenter si les contrôles changent), valeurs admises par les contrôles du paquet
+PACKAGE_EXTENSIONS = (".xml",)
+CLI_BATCH = 32
+CLI_CACHE_FILE = "cli_cache.json"
+CLI_CACHE_VERSION = 1
+REBOOT_VALUES = ("true", "false", "postponed")
+COMMAND_INCLUDES = ("install", "upgrade", "remove", "downgrade")
+
+# Variables système remplacées lors de la construction des commandes
+SYSTEM_VARIABLES = {
+    "SYSTEMDRIVE": "C:",
+    "SOFTWARE": "C:\\Software",
+    "ComSpec": "C:\\Windows\\System32\\cmd.exe"
+}
+
+# Variables d'environnement Windows courantes proposées à la complétion des références %NOM%
+KNOWN_SYSTEM_VARIABLES = (
+    "ALLUSERSPROFILE", "APPDATA", "COMMONPROGRAMFILES", "COMPUTERNAME", "PROCESSOR_ARCHITECTURE",
+    "PROGRAMDATA", "PROGRAMFILES", "PROGRAMFILES(X86)", "SYSTEMROOT", "TEMP", "WINDIR"
+)
+
+# Classes du modèle écrites à la main plutôt qu'avec dataclasses : le modèle est instancié pour
+# chaque paquet d'un dépôt (__slots__, sans __dict__ par instance), et dataclasses (avec
+# inspect) doublerait le temps d'import du cœur
+class _Model:
+    """Base du modèle : égalité, copie et affichage d'après les champs déclarés dans __slots__"""
+    __slots__ = ()
+    __hash__ = None
+
+    def values(self):
+        """Valeurs des champs, dans l'ordre de déclaration (équivalent de dataclasses.astuple
+        pour les champs simples)"""
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self.values() == other.values()
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{self.__class__.__name__}({fields})"
+
+
+class Variable(_Model):
+    __slots__ = ("name", "value", "architecture")
+
+    def __init__(self, name, value, architecture=""):
+        self.name = name
+        self.value = value
+        self.architecture = architecture
+
+
+class Check(_Model):
+    __slots__ = ("type", "condition", "path", "value", "architecture")
+
+    def __init__(self, type, condition, path, value="", architecture=""):
+        self.type = type
+        self.condition = condition
+        self.path = path
+        self.value = value
+        self.architecture = architecture
+
+
+class Command(_Model):
+    __slots__ = ("cmd", "include", "timeout", "exit_code")
+
+    def __init__(self, cmd="", include="", timeout="", exit_code=""):
+        self.cmd = cmd
+        self.include = include
+        self.timeout = timeout
+        self.exit_code = exit_code
+
+
+# Attributs de l'élément <package>, dans l'ordre d'écriture
+PACKAGE_ATTRIBUTES = ("id", "name", "revision", "date", "reboot", "category", "priority")
+
+
+class Package(_Model):
+    __slots__ = PACKAGE_ATTRIBUTES + ("variables", "checks", "installs", "upgrades", "removes",
+                                      "comments", "xml_declaration")
+
+    def __init__(self, id="", name="", revision="", date="", reboot="false", category="",
+                 priority="", variables=None, checks=None, installs=None, upgrades=None,
+                 removes=None, comments=None,
+                 xml_declaration='<?xml version="1.0" encoding="iso-8859-1"?>'):
+        self.id = id
+        self.name = name
+        self.revision = revision
+        self.date = date
+        self.reboot = reboot
+        self.category = category
+        self.priority = priority
+        self.variables = [] if variables is None else variables
+        self.checks = [] if checks is None else checks
+        self.installs = [] if installs is None else installs
+        self.upgrades = [] if upgrades is None else upgrades
+        self.removes = [] if removes is None else removes
+        self.comments = [] if comments is None else comments
+        self.xml_declaration = xml_declaration
+
+
+# Listes du modèle Package correspondant aux éléments enfants de <package>
+ELEMENT_LISTS = {
+    "variable": "variables",
+    "check": "checks",
+    "install": "installs",
+    "upgrade": "upgrades",
+    "remove": "removes"
+}
+
+_XML_DECLARATION_RE = re.compile(r'<\?xml[^>]*\?>')
+
+
+class XmlComment(_Model):
+    __slots__ = ("text", "line", "anchor_line")
+
+    def __init__(self, text, line, anchor_line=None):
+        self.text = text
+        self.line = line
+        # Ligne de l'élément qui suit le commentaire (None en fin de document)
+        self.anchor_line = anchor_line
+
+
+class ParseResult(_Model):
+    __slots__ = ("packages", "xml_declaration", "comments", "element_lines", "errors")
+
+    def __init__(self, packages=None, xml_declaration="", comments=None, element_lines=None,
+                 errors=None):
+        self.packages = [] if packages is None else packages
+        self.xml_declaration = xml_declaration
+        self.comments = [] if comments is None else comments
+        # Pour chaque paquet : ligne source par (liste du modèle, rang), ("package", 0) pour <package>
+        self.element_lines = [] if element_lines is None else element_lines
+        # Erreurs de syntaxe : (ligne, colonne, message)
+        self.errors = [] if errors is None else errors
+
+
+def _shared(elem, name, default=''):
+    """Valeur d'attribut répétée d'un paquet à l'autre (timeout="60", condition="versionequalto"...) :
+    une seule chaîne partagée par valeur"""
+    return sys.intern(elem.get(name, default))
+
+
+def package_from_element(package_elem):
+    """Construit un Package à partir d'un élément <package> (ElementTree ou lxml)
+
+    Les valeurs propres à chaque paquet (id, nom, commandes, chemins...) sont gardées telles
+    quelles, les autres sont partagées (voir _shared).
+    """
+    package = Package()
+    
+    # Attributs du paquet
+    package.id = package_elem.get('id', '')
+    package.name = package_elem.get('name', '')
+    package.revision = package_elem.get('revision', '')
+    package.date = _shared(package_elem, 'date')
+    package.reboot = _shared(package_elem, 'reboot', 'false')
+    package.category = _shared(package_elem, 'category')
+    package.priority = _shared(package_elem, 'priority')
+    
+    # Extraire les variables
+    for var_elem in package_elem.findall('./variable'):
+        package.variables.append(Variable(
+            name=_shared(var_elem, 'name'),
+            value=var_elem.get('value', ''),
+            architecture=_shared(var_elem, 'architecture')
+        ))
+    
+    # Extraire les checks
+    for check_elem in package_elem.findall('./check'):
+        package.checks.append(Check(
+            type=_shared(check_elem, 'type'),
+            condition=_shared(check_elem, 'condition'),
+            path=check_elem.get('path', ''),
+            value=check_elem.get('value', ''),
+            architecture=_shared(check_elem, 'architecture')
+        ))
+    
+    # Extraire les commandes d'installation
+    for install_elem in package_elem.findall('./install'):
+        exit_code = ""
+        exit_elem = install_elem.find('./exit')
+        if exit_elem is not None:
+            exit_code = _shared(exit_elem, 'code')
+        
+        package.installs.append(Command(
+            cmd=install_elem.get('cmd', ''),
+            include=_shared(install_elem, 'include'),
+            timeout=_shared(install_elem, 'timeout'),
+            exit_code=exit_code
+        ))
+    
+    # Extraire les commandes de mise à niveau
+    for upgrade_elem in package_elem.findall('./upgrade'):
+        package.upgrades.append(Command(
+            include=_shared(upgrade_elem, 'include'),
+            cmd=upgrade_elem.get('cmd', '')
+        ))
+    
+    # Extraire les commandes de suppression
+    for remove_elem in package_elem.findall('./remove'):
+        exit_code = ""
+        exit_elem = remove_elem.find('./exit')
+        if exit_elem is not None:
+            exit_code = _shared(exit_elem, 'code')
+        
+        package.removes.append(Command(
+            cmd=remove_elem.get('cmd', ''),
+            timeout=_shared(remove_elem, 'timeout'),
+            exit_code=exit_code
+        ))
+    
+    return package
+
+
+def package_element_lines(package_elem):
+    """Lignes source d'un <package> et de ses enfants, par (liste du modèle, rang)"""
+    lines = {("package", 0): package_elem.sourceline}
+    counts = {}
+    for child in package_elem:
+        list_name = ELEMENT_LISTS.get(child.tag)
+        if list_name is not None:
+            rank = counts.get(list_name, 0)
+            counts[list_name] = rank + 1
+            lines[(list_name, rank)] = child.sourceline
+    return lines
+
+
+def _release_element(elem):
+    """Vide un élément déjà converti et retire de l'arbre ceux qui le précèdent"""
+    elem.clear()
+    while elem.getprevious() is not None:
+        del elem.getparent()[0]
+
+
+def iter_packages(source):
+    """Produit les paquets d'un fichier packages.xml au fil de l'analyse (lxml.etree.iterparse)
+
+    Chaque élément <package> est vidé dès sa conversion et retiré de l'arbre avec ses
+    prédécesseurs : la mémoire de pointe ne dépend que de la taille d'un paquet.
+    """
+    from lxml import etree
+    for event, package_elem in etree.iterparse(source, events=("end",), tag="package",
+                                                resolve_entities=False):
+        yield package_from_element(package_elem)
+        _release_element(package_elem)
+
+
+def parse_wpkg(xml_content):
+    """Analyse un document WPKG en un seul passage lxml
+
+    Produit le modèle de tous les paquets, les commentaires avec leur position, la ligne
+    source de chaque élément et les erreurs de syntaxe. En cas d'erreur, les paquets
+    complets qui la précèdent sont conservés.
+    """
+    result = ParseResult()
+    
+    # Le texte est déjà décodé : sans sa déclaration, il est relu en UTF-8. La fin de la
+    # première ligne est conservée, les numéros de ligne restent donc ceux du texte.
+    declaration = _XML_DECLARATION_RE.match(xml_content)
+    if declaration:
+        result.xml_declaration = declaration.group(0)
+        xml_content = xml_content[declaration.end():]
+    
+    _parse_events(io.BytesIO(xml_content.encode('utf-8')), result)
+    return result
+
+
+def parse_wpkg_bytes(data):
+    """Analyse le contenu brut d'un fichier comme parse_wpkg, sans le décoder au préalable :
+    lxml le décode selon sa déclaration XML"""
+    result = ParseResult()
+    head = data[len(codecs.BOM_UTF8):256] if data.startswith(codecs.BOM_UTF8) else data[:256]
+    declaration = _XML_DECLARATION_RE.match(bytes(head).decode('latin-1'))
+    if declaration:
+        result.xml_declaration = declaration.group(0)
+    
+    _parse_events(io.BytesIO(data), result)
+    return result
+
+
+def _parse_events(source, result):
+    """Remplit `result` à partir des événements lxml du document `source`"""
+    from lxml import etree
+    pending_comments = []
+    try:
+        for event, elem in etree.iterparse(source, events=("start", "end", "comment"), resolve_entities=False):
+            if event == "comment":
+                comment = XmlComment((elem.text or "").strip(), elem.sourceline)
+                result.comments.append(comment)
+                pending_comments.append(comment)
+            elif event == "start":
+                # Un commentaire est rattaché à l'élément qui le suit
+                for comment in pending_comments:
+                    comment.anchor_line = elem.sourceline
+                pending_comments = []
+            elif elem.tag == "package":
+                result.packages.append(package_from_element(elem))
+                result.element_lines.append(package_element_lines(elem))
+                _release_element(elem)
+    except etree.XMLSyntaxError as e:
+        line, column = e.position
+        result.errors.append((line, column, str(e)))
+
+
+# Listes d'éléments d'un Package et classe de leurs éléments, dans l'ordre de result_to_plain
+_MODEL_LISTS = (("variables", Variable), ("checks", Check), ("installs", Command),
+                ("upgrades", Command), ("removes", Command))
+
+
+def result_to_plain(result):
+    """ParseResult en listes, chaînes et nombres (sérialisable en JSON), relu par result_from_plain"""
+    return {
+        "packages": [
+            [[getattr(package, name) for name in PACKAGE_ATTRIBUTES],
+             [[item.values() for item in getattr(package, name)] for name, _ in _MODEL_LISTS],
+             package.comments, package.xml_declaration]
+            for package in result.packages
+        ],
+        "xml_declaration": result.xml_declaration,
+        "comments": [comment.values() for comment in result.comments],
+        "element_lines": [[(name, rank, line) for (name, rank), line in lines.items()]
+                          for lines in result.element_lines],
+        "errors": result.errors,
+    }
+
+
+def result_from_plain(data):
+    """Reconstruit le ParseResult de result_to_plain (ValueError, TypeError, KeyError si `data`
+    n'a pas la forme attendue)"""
+    packages = []
+    for attributes, lists, comments, xml_declaration in data["packages"]:
+        if len(lists) != len(_MODEL_LISTS):
+            raise ValueError("listes d'éléments du paquet incomplètes")
+        package = Package(*attributes, comments=list(comments), xml_declaration=xml_declaration)
+        for (name, cls), items in zip(_MODEL_LISTS, lists):
+            setattr(package, name, [cls(*values) for values in items])
+        packages.append(package)
+    return ParseResult(
+        packages,
+        data["xml_declaration"],
+        [XmlComment(*values) for values in data["comments"]],
+        [{(name, rank): line for name, rank, line in lines} for lines in data["element_lines"]],
+        [tuple(error) for error in data["errors"]],
+    )
+
+
+# Attributs écrits pour chaque élément enfant : (attribut, champ du modèle, écrit même vide)
+CHILD_ATTRIBUTES = {
+    "variable": (("name", "name", True), ("value", "value", True), ("architecture", "architecture", False)),
+    "check": (("type", "type", True), ("condition", "condition", True), ("path", "path", True),
+              ("value", "value", False), ("architecture", "architecture", False)),
+    "install": (("cmd", "cmd", False), ("include", "include", False), ("timeout", "timeout", False)),
+    "upgrade": (("include", "include", False), ("cmd", "cmd", False)),
+    "remove": (("cmd", "cmd", False), ("timeout", "timeout", False))
+}
+
+# Éléments enfants dans l'ordre d'écriture d'un paquet
+CHILD_TAGS = ("variable", "check", "install", "upgrade", "remove")
+
+_MARKUP_RE = re.compile(
+    r'<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>|<(/?)([\w:.-]+)((?:[^<>"\']+|"[^"]*"|\'[^\']*\')*)>',
+    re.DOTALL
+)
+_ATTRIBUTE_SPAN_RE = re.compile(r'(\s+)([\w:.-]+)(\s*=\s*)(?:"([^"]*)"|\'([^\']*)\')')
+
+
+class SourceElement(_Model):
+    """Élément du texte source : positions de début, de fin de la balise ouvrante et de fin"""
+    __slots__ = ("tag", "start", "start_tag_end", "end", "children")
+
+    def __init__(self, tag, start, start_tag_end, end=0, children=None):
+        self.tag = tag
+        self.start = start
+        self.start_tag_end = start_tag_end
+        self.end = end
+        self.children = [] if children is None else children
+
+
+def scan_element(text, pos=0):
+    """Délimite l'élément qui commence à `pos` et ses descendants (None s'il n'est pas fermé)"""
+    stack = []
+    for match in _MARKUP_RE.finditer(text, pos):
+        closing, tag, attributes = match.groups()
+        if tag is None:
+            # Commentaire, section CDATA ou instruction de traitement
+            continue
+        if closing:
+            element = stack.pop()
+            element.end = match.end()
+        else:
+            element = SourceElement(tag, match.start(), match.end())
+            if stack:
+                stack[-1].children.append(element)
+            if not attributes.rstrip().endswith("/"):
+                stack.append(element)
+                continue
+            element.end = match.end()
+        if not stack:
+            return element
+    return None
+
+
+def quote_value(value, quote='"'):
+    """Valeur d'attribut échappée entre `quote`, ou entre l'autre guillemet si elle en contient"""
+    value = value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    if quote in value:
+        quote = "'" if quote == '"' else '"'
+    if quote in value:
+        value = value.replace(quote, "&quot;" if quote == '"' else "&apos;")
+    return f"{quote}{value}{quote}"
+
+
+def format_attribute(name, value, quote='"'):
+    """Écrit name="value", entre apostrophes si la valeur contient des guillemets"""
+    return f"{name}={quote_value(value, quote)}"
+
+
+def serialize_child(tag, item, quote='"', cmd_quote="'"):
+    """Écrit un élément enfant de <package> sur une ligne, dans le style des paquets WPKG"""
+    attributes = " ".join(
+        format_attribute(name, getattr(item, attr), cmd_quote if name == "cmd" else quote)
+        for name, attr, required in CHILD_ATTRIBUTES[tag]
+        if required or getattr(item, attr)
+    )
+    exit_code = getattr(item, "exit_code", "")
+    if exit_code:
+        return f'<{tag} {attributes} >{"<exit " + format_attribute("code", exit_code, quote) + " />"}</{tag}>'
+    return f"<{tag} {attributes} />"
+
+
+def write_comment(out, text):
+    """Écrit un commentaire sur ses propres lignes, suivi d'une ligne vide"""
+    # « -- » est interdit dans un commentaire XML
+    while "--" in text:
+        text = text.replace("--", "- -")
+    out.write(f"<!--\n{text}\n-->\n\n")
+
+
+def write_package(out, package, quote='"', cmd_quote="'", indent="  "):
+    """Écrit l'élément <package> sur le flux `out`, dans le style des paquets WPKG
+
+    Les attributs du paquet sont alignés sous le premier, les éléments enfants écrits un
+    par ligne et regroupés par type, chaque groupe précédé d'une ligne vide.
+    """
+    attributes = [(key, getattr(package, key)) for key in PACKAGE_ATTRIBUTES if getattr(package, key)]
+    if attributes:
+        (first, value), *others = attributes
+        out.write(f"<package {first} = {quote_value(value, quote)}")
+        width = max((len(key) for key, _ in others), default=0)
+        for key, value in others:
+            out.write(f"\n   {key:<{width}} = {quote_value(value, quote)}")
+        out.write(" >\n")
+    else:
+        out.write("<package>\n")
+    
+    for tag in CHILD_TAGS:
+        items = getattr(package, ELEMENT_LISTS[tag])
+        if items:
+            out.write("\n")
+            for item in items:
+                out.write(f"{indent}{serialize_child(tag, item, quote, cmd_quote)}\n")
+    out.write("</package>\n")
+
+
+def write_packages(out, packages, xml_declaration="", comments=None, quote='"', cmd_quote="'"):
+    """Écrit un document WPKG complet sur le flux `out`, sans arbre intermédiaire
+
+    `comments` associe à un rang de paquet les commentaires écrits juste avant lui ; le rang
+    len(packages) désigne la fin du document.
+    """
+    comments = comments or {}
+    if xml_declaration:
+        out.write(f"{xml_declaration}\n\n")
+    out.write("<packages>\n\n")
+    for index, package in enumerate(packages):
+        for text in comments.get(index, ()):
+            write_comment(out, text)
+        write_package(out, package, quote, cmd_quote)
+        out.write("\n")
+    for text in comments.get(len(packages), ()):
+        write_comment(out, text)
+    out.write("</packages>\n")
+
+
+def serialize_packages(packages, xml_declaration="", comments=None, quote='"', cmd_quote="'"):
+    """Texte du document WPKG écrit par write_packages"""
+    out = io.StringIO()
+    write_packages(out, packages, xml_declaration, comments, quote, cmd_quote)
+    return out.getvalue()
+
+
+def comment_placement(comments, element_lines):
+    """Rang du paquet devant lequel réécrire chaque commentaire d'une analyse (voir write_packages)
+
+    Un commentaire situé dans un paquet est remonté devant lui ; un commentaire qui ne
+    précède aucun élément va en fin de document.
+    """
+    starts = [lines[("package", 0)] for lines in element_lines]
+    placement = {}
+    for comment in comments:
+        if comment.anchor_line is None:
+            index = len(starts)
+        else:
+            index = max(bisect_right(starts, comment.anchor_line) - 1, 0)
+        placement.setdefault(index, []).append(comment.text)
+    return placement
+
+
+def equivalent_xml(first, second):
+    """Vrai si deux documents ont les mêmes éléments, attributs et textes
+
+    La mise en forme, l'ordre des attributs et les commentaires sont ignorés.
+    """
+    from lxml import etree
+    parser = etree.XMLParser(remove_blank_text=True, remove_comments=True, resolve_entities=False)
+    
+    def canonical(text):
+        # Texte déjà décodé : la déclaration (et son encodage) est retirée avant relecture
+        declaration = _XML_DECLARATION_RE.match(text)
+        if declaration:
+            text = text[declaration.end():]
+        return etree.tostring(etree.fromstring(text.encode('utf-8'), parser), method="c14n")
+    
+    try:
+        return canonical(first) == canonical(second)
+    except etree.XMLSyntaxError:
+        return False
+
+
+class LineIndex:
+    """Table des débuts de ligne : convertit un décalage en index Tk « ligne.colonne »"""
+    def __init__(self, content, first_line=1):
+        self.first_line = first_line
+        self.starts = [0, *accumulate(len(line) + 1 for line in content.split("\n")[:-1])]
+    
+    def position(self, offset):
+        row = bisect_right(self.starts, offset) - 1
+        return self.first_line + row, offset - self.starts[row]
+    
+    def index(self, offset):
+        return "%d.%d" % self.position(offset)
+
+
+def locate_packages(text):
+    """Lignes de début des éléments <package> de `text`, hors commentaires"""
+    lines = LineIndex(text)
+    return [
+        lines.position(match.start())[0]
+        for match in re.finditer(r'<!--.*?-->|<package\b', text, re.DOTALL)
+        if not match.group(0).startswith("<!--")
+    ]
+
+
+def package_content(package):
+    """Contenu d'un paquet propre à son élément <package> (sans déclaration ni commentaires)"""
+    return (tuple(getattr(package, key) for key in PACKAGE_ATTRIBUTES),
+            package.variables, package.checks, package.installs, package.upgrades, package.removes)
+
+
+def attribute_edits(text, element, changes, quote='"', cmd_quote="'"):
+    """Modifications de la balise ouvrante de `element` donnant aux attributs les valeurs de `changes`
+
+    Une valeur vide retire l'attribut ; les autres attributs, l'alignement et le type de
+    guillemets sont conservés. Les attributs ajoutés sont écrits entre `quote` (`cmd_quote`
+    pour cmd).
+    """
+    edits = []
+    remaining = dict(changes)
+    last_end = element.start + 1 + len(element.tag)
+    for match in _ATTRIBUTE_SPAN_RE.finditer(text, last_end, element.start_tag_end):
+        last_end = match.end()
+        name = match.group(2)
+        if name not in remaining:
+            continue
+        value = remaining.pop(name)
+        if not value:
+            edits.append((match.start(), match.end(), ""))
+        else:
+            existing = '"' if match.group(4) is not None else "'"
+            edits.append((match.end(3), match.end(), quote_value(value, existing)))
+    
+    # Attributs absents de la balise : ajoutés après le dernier
+    added = "".join(f" {format_attribute(name, value, cmd_quote if name == 'cmd' else quote)}"
+                    for name, value in remaining.items() if value)
+    if added:
+        edits.append((last_end, last_end, added))
+    return edits
+
+
+def _line_bounds(text, start, end):
+    """Étend [start, end) aux lignes entières si elles ne contiennent rien d'autre"""
+    line_start = text.rfind("\n", 0, start) + 1
+    line_end = text.find("\n", end)
+    line_end = len(text) if line_end == -1 else line_end
+    if text[line_start:start].strip() or text[end:line_end].strip():
+        return start, end
+    return line_start, min(line_end + 1, len(text))
+
+
+def _indentation(text, pos):
+    line_start = text.rfind("\n", 0, pos) + 1
+    prefix = text[line_start:pos]
+    return prefix if not prefix.strip() else "  "
+
+
+def package_edits(text, element, old, new, quote='"', cmd_quote="'"):
+    """Modifications du texte `text` de l'élément <package> `element` pour passer de `old` à `new`
+
+    Retourne des (début, fin, remplacement) sans chevauchement, ou None si le paquet doit être
+    réécrit en entier (élément vide auto-fermant qui reçoit des enfants).
+    """
+    from difflib import SequenceMatcher
+    edits = []
+    
+    # Attributs de <package>
+    changes = {key: getattr(new, key) for key in PACKAGE_ATTRIBUTES if getattr(old, key) != getattr(new, key)}
+    if changes:
+        edits += attribute_edits(text, element, changes, quote, cmd_quote)
+    
+    # Éléments enfants, liste par liste
+    spans = {tag: [child for child in element.children if child.tag == tag] for tag in CHILD_TAGS}
+    for position, tag in enumerate(CHILD_TAGS):
+        list_name = ELEMENT_LISTS[tag]
+        old_items, new_items = getattr(old, list_name), getattr(new, list_name)
+        if old_items == new_items:
+            continue
+        tag_spans = spans[tag]
+        if len(tag_spans) != len(old_items):
+            return None
+        
+        matcher = SequenceMatcher(None, [item.values() for item in old_items],
+                                  [item.values() for item in new_items], autojunk=False)
+        for operation, i1, i2, j1, j2 in matcher.get_opcodes():
+            if operation == "equal":
+                continue
+            if operation == "replace" and i2 - i1 == j2 - j1:
+                # Même nombre d'éléments : modification attribut par attribut
+                for old_item, new_item, span in zip(old_items[i1:i2], new_items[j1:j2], tag_spans[i1:i2]):
+                    if getattr(old_item, "exit_code", "") != getattr(new_item, "exit_code", ""):
+                        edits.append((span.start, span.end, serialize_child(tag, new_item, quote, cmd_quote)))
+                        continue
+                    edits += attribute_edits(text, span, {
+                        name: getattr(new_item, attr) if required or getattr(new_item, attr) else ""
+                        for name, attr, required in CHILD_ATTRIBUTES[tag]
+                        if getattr(old_item, attr) != getattr(new_item, attr)
+                    }, quote, cmd_quote)
+                continue
+            
+            serialized = [serialize_child(tag, item, quote, cmd_quote) for item in new_items[j1:j2]]
+            if i1 < i2:
+                # Éléments supprimés (et éventuellement remplacés)
+                start, end = tag_spans[i1].start, tag_spans[i2 - 1].end
+                if serialized:
+                    indent = _indentation(text, start)
+                    edits.append((start, end, ("\n" + indent).join(serialized)))
+                else:
+                    start, end = _line_bounds(text, start, end)
+                    if i1 == 0 and i2 == len(tag_spans) and start > 0:
+                        # Le groupe disparaît : retirer aussi la ligne vide qui le séparait du précédent
+                        previous_line = text.rfind("\n", 0, start - 1) + 1
+                        if not text[previous_line:start].strip():
+                            start = previous_line
+                    edits.append((start, end, ""))
+            elif i1 > 0:
+                # Insertion après l'élément précédent de la même liste
+                anchor = tag_spans[i1 - 1].end
+                indent = _indentation(text, tag_spans[i1 - 1].start)
+                edits.append((anchor, anchor, "".join("\n" + indent + item for item in serialized)))
+            elif tag_spans:
+                # Insertion avant le premier élément de la liste
+                anchor = tag_spans[0].start
+                indent = _indentation(text, anchor)
+                edits.append((anchor, anchor, "".join(item + "\n" + indent for item in serialized)))
+            else:
+                # Première entrée de la liste : après le groupe précédent, séparée par une ligne vide
+                previous = [child for tag_before in CHILD_TAGS[:position] for child in spans[tag_before]]
+                if previous:
+                    anchor = previous[-1].end
+                    indent = _indentation(text, previous[-1].start)
+                elif element.end > element.start_tag_end:
+                    anchor = element.start_tag_end
+                    indent = "  "
+                else:
+                    return None
+                edits.append((anchor, anchor, "\n\n" + indent + ("\n" + indent).join(serialized)))
+    
+    return edits
+
+
+_VARIABLE_REFERENCE_RE = re.compile(r"%([^%\s]+)%")
+
+
+class VariableResolver:
+    """Résolution des références %NOM% d'un paquet, avec une table des valeurs résolues
+
+    Comme l'ancienne substitution, la première définition d'un nom l'emporte, quelle que soit
+    son architecture (les commandes n'en ont pas), et les variables système sont aussi
+    remplacées dans les valeurs des variables du paquet ; les références entre variables du
+    paquet sont résolues quel que soit leur ordre. L'objet est jetable : l'éditeur en crée un
+    nouveau quand l'onglet Variables change.
+    """
+    def __init__(self, variables, system_variables=SYSTEM_VARIABLES):
+        self.variables = list(variables)
+        self.system_variables = system_variables
+        self._table = None
+    
+    def table(self):
+        """Valeurs entièrement résolues, par nom, calculées au premier appel"""
+        if self._table is None:
+            raw = {}
+            for var in self.variables:
+                raw.setdefault(var.name, var.value)
+            self._table = self._resolve_table(raw)
+        return self._table
+    
+    def _resolve_table(self, raw):
+        resolved = {}
+        resolving = set()
+        
+        def value_of(name):
+            if name in resolved:
+                return resolved[name]
+            if name not in raw:
+                return self.system_variables.get(name)
+            if name in resolving:
+                # Référence circulaire : laissée telle quelle
+                return None
+            resolving.add(name)
+            resolved[name] = expand(raw[name])
+            resolving.discard(name)
+            return resolved[name]
+        
+        def expand(text):
+            def replacement(match):
+                value = value_of(match.group(1))
+                return match.group(0) if value is None else value
+            return _VARIABLE_REFERENCE_RE.sub(replacement, text)
+        
+        for name in raw:
+            value_of(name)
+        return {**self.system_variables, **resolved}
+    
+    def resolve(self, text):
+        """Remplace en un seul passage toutes les références connues de `text`"""
+        table = self.table()
+        return _VARIABLE_REFERENCE_RE.sub(lambda match: table.get(match.group(1), match.group(0)), text)
+    
+    def names(self):
+        """Noms proposés à la complétion : variables du paquet puis variables système"""
+        return list(dict.fromkeys([var.name for var in self.variables]
+                                  + list(self.system_variables) + list(KNOWN_SYSTEM_VARIABLES)))
+
+
+def content_digest(data):
+    import hashlib
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+# os.umask ne se lit qu'en le modifiant : les lectures de atomic_write_bytes se font une à une
+_UMASK_LOCK = _thread.allocate_lock()
+
+
+def new_file_mode():
+    """Permissions que donnerait open() à un nouveau fichier : 0666 moins le umask du processus
+
+    Sous Linux, le umask est lu dans /proc sans être modifié ; ailleurs, os.umask est appelé
+    deux fois sous un verrou, au moment de l'écriture et jamais à l'import.
+    """
+    if os.name == "nt":
+        return 0o666
+    try:
+        with open("/proc/self/status", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("Umask:"):
+                    return 0o666 & ~int(line.split()[1], 8)
+    except (OSError, ValueError):
+        pass
+    with _UMASK_LOCK:
+        umask = os.umask(0o022)
+        os.umask(umask)
+    return 0o666 & ~umask
+
+
+def atomic_write_bytes(file_path, data):
+    """Écrit `data` dans un fichier temporaire du même dossier puis le renomme sur `file_path`
+
+    Le fichier garde ses permissions ; un nouveau fichier reçoit celles qu'aurait données
+    open() (0666 moins le umask) et non le 0600 de mkstemp. Sous POSIX, le dossier est
+    synchronisé après le renommage pour que celui-ci survive à un arrêt brutal.
+    """
+    import tempfile
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".wpkg-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(file_path):
+            os.chmod(temp_path, os.stat(file_path).st_mode & 0o7777)
+        else:
+            os.chmod(temp_path, new_file_mode())
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    if os.name == "posix":
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError:
+            # Certains systèmes de fichiers (partages réseau) ne synchronisent pas les dossiers
+            pass
+
+
+def user_cache_folder(*names):
+    """Dossier (ou fichier) `names` dans le cache de l'utilisateur : %LOCALAPPDATA% sous Windows,
+    $XDG_CACHE_HOME ou ~/.cache ailleurs
+
+    Caches et journaux n'ont pas leur place dans le dossier courant, qui peut être partagé ou
+    non inscriptible. Le dossier n'est pas créé ici.
+    """
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Local")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, USER_CACHE_NAME, *names)
+
+
+_ENCODING_DECLARATION_RE = re.compile(r'<\?xml[^>]*?\sencoding\s*=\s*["\']([A-Za-z][\w.:-]*)["\']')
+
+
+def declared_encoding(document):
+    """Encodage annoncé par la déclaration XML d'un document (octets ou texte), UTF-8 à défaut"""
+    head = document[:256]
+    if isinstance(head, str):
+        head = head.lstrip('\ufeff')
+    else:
+        head = bytes(head).decode('latin-1')
+        if head.startswith('\xef\xbb\xbf'):
+            return 'utf-8'
+    match = _ENCODING_DECLARATION_RE.match(head)
+    if match is None:
+        return 'utf-8'
+    try:
+        return codecs.lookup(match.group(1)).name
+    except LookupError:
+        return 'utf-8'
+
+
+def file_encoding(data):
+    """Encodage réel du contenu brut d'un fichier de paquet
+
+    C'est celui de la déclaration XML, sauf pour un fichier déclaré dans un encodage
+    mono-octet (iso-8859-1...) mais écrit en UTF-8, comme les enregistrait l'éditeur
+    jusqu'ici : un texte Latin-1 accentué n'est pratiquement jamais de l'UTF-8 valide.
+    """
+    encoding = declared_encoding(data)
+    if encoding in SINGLE_BYTE_ENCODINGS and not data.isascii():
+        try:
+            data.decode('utf-8')
+            return 'utf-8'
+        except UnicodeDecodeError:
+            pass
+    return encoding
+
+
+def decode_package(data, encoding='utf-8'):
+    """Texte d'un fichier de paquet, sans BOM et fins de ligne normalisées comme par open() en mode texte"""
+    text = data.decode(encoding)
+    if text.startswith('\ufeff'):
+        text = text[1:]
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def read_package_document(data):
+    """Texte, encodage et analyse du contenu brut d'un fichier de paquet"""
+    encoding = file_encoding(data)
+    content = decode_package(data, encoding)
+    if encoding == declared_encoding(data):
+        result = parse_wpkg_bytes(data)
+    else:
+        # Contenu et déclaration en désaccord : l'analyse part du texte correctement décodé
+        result = parse_wpkg(content)
+    return content, encoding, result
+
+
+def encode_package(content):
+    """Octets à enregistrer pour le texte d'un paquet, dans l'encodage de sa déclaration XML
+
+    Les caractères absents de cet encodage sont écrits en références de caractère (&#8364;).
+    """
+    return content.replace('\n', os.linesep).encode(declared_encoding(content), errors='xmlcharrefreplace')
+
+
+def write_package_file(file_path, content, expected_digest=None):
+    """Enregistre le texte d'un paquet de façon atomique (exécuté sur le thread d'enregistrement)
+
+    Avec `expected_digest`, le fichier n'est remplacé que si son contenu est toujours celui
+    de cette empreinte. Retourne les octets écrits, ou None si le fichier a changé depuis.
+    """
+    if expected_digest is not None and os.path.exists(file_path):
+        with open(file_path, 'rb') as file:
+            if content_digest(file.read()) != expected_digest:
+                return None
+    data = encode_package(content)
+    atomic_write_bytes(file_path, data)
+    return data
+
+
+def lint_packages(result):
+    """Problèmes de contenu des paquets d'une analyse réussie : [{"line", "severity", "message"}]"""
+    issues = []
+    
+    def issue(line, severity, message):
+        issues.append({"line": line, "severity": severity, "message": message})
+    
+    seen = {}
+    for package, lines in zip(result.packages, result.element_lines):
+        line = lines[("package", 0)]
+        if not package.id:
+            issue(line, "error", "paquet sans id")
+        elif package.id in seen:
+            issue(line, "error", f"id {package.id} déjà utilisé ligne {seen[package.id]}")
+        else:
+            seen[package.id] = line
+        for key in ("name", "revision"):
+            if not getattr(package, key):
+                issue(line, "warning", f"paquet {package.id} sans attribut {key}")
+        if package.reboot and package.reboot not in REBOOT_VALUES:
+            issue(line, "warning", f"reboot=\"{package.reboot}\" : attendu {', '.join(REBOOT_VALUES)}")
+        if package.priority and not package.priority.isdigit():
+            issue(line, "warning", f"priority=\"{package.priority}\" n'est pas un entier")
+        
+        for rank, variable in enumerate(package.variables):
+            if not variable.name:
+                issue(lines.get(("variables", rank), line), "warning", "variable sans nom")
+        for list_name in ("installs", "upgrades", "removes"):
+            for rank, command in enumerate(getattr(package, list_name)):
+                command_line = lines.get((list_name, rank), line)
+                if not command.cmd and not command.include:
+                    issue(command_line, "warning", "commande sans cmd ni include")
+                if command.include and command.include not in COMMAND_INCLUDES:
+                    issue(command_line, "warning", f"include=\"{command.include}\" inconnu")
+                if command.timeout and not command.timeout.isdigit():
+                    issue(command_line, "warning", f"timeout=\"{command.timeout}\" n'est pas un entier")
+    return issues
+
+
+def check_package_file(file_path, command, write=True, quote='"', cmd_quote="'"):
+    """Valide (validate), contrôle (lint) ou formate (format) un fichier de paquet, dans un
+    processus du pool
+
+    Retourne (signature (date, taille) et empreinte du fichier après traitement, résultat).
+    Le résultat a un statut : ok, error (XML invalide ou problème bloquant), warning,
+    changed (format sans écriture), formatted, skipped (format qui perdrait du contenu).
+    """
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    content, encoding, result = read_package_document(data)
+    record = {"file": file_path, "command": command, "status": "ok", "issues": []}
+    
+    if result.errors:
+        record["status"] = "error"
+        record["issues"] = [{"line": line, "column": column, "severity": "error", "message": message}
+                            for line, column, message in result.errors]
+    elif command == "lint":
+        record["issues"] = lint_packages(result)
+        severities = {issue["severity"] for issue in record["issues"]}
+        record["status"] = "error" if "error" in severities else "warning" if severities else "ok"
+    elif command == "format" and result.packages:
+        formatted = serialize_packages(result.packages, result.xml_declaration,
+                                       comment_placement(result.comments, result.element_lines),
+                                       quote, cmd_quote)
+        if not equivalent_xml(formatted, content):
+            record["status"] = "skipped"
+            record["issues"] = [{"line": 1, "severity": "warning",
+                                 "message": "contenu hors du modèle (le formatage le perdrait)"}]
+        elif formatted != content:
+            if write:
+                data = encode_package(formatted)
+                atomic_write_bytes(file_path, data)
+            record["status"] = "formatted" if write else "changed"
+    
+    stat = os.stat(file_path)
+    return (stat.st_mtime_ns, stat.st_size), content_digest(data), record
+
+
+def check_package_files(file_paths, command, write=True, quote='"', cmd_quote="'"):
+    """Traite un lot de fichiers ; une erreur de lecture n'interrompt pas le lot"""
+    results = []
+    for file_path in file_paths:
+        try:
+            results.append(check_package_file(file_path, command, write, quote, cmd_quote))
+        except (OSError, ValueError) as e:
+            results.append((None, None, {"file": file_path, "command": command, "status": "error",
+                                         "issues": [{"line": None, "severity": "error", "message": str(e)}]}))
+    return results
+
+
+def package_files(paths):
+    """Fichiers de paquets désignés par `paths` (fichiers, ou dossiers parcourus récursivement)"""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield os.path.abspath(path)
+            continue
+        for directory, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith(PACKAGE_EXTENSIONS):
+                    yield os.path.abspath(os.path.join(directory, filename))
+
+
+def run_cli(argv):
+    """Mode sans interface : validate, lint ou format sur des fichiers et dossiers de paquets
+
+    Écrit un résultat JSON par fichier sur la sortie standard, puis un résumé. Les fichiers
+    inchangés depuis l'exécution précédente (même date et taille, ou même contenu) reprennent
+    leur résultat du cache. Code de sortie : 0 si tout est correct, 1 si un fichier est en
+    erreur (ou, avec --check, serait reformaté), 2 pour une erreur d'utilisation.
+    """
+    import argparse
+    import json
+    from concurrent.futures import ProcessPoolExecutor
+    
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]),
+                                     description="Contrôle des paquets WPKG sans interface graphique")
+    parser.add_argument("command", choices=("validate", "lint", "format"))
+    parser.add_argument("paths", nargs="+", help="fichiers ou dossiers de paquets")
+    parser.add_argument("--check", action="store_true", help="format : signaler sans réécrire")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="processus de travail")
+    parser.add_argument("--cache", default=user_cache_folder(CLI_CACHE_FILE), help="fichier du cache des résultats")
+    parser.add_argument("--no-cache", action="store_true", help="tout retraiter, sans lire ni écrire le cache")
+    parser.add_argument("--quote", default='"', choices=('"', "'"), help="guillemets des attributs (format)")
+    parser.add_argument("--cmd-quote", default="'", choices=('"', "'"), help="guillemets des commandes (format)")
+    args = parser.parse_args(argv)
+    
+    write = args.command == "format" and not args.check
+    key = json.dumps([CLI_CACHE_VERSION, args.command, write, args.quote, args.cmd_quote])
+    cache = {}
+    if not args.no_cache:
+        try:
+            with open(args.cache, encoding="utf-8") as file:
+                cache = json.load(file)
+        except (OSError, ValueError):
+            cache = {}
+    
+    def emit(record):
+        sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+    
+    summary = Counter()
+    
+    def store(file_path, signature, digest, record, cached=False):
+        summary["files"] += 1
+        summary[record["status"]] += 1
+        summary["cached"] += cached
+        emit({**record, "cached": cached})
+        if signature is not None:
+            entry = cache.get(file_path)
+            results = entry["results"] if entry and entry["digest"] == digest else {}
+            # Fichier reformaté : la prochaine fois, il sera déjà au format
+            results[key] = {**record, "status": "ok"} if record["status"] == "formatted" else record
+            cache[file_path] = {"signature": list(signature), "digest": digest, "results": results}
+    
+    # Fichiers dont la date et la taille n'ont pas changé : résultat repris sans lecture ;
+    # sinon, le fichier est relu et son résultat repris si son contenu est le même
+    todo = []
+    for file_path in package_files(args.paths):
+        entry = cache.get(file_path)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            stat = None
+        if entry and stat and key in entry["results"]:
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if entry["signature"] == list(signature):
+                store(file_path, signature, entry["digest"], entry["results"][key], cached=True)
+                continue
+            try:
+                with open(file_path, 'rb') as file:
+                    digest = content_digest(file.read())
+            except OSError:
+                digest = None
+            if digest == entry["digest"]:
+                store(file_path, signature, digest, entry["results"][key], cached=True)
+                continue
+        todo.append(file_path)
+    
+    batches = [todo[i:i + CLI_BATCH] for i in range(0, len(todo), CLI_BATCH)]
+    options = (args.command, write, args.quote, args.cmd_quote)
+    if args.jobs > 1 and len(batches) > 1:
+        pool = ProcessPoolExecutor(max_workers=args.jobs)
+        results = pool.map(check_package_files, batches, *([option] * len(batches) for option in options))
+    else:
+        pool = None
+        results = (check_package_files(batch, *options) for batch in batches)
+    try:
+        for batch in results:
+            for signature, digest, record in batch:
+                store(record["file"], signature, digest, record)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    
+    if not args.no_cache:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(args.cache)), exist_ok=True)
+            atomic_write_bytes(args.cache, json.dumps(cache, ensure_ascii=False).encode("utf-8"))
+        except OSError as e:
+            sys.stderr.write(f"Cache non enregistré: {e}\n")
+    emit({"summary": dict(summary)})
+    
+    failed = summary["error"] or (args.check and summary["changed"])
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_cli(sys.argv[1:]))